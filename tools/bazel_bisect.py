@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+__doc__ = """
+Finds the first Bazel release that breaks a build.
+
+The releases between a known good and a known bad version are taken from
+the same release index bazel_version.py uses. Several candidates are built
+at once, each with its own output base, so every round narrows the range
+k-fold instead of halving it. Results are cached per (version, command) in
+the bazelisk directory, so an interrupted bisection resumes where it
+stopped.
+
+The command runs with USE_BAZEL_VERSION set to the candidate version.
+"{version}" and "{output_base}" in its arguments are replaced as well, and
+the output base is also exported as BAZEL_BISECT_OUTPUT_BASE. Concurrent
+builds of one workspace would share Bazel's default output base, so with
+--jobs above 1 the command has to pass "{output_base}". As with git
+bisect, exit code 0 means good, 125 means the version cannot be tested and
+anything else means bad.
+
+Every output base starts its own Bazel server, which would otherwise stay
+around idle, holding on to its heap. --shutdown-command is run after each
+test, with the same replacements, to stop it; passing --max_idle_secs to
+Bazel in the command works as well.
+
+Usage:
+  bazel_bisect.py --good 7.4.0 --bad 8.x [--jobs 3] [--include-prereleases]
+      [--shutdown-command "bazelisk --output_base={output_base} shutdown"]
+      -- bazelisk --output_base={output_base} build //android/...
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+
+try:
+  from tools import bazel_version
+except ImportError:
+  import bazel_version
+
+GOOD = "good"
+BAD = "bad"
+SKIP = "skip"
+
+SKIP_EXIT_CODE = 125
+
+
+def get_candidates(releases, good, bad, include_prereleases=False):
+  """Returns the versions from `good` to `bad` inclusive, oldest first."""
+  all_versions, _, stable_versions = bazel_version.parse_versions(releases)
+  versions = all_versions if include_prereleases else stable_versions
+
+  good_version = bazel_version.Version(good)
+  bad_version = bazel_version.Version(bad)
+  if not good_version < bad_version:
+    raise ValueError(f"Good version {good} is not older than bad version {bad}")
+
+  candidates = [
+      tag for version, tag in reversed(versions)
+      if good_version < version and version < bad_version
+  ]
+  return [good] + candidates + [bad]
+
+
+def pick_probes(low, high, jobs):
+  """Returns up to `jobs` indices strictly between `low` and `high`.
+
+  The indices split the range into roughly equal parts.
+  """
+  count = min(jobs, high - low - 1)
+  return sorted({
+      low + max(1, min(high - low - 1, round((high - low) * i / (count + 1))))
+      for i in range(1, count + 1)
+  })
+
+
+class ResultCache:
+  """Persists the outcome of running a command against a version."""
+
+  def __init__(self, path, command):
+    self.path = path
+    self.command = shlex.join(command)
+    self.results = {}
+    if path is None:
+      return
+    try:
+      with open(path, "rb") as f:
+        self.results = json.loads(f.read().decode("utf-8"))
+    except (OSError, ValueError):
+      pass
+
+  def key(self, version):
+    return f"{version}\0{self.command}"
+
+  def get(self, version):
+    return self.results.get(self.key(version))
+
+  def put(self, version, result):
+    self.results[self.key(version)] = result
+    if self.path:
+      bazel_version.write_file_atomic(self.path, json.dumps(self.results))
+
+
+def run_command(command, version, output_root, shutdown_command=None):
+  """Runs `command` against `version` and returns GOOD, BAD or SKIP.
+
+  `shutdown_command`, if given, is run afterwards in the same environment,
+  whatever the outcome. Its exit code is ignored.
+  """
+  output_base = os.path.join(output_root, version)
+  os.makedirs(output_base, exist_ok=True)
+
+  def expand(args):
+    return [
+        arg.replace("{version}", version).replace("{output_base}", output_base)
+        for arg in args
+    ]
+
+  env = dict(os.environ)
+  env["USE_BAZEL_VERSION"] = version
+  env["BAZEL_BISECT_OUTPUT_BASE"] = output_base
+
+  with open(os.path.join(output_base, "bisect.log"), "wb") as log:
+    try:
+      returncode = subprocess.run(
+          expand(command), env=env, stdout=log,
+          stderr=subprocess.STDOUT).returncode
+    finally:
+      if shutdown_command:
+        subprocess.run(
+            expand(shutdown_command),
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT)
+  if returncode == 0:
+    return GOOD
+  if returncode == SKIP_EXIT_CODE:
+    return SKIP
+  return BAD
+
+
+def bisect(candidates,
+           command,
+           cache,
+           output_root,
+           jobs,
+           log=None,
+           shutdown_command=None):
+  """Finds the first bad version among `candidates`.
+
+  Args:
+    candidates: Versions oldest first; the first is known good and the last
+      known bad
+    command: The command to run, see the module documentation
+    cache: A ResultCache
+    output_root: Directory for the per-version output bases
+    jobs: How many versions to test concurrently
+    log: Called with progress messages
+    shutdown_command: Run after every test, see run_command
+
+  Returns:
+    A (last good, first bad) tuple of versions
+  """
+  candidates = list(candidates)
+  low, high = 0, len(candidates) - 1
+
+  with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+    while high - low > 1:
+      probes = pick_probes(low, high, jobs)
+      results = {}
+      futures = {}
+      for index in probes:
+        version = candidates[index]
+        result = cache.get(version)
+        if result is not None:
+          results[index] = result
+        else:
+          futures[executor.submit(run_command, command, version, output_root,
+                                  shutdown_command)] = index
+
+      for future in concurrent.futures.as_completed(futures):
+        index = futures[future]
+        results[index] = future.result()
+        cache.put(candidates[index], results[index])
+
+      for index in probes:
+        if log:
+          log(f"{candidates[index]}: {results[index]}")
+
+      # The first bad probe bounds the range from above, the last good probe
+      # before it from below.
+      for index in probes:
+        if results[index] == BAD:
+          high = index
+          break
+      for index in probes:
+        if index < high and results[index] == GOOD:
+          low = index
+
+      # Untestable versions are dropped from the range.
+      skipped = [
+          index for index in probes
+          if low < index < high and results[index] == SKIP
+      ]
+      for index in reversed(skipped):
+        del candidates[index]
+        high -= 1
+
+  return candidates[low], candidates[high]
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(
+      description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--good", required=True, help="A known good version.")
+  parser.add_argument("--bad", required=True, help="A known bad version.")
+  parser.add_argument(
+      "--jobs", type=int, default=3, help="Versions to test concurrently.")
+  parser.add_argument("--include-prereleases", action="store_true")
+  parser.add_argument(
+      "--output-root",
+      default=os.path.join(tempfile.gettempdir(), "bazel_bisect"),
+      help="Directory for the per-version output bases.")
+  parser.add_argument(
+      "--no-cache",
+      action="store_true",
+      help="Ignore and do not record earlier results.")
+  parser.add_argument(
+      "--shutdown-command",
+      type=shlex.split,
+      help="Run after every test to stop its Bazel server, e.g. "
+      "\"bazelisk --output_base={output_base} shutdown\".")
+  parser.add_argument("command", nargs=argparse.REMAINDER)
+  args = parser.parse_args(argv)
+
+  command = args.command
+  if command and command[0] == "--":
+    command = command[1:]
+  if not command:
+    parser.error("a command is required")
+  if args.jobs < 1:
+    parser.error("--jobs must be at least 1")
+  if args.jobs > 1 and not any("{output_base}" in arg for arg in command):
+    parser.error("concurrent builds need --output_base={output_base} in the "
+                 "command; pass it or use --jobs 1")
+  # The command may change directories, so the output bases must not depend
+  # on the current one.
+  output_root = os.path.abspath(args.output_root)
+
+  try:
+    bazelisk_directory = bazel_version.get_bazelisk_directory()
+    os.makedirs(bazelisk_directory, exist_ok=True)
+    releases = bazel_version.get_releases_json(bazelisk_directory)
+
+    good = bazel_version.resolve_version_string(args.good, releases)
+    bad = bazel_version.resolve_version_string(args.bad, releases)
+    candidates = get_candidates(releases, good, bad, args.include_prereleases)
+    print(
+        f"Bisecting {len(candidates) - 2} versions between {good} and {bad}",
+        file=sys.stderr)
+
+    cache_path = None
+    if not args.no_cache:
+      cache_path = os.path.join(bazelisk_directory, "bisect_results.json")
+    cache = ResultCache(cache_path, command)
+
+    last_good, first_bad = bisect(
+        candidates,
+        command,
+        cache,
+        output_root,
+        args.jobs,
+        log=lambda m: print(m, file=sys.stderr),
+        shutdown_command=args.shutdown_command)
+    print(f"Last good version: {last_good}")
+    print(f"First bad version: {first_bad}")
+    return 0
+  except Exception as e:
+    print(f"Error: {e}", file=sys.stderr)
+    return 1
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
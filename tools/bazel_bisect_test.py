@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Unit tests for bazel_bisect.py
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from io import StringIO
+from unittest import mock
+
+# Add the parent directory to the path so we can import bazel_bisect
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import bazel_bisect
+
+# A stub build: fails from the version given as first argument on, skips the
+# versions after the second argument, and records every run it makes.
+STUB_BUILD = """
+import os, sys
+version = os.environ["USE_BAZEL_VERSION"]
+assert sys.argv[1] == version
+assert os.path.isdir(sys.argv[2])
+with open(sys.argv[3], "a") as f:
+  f.write(version + "\\n")
+if version in sys.argv[5].split(","):
+  sys.exit(125)
+sys.exit(0 if tuple(map(int, version.split("."))) <
+         tuple(map(int, sys.argv[4].split("."))) else 1)
+"""
+
+
+class TestBazelBisect(unittest.TestCase):
+  """Test cases for bazel_bisect.py"""
+
+  def setUp(self):
+    self.releases = [{
+        "tag_name": f"7.{minor}.0",
+        "prerelease": False
+    } for minor in range(10)] + [{
+        "tag_name": "7.5.0rc1",
+        "prerelease": True
+    }]
+    self.tmp = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.tmp)
+    self.runs_file = os.path.join(self.tmp, "runs")
+
+  def command(self, first_bad, skipped=()):
+    return [
+        sys.executable, "-c", STUB_BUILD, "{version}", "{output_base}",
+        self.runs_file, first_bad, ",".join(skipped)
+    ]
+
+  def runs(self):
+    try:
+      with open(self.runs_file) as f:
+        return f.read().split()
+    except FileNotFoundError:
+      return []
+
+  def bisect(self, command, jobs=3, cache=None):
+    candidates = bazel_bisect.get_candidates(self.releases, "7.0.0", "7.9.0")
+    if cache is None:
+      cache = bazel_bisect.ResultCache(None, command)
+    return bazel_bisect.bisect(candidates, command, cache,
+                               os.path.join(self.tmp, "output"), jobs)
+
+  def test_get_candidates(self):
+    self.assertEqual(
+        bazel_bisect.get_candidates(self.releases, "7.3.0", "7.6.0"),
+        ["7.3.0", "7.4.0", "7.5.0", "7.6.0"])
+    self.assertEqual(
+        bazel_bisect.get_candidates(
+            self.releases, "7.4.0", "7.6.0", include_prereleases=True),
+        ["7.4.0", "7.5.0rc1", "7.5.0", "7.6.0"])
+    with self.assertRaises(ValueError):
+      bazel_bisect.get_candidates(self.releases, "7.6.0", "7.3.0")
+
+  def test_pick_probes(self):
+    self.assertEqual(bazel_bisect.pick_probes(0, 9, 2), [3, 6])
+    self.assertEqual(bazel_bisect.pick_probes(0, 9, 3), [2, 4, 7])
+    self.assertEqual(bazel_bisect.pick_probes(3, 5, 3), [4])
+    self.assertEqual(bazel_bisect.pick_probes(3, 4, 3), [])
+
+  def test_bisect_finds_first_bad_version(self):
+    for first_bad in ["7.1.0", "7.4.0", "7.8.0", "7.9.0"]:
+      with self.subTest(first_bad=first_bad):
+        last_good, bad = self.bisect(self.command(first_bad))
+        self.assertEqual(bad, first_bad)
+        self.assertEqual(last_good, f"7.{int(first_bad[2]) - 1}.0")
+
+  def test_bisect_is_k_ary(self):
+    self.bisect(self.command("7.4.0"), jobs=3)
+    # Three probes per round narrow 8 candidates down in two rounds.
+    self.assertLessEqual(len(self.runs()), 6)
+    self.assertEqual(len(self.runs()), len(set(self.runs())))
+
+  def test_bisect_skips_untestable_versions(self):
+    last_good, first_bad = self.bisect(
+        self.command("7.5.0", skipped=["7.3.0", "7.4.0"]))
+    self.assertEqual(first_bad, "7.5.0")
+    self.assertEqual(last_good, "7.2.0")
+
+  def test_bisect_resumes_from_cache(self):
+    cache_path = os.path.join(self.tmp, "results.json")
+    command = self.command("7.6.0")
+    self.bisect(command, cache=bazel_bisect.ResultCache(cache_path, command))
+    first_runs = self.runs()
+
+    result = self.bisect(
+        command, cache=bazel_bisect.ResultCache(cache_path, command))
+    self.assertEqual(result, ("7.5.0", "7.6.0"))
+    self.assertEqual(self.runs(), first_runs)
+
+    # A different command does not reuse the results.
+    other_command = command + ["--other"]
+    self.bisect(
+        other_command,
+        cache=bazel_bisect.ResultCache(cache_path, other_command))
+    self.assertGreater(len(self.runs()), len(first_runs))
+
+  def test_shutdown_command(self):
+    shutdowns = os.path.join(self.tmp, "shutdowns")
+    shutdown_command = [
+        sys.executable, "-c",
+        "import os, sys; open(sys.argv[2], 'a').write(sys.argv[1] + ' ' + "
+        "os.environ['USE_BAZEL_VERSION'] + chr(10))", "{output_base}", shutdowns
+    ]
+    candidates = bazel_bisect.get_candidates(self.releases, "7.0.0", "7.9.0")
+    command = self.command("7.6.0", skipped=["7.3.0"])
+    output_root = os.path.join(self.tmp, "output")
+    bazel_bisect.bisect(
+        candidates,
+        command,
+        bazel_bisect.ResultCache(None, command),
+        output_root,
+        3,
+        shutdown_command=shutdown_command)
+
+    with open(shutdowns) as f:
+      stopped = [line.split() for line in f]
+    # Every tested version is stopped, bad and untestable ones included.
+    self.assertEqual(
+        sorted(version for _, version in stopped), sorted(self.runs()))
+    for output_base, version in stopped:
+      self.assertEqual(output_base, os.path.join(output_root, version))
+
+  def main(self, args):
+    with mock.patch.object(bazel_bisect.bazel_version,
+                           "get_bazelisk_directory",
+                           return_value=os.path.join(self.tmp, "bazelisk")), \
+        mock.patch.object(bazel_bisect.bazel_version,
+                          "get_releases_json",
+                          return_value=self.releases), \
+        mock.patch("sys.stdout", new_callable=StringIO) as stdout, \
+        mock.patch("sys.stderr", new_callable=StringIO):
+      return bazel_bisect.main(args), stdout.getvalue()
+
+  def test_main_requires_output_base_for_jobs(self):
+    command = [sys.executable, "-c", "pass", "{version}"]
+    with mock.patch("sys.stderr", new_callable=StringIO) as stderr:
+      with self.assertRaises(SystemExit):
+        bazel_bisect.main(["--good", "7.0.0", "--bad", "7.9.0", "--"] + command)
+    self.assertIn("{output_base}", stderr.getvalue())
+
+    # A single job may use the default output base.
+    returncode, stdout = self.main([
+        "--good", "7.0.0", "--bad", "7.9.0", "--jobs", "1", "--no-cache", "--"
+    ] + command)
+    self.assertEqual(returncode, 0)
+    self.assertIn("First bad version: 7.9.0", stdout)
+
+  def test_main_makes_output_root_absolute(self):
+    cwd = os.getcwd()
+    os.chdir(self.tmp)
+    self.addCleanup(os.chdir, cwd)
+    with mock.patch.object(
+        bazel_bisect, "run_command",
+        wraps=bazel_bisect.run_command) as run_command:
+      returncode, stdout = self.main([
+          "--good", "7.0.0", "--bad", "7.9.0", "--output-root", "output",
+          "--no-cache", "--"
+      ] + self.command("7.6.0"))
+    self.assertEqual(returncode, 0)
+    self.assertIn("First bad version: 7.6.0", stdout)
+    output_roots = {call.args[2] for call in run_command.call_args_list}
+    self.assertEqual(output_roots,
+                     {os.path.join(os.path.realpath(self.tmp), "output")})
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+__doc__ = """
+Compares build performance of the sample apps across Bazel versions.
+
+Every version spec is resolved with bazel_version.py ("default" stands for
+.bazelversion) and specs that resolve to the same version are built once.
+Each version builds in its own output base with --profile enabled, and the
+wall time, critical path and number of executed actions are collected from
+the run and its profile. The first spec is the baseline; the others are
+compared against it and the exit code is 1 if any of them regressed.
+
+Builds of different versions can run in parallel with --jobs, as their
+output bases are separate, but they then compete for the machine and the
+timings get noisier.
+
+Usage:
+  bazel_perf_compare.py [--bazel bazelisk] [--jobs 1] [--runs 1]
+      [--targets //android/...] [--output results.json]
+      [default 7.x latest last_rc rolling] [-- extra build flags]
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+  from tools import bazel_profile
+  from tools import bazel_version
+except ImportError:
+  import bazel_profile
+  import bazel_version
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SPECS = ["default", "7.x", "latest", "last_rc", "rolling"]
+
+METRICS = ["wall", "critical_path"]
+
+
+def read_bazelversion(root=ROOT_DIR):
+  with open(os.path.join(root, ".bazelversion"), "r") as f:
+    return f.read().strip()
+
+
+def resolve_specs(specs, resolve):
+  """Returns [(version, [specs])] in the order the versions first appear."""
+  versions = {}
+  for spec in specs:
+    version = read_bazelversion() if spec == "default" else resolve(spec)
+    versions.setdefault(version, []).append(spec)
+  return list(versions.items())
+
+
+def parse_profile(path):
+  """Returns the critical path in seconds and the action count of a profile."""
+  summary = bazel_profile.analyze_profile(path)
+  return {
+      "critical_path": summary["critical_path"],
+      "actions": summary["actions"]
+  }
+
+
+def run_bazel(bazel, version, output_base, args, log):
+  env = dict(os.environ)
+  env["USE_BAZEL_VERSION"] = version
+  start = time.perf_counter()
+  returncode = subprocess.run(
+      [bazel, f"--output_base={output_base}"] + args,
+      cwd=ROOT_DIR,
+      env=env,
+      stdout=log,
+      stderr=subprocess.STDOUT).returncode
+  elapsed = time.perf_counter() - start
+  if returncode != 0:
+    raise RuntimeError(f"bazel {args[0]} failed with exit code {returncode}, "
+                       f"see {log.name}")
+  return elapsed
+
+
+def measure_version(version, bazel, build_args, output_root, runs):
+  """Builds with `version` `runs` times and returns its measurements."""
+  directory = os.path.join(output_root, version)
+  output_base = os.path.join(directory, "output_base")
+  os.makedirs(directory, exist_ok=True)
+  measurements = []
+  with open(os.path.join(directory, "build.log"), "w") as log:
+    try:
+      for run in range(runs):
+        if run > 0:
+          # Keep the fetched external repositories, rebuild everything else.
+          run_bazel(bazel, version, output_base, ["clean"], log)
+        profile = os.path.join(directory, f"profile-{run}.json.gz")
+        wall = run_bazel(bazel, version, output_base,
+                         ["build", f"--profile={profile}"] + build_args, log)
+        measurement = parse_profile(profile)
+        measurement["wall"] = wall
+        measurements.append(measurement)
+    finally:
+      # Do not leave one server per version behind.
+      subprocess.run([bazel, f"--output_base={output_base}", "shutdown"],
+                     cwd=ROOT_DIR,
+                     env=dict(os.environ, USE_BAZEL_VERSION=version),
+                     stdout=log,
+                     stderr=subprocess.STDOUT)
+
+  result = {
+      metric: statistics.median(m[metric] for m in measurements)
+      for metric in METRICS
+  }
+  result["actions"] = measurements[-1]["actions"]
+  result["runs"] = measurements
+  return result
+
+
+def compare(results, threshold, min_delta):
+  """Prints a comparison table and returns the list of regressions.
+
+  The first entry of `results` is the baseline.
+  """
+  regressions = []
+  base = results[0]
+  print(f"{'version':<24} {'wall':>10} {'change':>8} {'critical':>10} "
+        f"{'change':>8} {'actions':>8}")
+  for result in results:
+    label = f"{result['version']} ({'/'.join(result['specs'])})"
+    if "error" in result:
+      print(f"{label:<24} error: {result['error']}")
+      continue
+
+    columns = []
+    flagged = []
+    for metric in METRICS:
+      value = result[metric]
+      if result is base or "error" in base:
+        columns.append(f"{value:>9.2f}s {'':>8}")
+        continue
+      change = (value - base[metric]) / base[metric] if base[metric] else 0.0
+      columns.append(f"{value:>9.2f}s {change:>+7.1%}")
+      if change > threshold and value - base[metric] > min_delta:
+        flagged.append(metric)
+    marker = f"  REGRESSION ({', '.join(flagged)})" if flagged else ""
+    print(f"{label:<24} {' '.join(columns)} {result['actions']:>8}{marker}")
+    if flagged:
+      regressions.append((result["version"], flagged))
+  return regressions
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(
+      description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument(
+      "specs",
+      nargs="*",
+      default=DEFAULT_SPECS,
+      help="Version specs; the first is the baseline.")
+  parser.add_argument(
+      "--bazel",
+      default=os.environ.get("BAZEL", "bazelisk"),
+      help="The bazel launcher, must honor USE_BAZEL_VERSION.")
+  parser.add_argument(
+      "--targets",
+      default="//android/...",
+      help="Comma separated targets to build.")
+  parser.add_argument(
+      "--jobs", type=int, default=1, help="Versions to build concurrently.")
+  parser.add_argument(
+      "--runs",
+      type=int,
+      default=1,
+      help="Builds per version; the median is reported.")
+  parser.add_argument(
+      "--output-root",
+      help="Directory for output bases, logs and profiles "
+      "(default: a temporary directory).")
+  parser.add_argument("--output", help="Write JSON results here.")
+  parser.add_argument(
+      "--threshold",
+      type=float,
+      default=0.1,
+      help="Relative slowdown reported as a regression.")
+  parser.add_argument(
+      "--min-delta",
+      type=float,
+      default=1.0,
+      help="Ignore slowdowns below this many seconds.")
+  build_args = []
+  if "--" in argv:
+    index = argv.index("--")
+    argv, build_args = argv[:index], argv[index + 1:]
+  args = parser.parse_args(argv)
+  if args.jobs < 1 or args.runs < 1:
+    parser.error("--jobs and --runs must be at least 1")
+  build_args = build_args + ["--"] + [
+      target for target in args.targets.split(",") if target
+  ]
+
+  bazelisk_directory = bazel_version.get_bazelisk_directory()
+  os.makedirs(bazelisk_directory, exist_ok=True)
+  try:
+    versions = resolve_specs(
+        args.specs,
+        lambda spec: bazel_version.resolve_version(spec, bazelisk_directory))
+  except Exception as e:
+    print(f"Error: {e}", file=sys.stderr)
+    return 1
+
+  # Bazel resolves --output_base against its workspace, not our directory.
+  if args.output_root:
+    output_root = os.path.abspath(args.output_root)
+  else:
+    output_root = tempfile.mkdtemp(prefix="bazel_perf_")
+  print(f"Writing output bases and profiles to {output_root}", file=sys.stderr)
+
+  results = [{
+      "version": version,
+      "specs": specs
+  } for version, specs in versions]
+  with concurrent.futures.ThreadPoolExecutor(args.jobs) as executor:
+    futures = {
+        executor.submit(measure_version, result["version"], args.bazel,
+                        build_args, output_root, args.runs):
+            result for result in results
+    }
+    for future in concurrent.futures.as_completed(futures):
+      result = futures[future]
+      try:
+        result.update(future.result())
+      except Exception as e:
+        result["error"] = str(e)
+      print(f"Finished {result['version']}", file=sys.stderr)
+
+  regressions = compare(results, args.threshold, args.min_delta)
+
+  if args.output:
+    with open(args.output, "w") as f:
+      json.dump(
+          {
+              "config": {
+                  "bazel": args.bazel,
+                  "build_args": build_args,
+                  "runs": args.runs,
+                  "jobs": args.jobs,
+              },
+              "results": results,
+          },
+          f,
+          indent=2)
+      f.write("\n")
+
+  if regressions or any("error" in result for result in results):
+    return 1
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Unit tests for bazel_perf_compare.py
+"""
+
+import gzip
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+from io import StringIO
+from unittest import mock
+
+# Add the parent directory to the path so we can import bazel_perf_compare
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import bazel_perf_compare
+from tools import bazel_version
+
+# A stub bazel that writes a gzipped profile whose critical path (in
+# seconds) is looked up by USE_BAZEL_VERSION in STUB_CRITICAL_PATHS.
+STUB_BAZEL = """#!{python}
+import gzip, json, os, sys
+version = os.environ["USE_BAZEL_VERSION"]
+args = sys.argv[1:]
+assert args[0].startswith("--output_base=")
+with open(os.environ["STUB_LOG"], "a") as f:
+  f.write(version + " " + " ".join(args[1:]) + "\\n")
+if args[1] != "build":
+  sys.exit(0)
+if version in os.environ.get("STUB_FAIL", "").split(","):
+  sys.exit(1)
+critical_path = json.loads(os.environ["STUB_CRITICAL_PATHS"])[version]
+events = [
+    {{"cat": "critical path component", "ph": "X", "dur": critical_path * 1e6}},
+    {{"cat": "action processing", "ph": "X", "dur": 10}},
+    {{"cat": "action processing", "ph": "X", "dur": 20}},
+    {{"cat": "build phase marker", "ph": "i"}},
+]
+profile = [a for a in args if a.startswith("--profile=")][0].split("=", 1)[1]
+with gzip.open(profile, "wt") as f:
+  json.dump({{"otherData": {{}}, "traceEvents": events}}, f)
+"""
+
+
+class TestBazelPerfCompare(unittest.TestCase):
+  """Test cases for bazel_perf_compare.py"""
+
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.tmp)
+    self.bazel = os.path.join(self.tmp, "bazel")
+    with open(self.bazel, "w") as f:
+      f.write(STUB_BAZEL.format(python=sys.executable))
+    os.chmod(self.bazel, stat.S_IRWXU)
+    self.log = os.path.join(self.tmp, "log")
+    self.default = bazel_perf_compare.read_bazelversion()
+
+  def run_main(self, args, critical_paths, fail=(), output_root=None):
+    env = {
+        "STUB_LOG": self.log,
+        "STUB_CRITICAL_PATHS": json.dumps(critical_paths),
+        "STUB_FAIL": ",".join(fail),
+    }
+    versions = {"latest": "9.0.0", "rolling": "10.0.0-pre.1", "7.x": "7.6.0"}
+    output = os.path.join(self.tmp, "results.json")
+    stdout = StringIO()
+    with mock.patch.dict(os.environ, env), \
+        mock.patch.object(bazel_version, "get_bazelisk_directory",
+                          return_value=os.path.join(self.tmp, "bazelisk")), \
+        mock.patch.object(bazel_version, "resolve_version",
+                          side_effect=lambda spec, _: versions[spec]), \
+        mock.patch("sys.stdout", stdout), \
+        mock.patch("sys.stderr", StringIO()):
+      code = bazel_perf_compare.main([
+          "--bazel", self.bazel, "--output-root", output_root or os.path.join(
+              self.tmp, "out"), "--output", output, "--min-delta", "0.5"
+      ] + args)
+    with open(output) as f:
+      return code, stdout.getvalue(), json.load(f)
+
+  def test_parse_profile(self):
+    path = os.path.join(self.tmp, "profile.json")
+    with open(path, "w") as f:
+      json.dump([{
+          "cat": "critical path component",
+          "dur": 1500000
+      }, {
+          "cat": "critical path component",
+          "dur": 500000
+      }, {
+          "cat": "action processing",
+          "ph": "X",
+          "dur": 3
+      }], f)
+    self.assertEqual(
+        bazel_perf_compare.parse_profile(path), {
+            "critical_path": 2.0,
+            "actions": 1
+        })
+
+  def test_resolve_specs_deduplicates(self):
+    versions = bazel_perf_compare.resolve_specs(
+        ["default", "latest", "last_rc"], lambda spec: "9.0.0")
+    self.assertEqual(versions, [(self.default, ["default"]),
+                                ("9.0.0", ["latest", "last_rc"])])
+
+  def test_compare_versions(self):
+    code, stdout, results = self.run_main(
+        ["--jobs", "2", "default", "latest", "7.x", "--", "--config=ci"], {
+            self.default: 10,
+            "9.0.0": 10.2,
+            "7.6.0": 20
+        })
+    self.assertEqual(code, 1)
+    by_version = {r["version"]: r for r in results["results"]}
+    self.assertEqual(list(by_version), [self.default, "9.0.0", "7.6.0"])
+    self.assertEqual(by_version["9.0.0"]["critical_path"], 10.2)
+    self.assertEqual(by_version["9.0.0"]["actions"], 2)
+    self.assertIn("REGRESSION (critical_path)", stdout.splitlines()[3])
+    self.assertNotIn("REGRESSION", stdout.splitlines()[2])
+
+    with open(self.log) as f:
+      builds = [line for line in f if " build " in line]
+    self.assertEqual(len(builds), 3)
+    for line in builds:
+      self.assertIn("--config=ci -- //android/...", line)
+
+  def test_failed_build(self):
+    code, stdout, results = self.run_main(["default", "latest", "--runs", "2"],
+                                          {self.default: 1},
+                                          fail=["9.0.0"])
+    self.assertEqual(code, 1)
+    self.assertEqual(len(results["results"][0]["runs"]), 2)
+    self.assertIn("error", results["results"][1])
+    with open(self.log) as f:
+      commands = [line.split()[1] for line in f]
+    self.assertEqual(commands.count("clean"), 1)
+    self.assertEqual(commands.count("shutdown"), 2)
+
+  def test_relative_output_root(self):
+    cwd = os.getcwd()
+    os.chdir(self.tmp)
+    self.addCleanup(os.chdir, cwd)
+    with mock.patch.object(
+        bazel_perf_compare,
+        "measure_version",
+        wraps=bazel_perf_compare.measure_version) as measure:
+      code, _, _ = self.run_main(["default"], {self.default: 1},
+                                 output_root="out")
+    self.assertEqual(code, 0)
+    self.assertEqual(measure.call_args.args[3],
+                     os.path.join(os.path.realpath(self.tmp), "out"))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+__doc__ = """
+Summarizes Bazel JSON trace profiles (--profile), or compares two of them.
+
+The profile, gzipped or not, is decompressed and parsed one trace event at
+a time, so memory use does not grow with its size. Reported are:
+  - wall time and the critical path, with its longest components
+  - executed actions, with their time per mnemonic and per target
+  - local vs. remote execution and the remote cache hit ratio
+
+Mnemonics and targets are taken from the arguments Bazel records with each
+action event. Execution and caching are derived from the event categories
+of the spawn runners: remote cache hits are remote cache checks that were
+not followed by an execution.
+
+Usage:
+  bazel_profile.py summary [--json] [--top 10] <profile>
+  bazel_profile.py diff [--json] [--top 10] <base profile> <new profile>
+
+A profile of "-" is read from stdin.
+"""
+
+import argparse
+import gzip
+import io
+import json
+import sys
+
+try:
+  from tools import json_stream
+except ImportError:
+  import json_stream
+
+CHUNK_SIZE = 1024 * 1024
+# A single event larger than this means the profile is corrupt.
+MAX_EVENT_SIZE = 64 * 1024 * 1024
+
+# Trace event categories, see ProfilerTask in Bazel.
+ACTION_CATEGORY = "action processing"
+CRITICAL_PATH_CATEGORY = "critical path component"
+REMOTE_EXECUTION_CATEGORY = "remote action execution"
+REMOTE_CACHE_CHECK_CATEGORY = "remote action cache check"
+LOCAL_EXECUTION_CATEGORIES = ("local process spawn", "local action execution")
+LOCAL_EXECUTION_NAMES = ("subprocess.run", "worker.run")
+
+UNKNOWN = "(unknown)"
+
+
+def open_profile(path):
+  """Opens a profile as text, decompressing it on the fly if needed."""
+  f = sys.stdin.buffer if path == "-" else open(path, "rb")
+  if f.peek(2)[:2] == b"\x1f\x8b":
+    f = gzip.GzipFile(fileobj=f)
+  return io.TextIOWrapper(f, encoding="utf-8")
+
+
+class TraceReader:
+  """Yields the trace events of a profile without loading it whole.
+
+  Both the object form ({"otherData": ..., "traceEvents": [...]}) and a bare
+  array of events are understood. Members other than traceEvents are kept
+  in `metadata`.
+  """
+
+  def __init__(self, f):
+    self.reader = json_stream.JsonReader(f, CHUNK_SIZE)
+    self.metadata = {}
+
+  def __iter__(self):
+    if self.reader.next_char() == "[":
+      yield from self.reader.array(MAX_EVENT_SIZE)
+      return
+
+    for key, member in self.reader.members():
+      if key == "traceEvents":
+        yield from member.array(MAX_EVENT_SIZE)
+      else:
+        self.metadata[key] = member.value()
+
+
+def add_time(table, key, duration):
+  entry = table.get(key)
+  if entry is None:
+    table[key] = [1, duration]
+  else:
+    entry[0] += 1
+    entry[1] += duration
+
+
+def table_json(table):
+  """Returns {key: {count, time}} sorted by descending time, in seconds."""
+  return {
+      key: {
+          "count": count,
+          "time": duration / 1e6
+      } for key, (count, duration) in sorted(
+          table.items(), key=lambda item: item[1][1], reverse=True)
+  }
+
+
+def analyze(events):
+  """Returns the summary of an iterable of trace events as a dict.
+
+  Times are in seconds.
+  """
+  first_start = None
+  last_end = None
+  critical_path = 0
+  critical_path_components = []
+  actions = 0
+  action_time = 0
+  mnemonics = {}
+  targets = {}
+  local = 0
+  remote = 0
+  cache_checks = 0
+
+  for event in events:
+    if event.get("ph", "X") != "X":
+      continue
+    start = event.get("ts")
+    duration = event.get("dur", 0)
+    if start is not None:
+      if first_start is None or start < first_start:
+        first_start = start
+      if last_end is None or start + duration > last_end:
+        last_end = start + duration
+
+    category = event.get("cat")
+    if category == ACTION_CATEGORY:
+      actions += 1
+      action_time += duration
+      args = event.get("args") or {}
+      add_time(mnemonics, args.get("mnemonic", UNKNOWN), duration)
+      add_time(targets, args.get("target", UNKNOWN), duration)
+    elif category == CRITICAL_PATH_CATEGORY:
+      critical_path += duration
+      critical_path_components.append((duration, event.get("name", UNKNOWN)))
+    elif category == REMOTE_EXECUTION_CATEGORY:
+      remote += 1
+    elif category == REMOTE_CACHE_CHECK_CATEGORY:
+      cache_checks += 1
+    elif (category in LOCAL_EXECUTION_CATEGORIES or
+          event.get("name") in LOCAL_EXECUTION_NAMES):
+      local += 1
+
+  # Every execution after a cache check is a miss.
+  cache_hits = max(0, cache_checks - local - remote) if cache_checks else 0
+  critical_path_components.sort(reverse=True)
+  return {
+      "wall": (last_end - first_start) / 1e6 if first_start is not None else 0,
+      "critical_path": critical_path / 1e6,
+      "critical_path_components": [{
+          "name": name,
+          "time": duration / 1e6
+      } for duration, name in critical_path_components],
+      "actions": actions,
+      "action_time": action_time / 1e6,
+      "mnemonics": table_json(mnemonics),
+      "targets": table_json(targets),
+      "execution": {
+          "local":
+              local,
+          "remote":
+              remote,
+          "remote_cache_checks":
+              cache_checks,
+          "remote_cache_hits":
+              cache_hits,
+          "remote_cache_hit_ratio":
+              cache_hits / cache_checks if cache_checks else None,
+      },
+  }
+
+
+def analyze_profile(path):
+  with open_profile(path) as f:
+    return analyze(TraceReader(f))
+
+
+def diff(base, new):
+  """Returns the differences between two summaries made by analyze()."""
+
+  def table_diff(base_table, new_table):
+    keys = set(base_table) | set(new_table)
+    empty = {"count": 0, "time": 0}
+    changes = {
+        key: {
+            "base":
+                base_table.get(key, empty)["time"],
+            "new":
+                new_table.get(key, empty)["time"],
+            "count_change": (new_table.get(key, empty)["count"] -
+                             base_table.get(key, empty)["count"]),
+        } for key in keys
+    }
+    return dict(
+        sorted(
+            changes.items(),
+            key=lambda item: abs(item[1]["new"] - item[1]["base"]),
+            reverse=True))
+
+  return {
+      "wall": {
+          "base": base["wall"],
+          "new": new["wall"]
+      },
+      "critical_path": {
+          "base": base["critical_path"],
+          "new": new["critical_path"]
+      },
+      "actions": {
+          "base": base["actions"],
+          "new": new["actions"]
+      },
+      "execution": {
+          "base": base["execution"],
+          "new": new["execution"]
+      },
+      "mnemonics": table_diff(base["mnemonics"], new["mnemonics"]),
+      "targets": table_diff(base["targets"], new["targets"]),
+  }
+
+
+def format_ratio(ratio):
+  return "n/a" if ratio is None else f"{ratio:.1%}"
+
+
+def print_summary(summary, top):
+  execution = summary["execution"]
+  print(f"Wall time:     {summary['wall']:10.2f}s")
+  print(f"Critical path: {summary['critical_path']:10.2f}s")
+  print(f"Actions:       {summary['actions']:10d} "
+        f"({summary['action_time']:.2f}s)")
+  print(f"Execution:     {execution['local']} local, {execution['remote']} "
+        f"remote, {execution['remote_cache_hits']}/"
+        f"{execution['remote_cache_checks']} remote cache hits "
+        f"({format_ratio(execution['remote_cache_hit_ratio'])})")
+  print()
+  print("Critical path components:")
+  for component in summary["critical_path_components"][:top]:
+    print(f"  {component['time']:10.2f}s  {component['name']}")
+  for title, key in (("Mnemonics", "mnemonics"), ("Targets", "targets")):
+    print()
+    print(f"{title}:")
+    for name, entry in list(summary[key].items())[:top]:
+      print(f"  {entry['time']:10.2f}s {entry['count']:7d}  {name}")
+
+
+def format_change(base, new, unit="s", digits=2):
+  change = f"{(new - base) / base:+.1%}" if base else "n/a"
+  return (f"{base:10.{digits}f}{unit} {new:10.{digits}f}{unit} "
+          f"{change:>8}")
+
+
+def print_diff(changes, top):
+  print(f"{'':<15} {'base':>11} {'new':>11} {'change':>8}")
+  for title, key in (("Wall time:", "wall"), ("Critical path:",
+                                              "critical_path")):
+    print(f"{title:<15} "
+          f"{format_change(changes[key]['base'], changes[key]['new'])}")
+  actions = changes["actions"]
+  print(f"{'Actions:':<15} "
+        f"{format_change(actions['base'], actions['new'], ' ', 0)}")
+  base_ratio = changes["execution"]["base"]["remote_cache_hit_ratio"]
+  new_ratio = changes["execution"]["new"]["remote_cache_hit_ratio"]
+  print(f"{'Cache hits:':<15} {format_ratio(base_ratio):>11} "
+        f"{format_ratio(new_ratio):>11}")
+  for title, key in (("Mnemonics", "mnemonics"), ("Targets", "targets")):
+    print()
+    print(f"{title} with the largest changes:")
+    for name, entry in list(changes[key].items())[:top]:
+      print(f"  {format_change(entry['base'], entry['new'])} "
+            f"{entry['count_change']:+6d}  {name}")
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(
+      description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  subparsers = parser.add_subparsers(dest="command", required=True)
+  summary_parser = subparsers.add_parser("summary", help="Summarize a profile.")
+  summary_parser.add_argument("profile")
+  diff_parser = subparsers.add_parser("diff", help="Compare two profiles.")
+  diff_parser.add_argument("base")
+  diff_parser.add_argument("new")
+  for subparser in (summary_parser, diff_parser):
+    subparser.add_argument(
+        "--json", action="store_true", help="Print the full results as JSON.")
+    subparser.add_argument(
+        "--top", type=int, default=10, help="Entries to show per table.")
+  args = parser.parse_args(argv)
+
+  try:
+    if args.command == "summary":
+      result = analyze_profile(args.profile)
+      printer = print_summary
+    else:
+      result = diff(analyze_profile(args.base), analyze_profile(args.new))
+      printer = print_diff
+  except (OSError, ValueError) as e:
+    print(f"Error: {e}", file=sys.stderr)
+    return 1
+
+  if args.json:
+    json.dump(result, sys.stdout, indent=2)
+    print()
+  else:
+    printer(result, args.top)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Unit tests for bazel_profile.py
+"""
+
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from io import StringIO
+from unittest import mock
+
+# Add the parent directory to the path so we can import bazel_profile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import bazel_profile
+
+
+def action(mnemonic, target, ts, dur):
+  return {
+      "cat": "action processing",
+      "name": f"{mnemonic} {target}",
+      "ph": "X",
+      "ts": ts,
+      "dur": dur,
+      "pid": 1,
+      "tid": 2,
+      "args": {
+          "mnemonic": mnemonic,
+          "target": target
+      }
+  }
+
+
+def event(category, name, ts=0, dur=1, ph="X"):
+  return {"cat": category, "name": name, "ph": ph, "ts": ts, "dur": dur}
+
+
+class TestBazelProfile(unittest.TestCase):
+  """Test cases for bazel_profile.py"""
+
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.tmp)
+    self.events = [
+        event("build phase marker", "Launch Blaze", ph="i"),
+        action("Javac", "//a:lib", 1000000, 2000000),
+        action("Javac", "//b:lib", 1500000, 1000000),
+        action("GenRule", "//a:gen", 0, 500000),
+        event("critical path component", "action 'Javac //a:lib'", 1000000,
+              2000000),
+        event("critical path component", "action 'GenRule //a:gen'", 0, 500000),
+        event("remote action cache check", "check"),
+        event("remote action cache check", "check"),
+        event("remote action cache check", "check"),
+        event("remote action execution", "execute remotely"),
+        event("general information", "subprocess.run"),
+    ]
+
+  def write_profile(self, events, compress=True, name="profile.json.gz"):
+    path = os.path.join(self.tmp, name)
+    data = json.dumps({
+        "otherData": {
+            "build_id": "1234"
+        },
+        "traceEvents": events
+    },
+                      indent=1).encode()
+    with open(path, "wb") as f:
+      f.write(gzip.compress(data) if compress else data)
+    return path
+
+  def test_reader(self):
+    """Test that events split across chunks are read like json.load does"""
+    path = self.write_profile(self.events, compress=False)
+    for chunk_size in (1, 7, 4096):
+      with self.subTest(chunk_size=chunk_size), \
+          mock.patch.object(bazel_profile, "CHUNK_SIZE", chunk_size), \
+          bazel_profile.open_profile(path) as f:
+        reader = bazel_profile.TraceReader(f)
+        self.assertEqual(list(reader), self.events)
+        self.assertEqual(reader.metadata, {"otherData": {"build_id": "1234"}})
+
+  def test_reader_bare_array(self):
+    path = os.path.join(self.tmp, "profile.json")
+    with open(path, "w") as f:
+      json.dump(self.events[:2], f)
+    with bazel_profile.open_profile(path) as f:
+      self.assertEqual(list(bazel_profile.TraceReader(f)), self.events[:2])
+
+  def test_reader_truncated(self):
+    path = os.path.join(self.tmp, "profile.json")
+    with open(path, "w") as f:
+      f.write(json.dumps({"traceEvents": self.events})[:-20])
+    with bazel_profile.open_profile(path) as f:
+      with self.assertRaises(ValueError):
+        list(bazel_profile.TraceReader(f))
+
+  def test_analyze(self):
+    summary = bazel_profile.analyze_profile(self.write_profile(self.events))
+    self.assertEqual(summary["wall"], 3.0)
+    self.assertEqual(summary["critical_path"], 2.5)
+    self.assertEqual(summary["critical_path_components"][0], {
+        "name": "action 'Javac //a:lib'",
+        "time": 2.0
+    })
+    self.assertEqual(summary["actions"], 3)
+    self.assertEqual(summary["mnemonics"], {
+        "Javac": {
+            "count": 2,
+            "time": 3.0
+        },
+        "GenRule": {
+            "count": 1,
+            "time": 0.5
+        }
+    })
+    self.assertEqual(summary["targets"]["//a:lib"], {"count": 1, "time": 2.0})
+    self.assertEqual(
+        summary["execution"], {
+            "local": 1,
+            "remote": 1,
+            "remote_cache_checks": 3,
+            "remote_cache_hits": 1,
+            "remote_cache_hit_ratio": 1 / 3
+        })
+
+  def test_diff(self):
+    base = self.write_profile(self.events, name="base.json.gz")
+    new = self.write_profile(
+        self.events + [action("Javac", "//c:lib", 0, 4000000)],
+        name="new.json.gz")
+    stdout = StringIO()
+    with mock.patch("sys.stdout", stdout):
+      self.assertEqual(bazel_profile.main(["diff", "--json", base, new]), 0)
+    changes = json.loads(stdout.getvalue())
+    self.assertEqual(changes["wall"], {"base": 3.0, "new": 4.0})
+    self.assertEqual(changes["actions"], {"base": 3, "new": 4})
+    self.assertEqual(list(changes["mnemonics"])[0], "Javac")
+    self.assertEqual(changes["mnemonics"]["Javac"], {
+        "base": 3.0,
+        "new": 7.0,
+        "count_change": 1
+    })
+
+    stdout = StringIO()
+    with mock.patch("sys.stdout", stdout):
+      self.assertEqual(bazel_profile.main(["diff", base, new]), 0)
+    self.assertIn("+133.3%", stdout.getvalue())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -22,22 +22,87 @@ Useful for CI pipelines. Original code is from https://github.com/bazelbuild/baz
 and modified to be used to get the version string.
 
 Usage:
-  bazel_version.py <string, such as "latest", "last_rc", "7.4.0", "7.x", "7.*">
+  bazel_version.py [--local-first] [--check-newer] [--deadline SECONDS]
+                   [--releases-source URL]...
+                   <string, such as "latest", "last_rc", "7.4.0", "7.x", "7.*",
+                    "rolling", "last_green", "last_downloaded">
+  bazel_version.py --watch [--interval SECONDS] [--max-interval SECONDS]
+                   [--exec COMMAND] <string>...
+
+  --local-first  Answer from the Bazel versions bazelisk already downloaded
+                 when possible, without network access. Also enabled by
+                 setting BAZEL_VERSION_LOCAL_FIRST=1.
+  --check-newer  Always consult the network, even with --local-first.
+  --deadline SECONDS
+                 Total time budget for fetching the metadata a version
+                 string needs, or for each poll with --watch (default:
+                 $BAZEL_VERSION_DEADLINE or 30).
+  --releases-source URL
+                 A source for the GitHub releases list, such as a mirror
+                 or a file:// snapshot. Can be repeated; sources are tried
+                 in order, with hedged requests when one is slow. Defaults
+                 to $BAZEL_VERSION_RELEASES_SOURCES or the GitHub API.
+  --watch        Keep running and print a JSON line whenever one of the
+                 given strings resolves to a different version. The release
+                 list is kept in memory and revalidated with its ETag.
+  --interval SECONDS, --max-interval SECONDS
+                 Poll every --interval seconds after a change, slowing down
+                 to --max-interval while nothing changes (default: 60, 300).
+  --exec COMMAND Also run COMMAND through the shell for every change, with
+                 the JSON line on stdin and in $BAZEL_VERSION_EVENT.
 """
 
+import argparse
 import json
 import os
 import platform
+import queue
 import re
+import subprocess
 import sys
+import tempfile
+import threading
 import time
 from contextlib import closing
+from urllib.error import HTTPError
+from urllib.parse import quote
 from urllib.request import urlopen, Request
 
 ONE_HOUR = 60 * 60  # one hour in seconds
 
+# Default time budget, in seconds, for resolving one version string: all the
+# metadata it needs, from all of its sources.
+DEFAULT_DEADLINE = 30
+DEADLINE_ENV = "BAZEL_VERSION_DEADLINE"
+# A second source is started once the first one has been slower than this
+# percentile of its recent response times, or DEFAULT_HEDGE_DELAY seconds
+# if there is no history yet.
+HEDGE_PERCENTILE = 0.9
+DEFAULT_HEDGE_DELAY = 1.0
+MIN_HEDGE_DELAY = 0.05
+LATENCY_SAMPLES = 20
+
+# Watch mode polls every WATCH_INTERVAL seconds after a change and slows down
+# by WATCH_BACKOFF per quiet or failed poll, up to WATCH_MAX_INTERVAL.
+WATCH_INTERVAL = 60
+WATCH_MAX_INTERVAL = 5 * 60
+WATCH_BACKOFF = 1.5
+
 RE_Latest_version = re.compile(r"^(\d+)\.x$")
 RE_Latest_version_with_candidate = re.compile(r"^(\d+)\.\*$")
+# Release, release candidate and rolling versions, as opposed to commits.
+RE_Release_version = re.compile(r"^\d+\.\d+\.\d+(rc\d+|-pre\.\d+\.\d+)?$")
+RE_Downloaded_bazel = re.compile(
+    r"^bazel-(.+)-(?:linux|darwin|windows)-(?:x86_64|arm64|aarch64)(?:\.exe)?$")
+
+RELEASES_URL = "https://api.github.com/repos/bazelbuild/bazel/releases"
+# Whitespace or comma separated list of URLs serving the same data as
+# RELEASES_URL, e.g. a self-hosted mirror or a file:// snapshot, in order
+# of preference.
+RELEASES_SOURCES_ENV = "BAZEL_VERSION_RELEASES_SOURCES"
+GCS_LIST_URL = "https://www.googleapis.com/storage/v1/b/bazel/o?delimiter=/"
+LAST_GREEN_COMMIT_BASE_PATH = "https://storage.googleapis.com/bazel-untrusted-builds/last_green_commit/"
+LAST_GREEN_COMMIT_PATH = "github.com/bazelbuild/bazel.git/bazel-bazel"
 
 
 # Custom version parsing implementation
@@ -137,46 +202,381 @@ def get_bazelisk_directory():
   return os.path.join(base_dir, "bazelisk")
 
 
-def read_remote_text_file(url):
-  headers = {}
+def open_remote_url(url, headers=None, timeout=None):
+  headers = dict(headers or {})
 
   # Add GitHub token if available
   github_token = os.environ.get("BAZELISK_GITHUB_TOKEN")
   if github_token and "github.com" in url:
     headers["Authorization"] = f"token {github_token}"
 
-  req = urlopen(Request(url, headers=headers))
-  with closing(req) as res:
-    body = res.read()
+  if timeout is None:
+    return urlopen(Request(url, headers=headers))
+  return urlopen(Request(url, headers=headers), timeout=timeout)
+
+
+def decode_body(res, body):
+  try:
+    return body.decode(res.info().get_content_charset("iso-8859-1"))
+  except AttributeError:
+    # Python 2.x compatibility hack
+    return body.decode(res.info().getparam("charset") or "iso-8859-1")
+
+
+def read_remote_text_file_if_modified(url, etag=None, timeout=None):
+  """Fetches `url`, revalidating with `etag` if given.
+
+  Returns a (text, etag) tuple. text is None if the server answered that
+  the resource did not change.
+  """
+  headers = {}
+  if etag:
+    headers["If-None-Match"] = etag
+  try:
+    with closing(open_remote_url(url, headers, timeout)) as res:
+      return decode_body(res, res.read()), res.headers.get("ETag")
+  except HTTPError as e:
+    if e.code == 304:
+      return None, etag
+    raise
+
+
+def write_file_atomic(path, text):
+  fd, temp_path = tempfile.mkstemp(
+      dir=os.path.dirname(path),
+      prefix=os.path.basename(path) + ".",
+      suffix=".tmp")
+  try:
+    with os.fdopen(fd, "wb") as f:
+      f.write(text.encode("utf-8"))
+    os.replace(temp_path, path)
+  except BaseException:
+    os.remove(temp_path)
+    raise
+
+
+def load_latencies(bazelisk_directory):
+  try:
+    with open(os.path.join(bazelisk_directory, "source_latencies.json"),
+              "rb") as f:
+      latencies = json.loads(f.read().decode("utf-8"))
+    if isinstance(latencies, dict):
+      return latencies
+  except (OSError, ValueError):
+    pass
+  return {}
+
+
+def record_latency(bazelisk_directory, url, seconds):
+  latencies = load_latencies(bazelisk_directory)
+  samples = latencies.get(url, [])[-(LATENCY_SAMPLES - 1):] + [seconds]
+  latencies[url] = samples
+  write_file_atomic(
+      os.path.join(bazelisk_directory, "source_latencies.json"),
+      json.dumps(latencies))
+
+
+def get_hedge_delay(latencies, url):
+  """Returns how long to wait for `url` before starting another source."""
+  samples = sorted(latencies.get(url, []))
+  if not samples:
+    return DEFAULT_HEDGE_DELAY
+  index = min(len(samples) - 1, int(len(samples) * HEDGE_PERCENTILE))
+  return max(MIN_HEDGE_DELAY, samples[index])
+
+
+def make_deadline(seconds=DEFAULT_DEADLINE):
+  """Returns the time.monotonic() value `seconds` from now."""
+  return time.monotonic() + seconds
+
+
+def fetch_first(bazelisk_directory,
+                urls,
+                etag=None,
+                validate=None,
+                deadline=None):
+  """Fetches the same metadata from several sources, hedging slow ones.
+
+  Sources are tried in order. The next one is started as soon as the
+  current one fails or gives an invalid answer, or when it is slower than
+  its usual response time. The first valid answer wins and the remaining
+  requests are abandoned. Everything is bounded by `deadline`.
+
+  Args:
+    bazelisk_directory: The bazelisk cache directory, for latency history
+    urls: The sources, in order of preference
+    etag: Sent as If-None-Match, see read_remote_text_file_if_modified
+    validate: Called with the text of an answer, raises ValueError if the
+      answer is not usable
+    deadline: The time.monotonic() value to give up at, shared by all the
+      fetches of one resolution (default: DEFAULT_DEADLINE seconds from now)
+
+  Returns:
+    A (text, etag) tuple like read_remote_text_file_if_modified
+  """
+  if deadline is None:
+    deadline = make_deadline()
+  latencies = load_latencies(bazelisk_directory)
+  results = queue.Queue()
+
+  def fetch(url):
+    start = time.monotonic()
     try:
-      return body.decode(res.info().get_content_charset("iso-8859-1"))
-    except AttributeError:
-      # Python 2.x compatibility hack
-      return body.decode(res.info().getparam("charset") or "iso-8859-1")
+      text, new_etag = read_remote_text_file_if_modified(
+          url, etag, timeout=max(0.001, deadline - start))
+      if text is not None and validate is not None:
+        validate(text)
+      results.put((url, text, new_etag, time.monotonic() - start, None))
+    except Exception as e:
+      results.put((url, None, None, None, e))
+
+  pending = list(urls)
+  running = 0
+  hedge_at = None
+  errors = []
+  while pending or running:
+    now = time.monotonic()
+    if now >= deadline:
+      break
+    if pending and (running == 0 or now >= hedge_at):
+      url = pending.pop(0)
+      # Daemon threads, so that abandoned requests never delay exiting.
+      threading.Thread(target=fetch, args=(url,), daemon=True).start()
+      running += 1
+      hedge_at = now + get_hedge_delay(latencies, url)
+
+    wait = deadline - now
+    if pending:
+      wait = min(wait, hedge_at - now)
+    try:
+      url, text, new_etag, latency, error = results.get(timeout=max(0, wait))
+    except queue.Empty:
+      continue
+
+    running -= 1
+    if error is not None:
+      errors.append(f"{url}: {error}")
+      continue
+
+    record_latency(bazelisk_directory, url, latency)
+    return text, new_etag
 
+  if time.monotonic() >= deadline:
+    errors.append("deadline exceeded")
+  raise RuntimeError("Could not fetch metadata: " + "; ".join(errors))
 
-def get_releases_json(bazelisk_directory):
+
+def remove_cached_text_file(bazelisk_directory, name):
+  for path in (os.path.join(bazelisk_directory, name),
+               os.path.join(bazelisk_directory, name + ".etag")):
+    try:
+      os.remove(path)
+    except OSError:
+      pass
+
+
+def get_cached_text_file(bazelisk_directory,
+                         name,
+                         urls,
+                         max_age=ONE_HOUR,
+                         validate=None,
+                         deadline=None):
+  """Returns the contents of `urls`, cached as `name` in the bazelisk dir.
+
+  `urls` is a URL or a list of URLs serving the same data, and `deadline`
+  bounds fetching them, see fetch_first.
+  A cached copy younger than `max_age` is used as is. An older one is
+  revalidated with the ETag of the last response, so an unchanged resource
+  costs a single small request.
+  """
+  if isinstance(urls, str):
+    urls = [urls]
+  path = os.path.join(bazelisk_directory, name)
+  etag_path = path + ".etag"
+
+  cached = None
+  if os.path.exists(path):
+    with open(path, "rb") as f:
+      cached = f.read().decode("utf-8")
+    if abs(time.time() - os.path.getmtime(path)) < max_age:
+      return cached
+
+  etag = None
+  if cached is not None and os.path.exists(etag_path):
+    with open(etag_path, "r") as f:
+      etag = f.read().strip() or None
+
+  body, etag = fetch_first(bazelisk_directory, urls, etag, validate, deadline)
+  if body is None:
+    # Not modified, the cached copy is fresh again.
+    os.utime(path)
+    return cached
+
+  write_cached_text_file(path, body, etag)
+  return body
+
+
+def write_cached_text_file(path, body, etag):
+  write_file_atomic(path, body)
+  etag_path = path + ".etag"
+  if etag:
+    write_file_atomic(etag_path, etag)
+  elif os.path.exists(etag_path):
+    os.remove(etag_path)
+
+
+def get_cached_json(bazelisk_directory,
+                    name,
+                    urls,
+                    validate=json.loads,
+                    deadline=None):
+  """Like get_cached_text_file, but parses the contents as JSON."""
+  try:
+    return json.loads(
+        get_cached_text_file(
+            bazelisk_directory,
+            name,
+            urls,
+            validate=validate,
+            deadline=deadline))
+  except ValueError:
+    print(f"WARN: Could not parse cached {name}.")
+    remove_cached_text_file(bazelisk_directory, name)
+  return json.loads(
+      get_cached_text_file(
+          bazelisk_directory, name, urls, validate=validate, deadline=deadline))
+
+
+def get_releases_sources(sources=None):
+  """Returns `sources`, or the release list sources configured by default."""
+  if sources:
+    return list(sources)
+  sources = os.environ.get(RELEASES_SOURCES_ENV, "").replace(",", " ").split()
+  return sources or [RELEASES_URL]
+
+
+def validate_releases(text):
+  if not isinstance(json.loads(text), list):
+    raise ValueError("Expected a list of releases")
+
+
+def get_releases_json(bazelisk_directory, sources=None, deadline=None):
   """Returns the most recent versions of Bazel, in descending order."""
-  releases_path = os.path.join(bazelisk_directory, "releases.json")
-
-  # Use a cached version if it's fresh enough.
-  if os.path.exists(releases_path):
-    if abs(time.time() - os.path.getmtime(releases_path)) < ONE_HOUR:
-      with open(releases_path, "rb") as f:
-        try:
-          return json.loads(f.read().decode("utf-8"))
-        except ValueError:
-          print("WARN: Could not parse cached releases.json.")
-          try:
-            os.remove(releases_path)
-          except Exception as e:
-            pass
-
-  url = "https://api.github.com/repos/bazelbuild/bazel/releases"
-  body = read_remote_text_file(url)
-  with open(releases_path, "wb") as f:
-    f.write(body.encode("utf-8"))
-  return json.loads(body)
+  return get_cached_json(
+      bazelisk_directory,
+      "releases.json",
+      get_releases_sources(sources),
+      validate=validate_releases,
+      deadline=deadline)
+
+
+def list_gcs_prefixes(bazelisk_directory, prefix, cache_name, deadline=None):
+  """Lists the "directories" below `prefix` in the Bazel release bucket."""
+  prefixes = []
+  page = 0
+  page_token = None
+  while True:
+    url = GCS_LIST_URL
+    if prefix:
+      url += "&prefix=" + quote(prefix, safe="")
+    if page_token:
+      url += "&pageToken=" + quote(page_token, safe="")
+    name = f"{cache_name}.json" if page == 0 else f"{cache_name}-{page}.json"
+
+    data = get_cached_json(bazelisk_directory, name, url, deadline=deadline)
+    prefixes.extend(
+        p[len(prefix):].rstrip("/") for p in data.get("prefixes", []))
+    page_token = data.get("nextPageToken")
+    if not page_token:
+      return prefixes
+    page += 1
+
+
+def get_rolling_versions(bazelisk_directory, deadline=None):
+  """Returns the rolling releases of the upcoming Bazel release, newest first.
+
+  Rolling releases live below "<version>/rolling/" in the release bucket,
+  where <version> is the newest version listed there.
+  """
+  base_versions = []
+  for name in list_gcs_prefixes(bazelisk_directory, "", "gcs_versions",
+                                deadline):
+    try:
+      version = Version(name)
+    except InvalidVersion:
+      continue
+    if not version.suffix:
+      base_versions.append(version)
+  base_versions.sort(reverse=True)
+
+  # The newest directory may not have any rolling releases yet.
+  for base in base_versions[:2]:
+    prefix = f"{base.version_str}/rolling/"
+    names = list_gcs_prefixes(bazelisk_directory, prefix,
+                              f"gcs_rolling_{base.version_str}", deadline)
+    versions = []
+    for name in names:
+      try:
+        versions.append((Version(name), name))
+      except InvalidVersion:
+        continue
+    if versions:
+      versions.sort(reverse=True)
+      return [name for _, name in versions]
+
+  raise ValueError("No rolling releases found")
+
+
+def get_latest_rolling(bazelisk_directory, deadline=None):
+  """Returns the most recent rolling release."""
+  return get_rolling_versions(bazelisk_directory, deadline)[0]
+
+
+def get_last_green_commit(bazelisk_directory, deadline=None):
+  """Returns the last commit of Bazel that passed CI."""
+  return get_cached_text_file(
+      bazelisk_directory,
+      "last_green_commit",
+      LAST_GREEN_COMMIT_BASE_PATH + LAST_GREEN_COMMIT_PATH,
+      deadline=deadline).strip()
+
+
+def get_download_directories(bazelisk_directory):
+  downloads = os.path.join(bazelisk_directory, "downloads")
+  return [
+      os.path.join(downloads, "metadata", "bazelbuild"),
+      os.path.join(downloads, "bazelbuild")
+  ]
+
+
+def get_downloaded_versions(bazelisk_directory):
+  """Returns {version: mtime} for the Bazel binaries bazelisk downloaded.
+
+  Both the current (downloads/metadata/<fork>/bazel-<version>-<platform>)
+  and the older (downloads/<fork>/bazel-<version>-<platform>/) layout are
+  understood. Only the bazelbuild fork is considered.
+  """
+  versions = {}
+  for directory in get_download_directories(bazelisk_directory):
+    try:
+      entries = list(os.scandir(directory))
+    except OSError:
+      continue
+    for entry in entries:
+      match = RE_Downloaded_bazel.match(entry.name)
+      if not match:
+        continue
+      mtime = entry.stat().st_mtime
+      versions[match.group(1)] = max(mtime, versions.get(match.group(1), 0))
+  return versions
+
+
+def get_last_downloaded(bazelisk_directory):
+  """Returns the Bazel version bazelisk downloaded most recently."""
+  versions = get_downloaded_versions(bazelisk_directory)
+  if not versions:
+    raise ValueError("No downloaded Bazel versions found")
+  return max(versions, key=versions.get)
 
 
 def parse_versions(releases):
@@ -315,22 +715,326 @@ def resolve_version_string(bazel_version, releases_json):
         return get_exact_version(releases_json, bazel_version)
 
 
+def get_installed_versions(bazelisk_directory):
+  """Returns the Bazel versions bazelisk downloaded, using a manifest.
+
+  The manifest remembers the modification times of the download
+  directories, so they are only scanned again after bazelisk added or
+  removed something.
+  """
+  manifest_path = os.path.join(bazelisk_directory, "installed_versions.json")
+  stamps = {}
+  for directory in get_download_directories(bazelisk_directory):
+    try:
+      stamps[directory] = os.stat(directory).st_mtime_ns
+    except OSError:
+      pass
+
+  try:
+    with open(manifest_path, "rb") as f:
+      manifest = json.loads(f.read().decode("utf-8"))
+    if manifest["directories"] == stamps:
+      return sorted(manifest["versions"])
+  except (OSError, ValueError, KeyError, TypeError):
+    pass
+
+  versions = sorted(get_downloaded_versions(bazelisk_directory))
+  write_file_atomic(manifest_path,
+                    json.dumps({
+                        "directories": stamps,
+                        "versions": versions
+                    }))
+  return versions
+
+
+def is_rolling_version(version_str):
+  return "-pre." in version_str
+
+
+def resolve_installed_version(bazel_version, bazelisk_directory):
+  """Resolves a version string from the versions bazelisk downloaded.
+
+  Returns None if no installed version satisfies the request, or if the
+  request can only be answered by upstream (e.g. "last_green").
+  """
+  # Bazel built at a commit (e.g. for last_green) is downloaded as well, but
+  # a commit is not a version to resolve to.
+  installed = [
+      version_str for version_str in get_installed_versions(bazelisk_directory)
+      if RE_Release_version.match(version_str)
+  ]
+
+  if bazel_version == "rolling":
+    rolling = []
+    for version_str in installed:
+      if is_rolling_version(version_str):
+        rolling.append((Version(version_str), version_str))
+    return get_highest_version(sorted(rolling, reverse=True))
+  elif bazel_version in ("last_green", "last_downloaded"):
+    return None
+
+  releases = []
+  for version_str in installed:
+    if is_rolling_version(version_str):
+      continue
+    try:
+      prerelease = Version(version_str).is_prerelease
+    except InvalidVersion:
+      continue
+    releases.append({"tag_name": version_str, "prerelease": prerelease})
+
+  try:
+    return resolve_version_string(bazel_version, releases)
+  except ValueError:
+    return None
+
+
+def resolve_version(bazel_version,
+                    bazelisk_directory,
+                    local_first=False,
+                    sources=None,
+                    deadline=None):
+  """Resolves a version string, fetching only the sources it needs.
+
+  Args:
+    bazel_version: Anything resolve_version_string accepts, or "rolling",
+      "last_green" or "last_downloaded"
+    bazelisk_directory: The bazelisk cache directory
+    local_first: Answer from the versions bazelisk already downloaded if
+      one of them satisfies the request
+    sources: The sources of the release list, see get_releases_sources
+    deadline: The time.monotonic() value by which all fetches must be done
+      (default: DEFAULT_DEADLINE seconds from now)
+
+  Returns:
+    A string with the resolved Bazel version, or a commit for "last_green"
+  """
+  if local_first:
+    result = resolve_installed_version(bazel_version, bazelisk_directory)
+    if result is not None:
+      return result
+
+  if deadline is None:
+    deadline = make_deadline()
+  if bazel_version == "rolling":
+    return get_latest_rolling(bazelisk_directory, deadline)
+  elif bazel_version == "last_green":
+    return get_last_green_commit(bazelisk_directory, deadline)
+  elif bazel_version == "last_downloaded":
+    return get_last_downloaded(bazelisk_directory)
+
+  releases_json = get_releases_json(bazelisk_directory, sources, deadline)
+  return resolve_version_string(bazel_version, releases_json)
+
+
+# Specs that are not answered from the release list.
+NON_RELEASE_SPECS = ("rolling", "last_green", "last_downloaded")
+
+
+class ReleaseIndex:
+  """The release list, kept in memory and revalidated with its ETag.
+
+  Starts from the copy cached in the bazelisk directory, and keeps that copy
+  up to date for other invocations of this script.
+  """
+
+  def __init__(self, bazelisk_directory, sources=None):
+    self.bazelisk_directory = bazelisk_directory
+    self.sources = get_releases_sources(sources)
+    self.path = os.path.join(bazelisk_directory, "releases.json")
+    self.text = None
+    self.etag = None
+    self.releases = None
+    try:
+      with open(self.path, "rb") as f:
+        text = f.read().decode("utf-8")
+      releases = json.loads(text)
+      with open(self.path + ".etag", "r") as f:
+        self.etag = f.read().strip() or None
+      self.text, self.releases = text, releases
+    except (OSError, ValueError):
+      self.etag = None
+
+  def refresh(self, deadline=None):
+    """Revalidates the release list, returns True if it changed."""
+    text, etag = fetch_first(self.bazelisk_directory, self.sources, self.etag,
+                             validate_releases, deadline)
+    if text is None:
+      try:
+        os.utime(self.path)
+      except OSError:
+        pass
+      return False
+
+    self.etag = etag
+    if text == self.text:
+      return False
+    self.text = text
+    self.releases = json.loads(text)
+    write_cached_text_file(self.path, text, etag)
+    return True
+
+
+def resolve_or_none(resolve, *args):
+  try:
+    return resolve(*args)
+  except ValueError:
+    # E.g. "9.x" before 9.0.0 is released.
+    return None
+
+
+def watch(bazel_versions,
+          bazelisk_directory,
+          emit,
+          interval=WATCH_INTERVAL,
+          max_interval=WATCH_MAX_INTERVAL,
+          sleep=time.sleep,
+          max_polls=None,
+          sources=None,
+          timeout=DEFAULT_DEADLINE):
+  """Polls for changes in what `bazel_versions` resolve to.
+
+  The release list is only downloaded again when its ETag changed and only
+  parsed again when its contents did, so a quiet poll costs one small
+  conditional request. "rolling" and "last_green" go through the regular
+  (hourly) cache.
+
+  Args:
+    bazel_versions: The version strings to watch
+    bazelisk_directory: The bazelisk cache directory
+    emit: Called with an event dict whenever a resolution changes; the
+      first resolution is not reported
+    interval: Seconds between polls after a change
+    max_interval: Upper bound for the delay between quiet polls
+    sleep: Called with the number of seconds to wait
+    max_polls: Stop after this many polls, for testing
+    sources: The sources of the release list, see get_releases_sources
+    timeout: Time budget in seconds for the fetches of one poll
+  """
+  index = None
+  if any(v not in NON_RELEASE_SPECS for v in bazel_versions):
+    index = ReleaseIndex(bazelisk_directory, sources)
+  resolved = None
+  delay = interval
+  polls = 0
+  while max_polls is None or polls < max_polls:
+    polls += 1
+    deadline = make_deadline(timeout)
+    try:
+      index_changed = index is not None and index.refresh(deadline)
+      current = {}
+      for bazel_version in bazel_versions:
+        if bazel_version in NON_RELEASE_SPECS:
+          current[bazel_version] = resolve_or_none(resolve_version,
+                                                   bazel_version,
+                                                   bazelisk_directory, False,
+                                                   sources, deadline)
+        elif index_changed or resolved is None:
+          current[bazel_version] = resolve_or_none(resolve_version_string,
+                                                   bazel_version,
+                                                   index.releases)
+        else:
+          current[bazel_version] = resolved[bazel_version]
+    except Exception as e:
+      print(f"WARN: {e}", file=sys.stderr)
+      delay = min(max_interval, delay * WATCH_BACKOFF)
+      sleep(delay)
+      continue
+
+    changed = {
+        bazel_version: {
+            "from": resolved[bazel_version],
+            "to": version
+        }
+        for bazel_version, version in current.items()
+        if resolved is not None and resolved[bazel_version] != version
+    }
+    if changed:
+      emit({"time": int(time.time()), "versions": current, "changed": changed})
+      # Releases come in bursts, e.g. several RCs in a row.
+      delay = interval
+    elif resolved is not None:
+      delay = min(max_interval, delay * WATCH_BACKOFF)
+    resolved = current
+    sleep(delay)
+
+
+def make_emitter(hook_command=None):
+  """Returns an emit function for watch that prints JSON lines.
+
+  If `hook_command` is given, it is also run through the shell for every
+  event, with the JSON on stdin and in $BAZEL_VERSION_EVENT.
+  """
+
+  def emit(event):
+    line = json.dumps(event, sort_keys=True)
+    print(line, flush=True)
+    if hook_command:
+      r = subprocess.run(
+          hook_command,
+          shell=True,
+          input=line.encode("utf-8"),
+          env=dict(os.environ, BAZEL_VERSION_EVENT=line))
+      if r.returncode != 0:
+        print(f"WARN: hook exited with {r.returncode}", file=sys.stderr)
+
+  return emit
+
+
 def main():
-  if len(sys.argv) != 2:
+  if len(sys.argv) < 2:
     print(__doc__)
     return 1
 
-  bazel_version = sys.argv[1]
+  parser = argparse.ArgumentParser(
+      description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("bazel_version", nargs="+")
+  parser.add_argument(
+      "--local-first",
+      action="store_true",
+      default=os.environ.get("BAZEL_VERSION_LOCAL_FIRST") == "1")
+  parser.add_argument("--check-newer", action="store_true")
+  parser.add_argument("--deadline", type=float)
+  parser.add_argument("--releases-source", action="append")
+  parser.add_argument("--watch", action="store_true")
+  parser.add_argument("--interval", type=float, default=WATCH_INTERVAL)
+  parser.add_argument("--max-interval", type=float, default=WATCH_MAX_INTERVAL)
+  parser.add_argument("--exec", dest="hook_command")
+  args = parser.parse_args(sys.argv[1:])
+  if len(args.bazel_version) > 1 and not args.watch:
+    parser.error("only one version string can be resolved without --watch")
+
+  if args.deadline is None:
+    try:
+      args.deadline = float(os.environ.get(DEADLINE_ENV, DEFAULT_DEADLINE))
+    except ValueError:
+      parser.error(f"${DEADLINE_ENV} must be a number of seconds")
 
   try:
     bazelisk_directory = get_bazelisk_directory()
     os.makedirs(bazelisk_directory, exist_ok=True)
 
-    releases_json = get_releases_json(bazelisk_directory)
-
-    result = resolve_version_string(bazel_version, releases_json)
+    if args.watch:
+      watch(
+          args.bazel_version,
+          bazelisk_directory,
+          make_emitter(args.hook_command),
+          interval=args.interval,
+          max_interval=max(args.interval, args.max_interval),
+          sources=args.releases_source,
+          timeout=args.deadline)
+      return 0
+
+    result = resolve_version(
+        args.bazel_version[0],
+        bazelisk_directory,
+        local_first=args.local_first and not args.check_newer,
+        sources=args.releases_source,
+        deadline=make_deadline(args.deadline))
     print(result)
     return 0
+  except KeyboardInterrupt:
+    return 0
   except Exception as e:
     print(f"Error: {e}", file=sys.stderr)
     return 1
@@ -3,9 +3,15 @@
 Unit tests for bazel_version.py
 """
 
+import json
 import os
+import shutil
 import sys
+import tempfile
+import threading
+import time
 import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from io import StringIO
 from unittest import mock
 
@@ -241,6 +247,395 @@ class TestBazelVersion(unittest.TestCase):
     version = bazel_version.resolve_version_string("7.0.0", self.mock_releases)
     self.assertEqual(version, "7.0.0")
 
+  def make_bazelisk_directory(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    return directory
+
+  def mock_remote(self, responses):
+    """Serves `responses` ({url: text}) in place of the network."""
+    requests = []
+
+    def read(url, etag=None, timeout=None):
+      requests.append((url, etag))
+      if etag is not None and etag == f"etag-{url}":
+        return None, etag
+      return responses[url], f"etag-{url}"
+
+    patcher = mock.patch.object(
+        bazel_version, "read_remote_text_file_if_modified", side_effect=read)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    return requests
+
+  def test_get_cached_text_file_revalidates(self):
+    """Test that stale cache entries are revalidated with their ETag"""
+    bazelisk_directory = self.make_bazelisk_directory()
+    requests = self.mock_remote({"https://example.com/a": "contents"})
+
+    for _ in range(2):
+      self.assertEqual(
+          bazel_version.get_cached_text_file(bazelisk_directory, "a",
+                                             "https://example.com/a"),
+          "contents")
+    # The second call was answered from the fresh cache.
+    self.assertEqual(requests, [("https://example.com/a", None)])
+
+    path = os.path.join(bazelisk_directory, "a")
+    os.utime(path, (0, 0))
+    self.assertEqual(
+        bazel_version.get_cached_text_file(bazelisk_directory, "a",
+                                           "https://example.com/a"), "contents")
+    self.assertEqual(requests[-1],
+                     ("https://example.com/a", "etag-https://example.com/a"))
+    # A "not modified" answer makes the cached copy fresh again.
+    self.assertGreater(os.path.getmtime(path), 0)
+
+  def test_resolve_version_rolling(self):
+    """Test resolving 'rolling' from the release bucket listing"""
+    bazelisk_directory = self.make_bazelisk_directory()
+    base = bazel_version.GCS_LIST_URL
+    requests = self.mock_remote({
+        base:
+            json.dumps({"prefixes": ["8.3.1/", "9.0.0/", "latest/"]}),
+        base + "&prefix=9.0.0%2Frolling%2F":
+            json.dumps({
+                "prefixes": [
+                    "9.0.0/rolling/9.0.0-pre.20250714.1/",
+                    "9.0.0/rolling/9.0.0-pre.20250811.2/",
+                    "9.0.0/rolling/9.0.0-pre.20250624.1/",
+                ]
+            }),
+    })
+
+    self.assertEqual(
+        bazel_version.resolve_version("rolling", bazelisk_directory),
+        "9.0.0-pre.20250811.2")
+    # The GitHub releases are not needed for rolling releases.
+    self.assertNotIn(bazel_version.RELEASES_URL, [url for url, _ in requests])
+
+  def test_resolve_version_last_green(self):
+    """Test resolving 'last_green' to a commit"""
+    bazelisk_directory = self.make_bazelisk_directory()
+    url = (
+        bazel_version.LAST_GREEN_COMMIT_BASE_PATH +
+        bazel_version.LAST_GREEN_COMMIT_PATH)
+    self.mock_remote({url: "0123456789abcdef\n"})
+
+    self.assertEqual(
+        bazel_version.resolve_version("last_green", bazelisk_directory),
+        "0123456789abcdef")
+
+  def test_resolve_version_last_downloaded(self):
+    """Test resolving 'last_downloaded' from the bazelisk downloads"""
+    bazelisk_directory = self.make_bazelisk_directory()
+    metadata = os.path.join(bazelisk_directory, "downloads", "metadata",
+                            "bazelbuild")
+    legacy = os.path.join(bazelisk_directory, "downloads", "bazelbuild")
+    os.makedirs(metadata)
+    os.makedirs(os.path.join(legacy, "bazel-6.5.0-linux-x86_64", "bin"))
+    for name, mtime in [("bazel-7.4.1-linux-x86_64", 300),
+                        ("bazel-8.0.0-darwin-arm64", 200)]:
+      path = os.path.join(metadata, name)
+      with open(path, "w") as f:
+        f.write("sha256")
+      os.utime(path, (mtime, mtime))
+    os.utime(os.path.join(legacy, "bazel-6.5.0-linux-x86_64"), (100, 100))
+
+    self.assertEqual(
+        bazel_version.get_downloaded_versions(bazelisk_directory), {
+            "7.4.1": 300,
+            "8.0.0": 200,
+            "6.5.0": 100
+        })
+    self.assertEqual(
+        bazel_version.resolve_version("last_downloaded", bazelisk_directory),
+        "7.4.1")
+
+  def make_downloads(self, bazelisk_directory, versions):
+    metadata = os.path.join(bazelisk_directory, "downloads", "metadata",
+                            "bazelbuild")
+    os.makedirs(metadata, exist_ok=True)
+    for version in versions:
+      with open(os.path.join(metadata, f"bazel-{version}-linux-x86_64"),
+                "w") as f:
+        f.write("sha256")
+
+  def test_resolve_version_local_first(self):
+    """Test answering from downloaded versions without network access"""
+    bazelisk_directory = self.make_bazelisk_directory()
+    self.make_downloads(
+        bazelisk_directory,
+        ["6.5.0", "7.3.0", "7.4.1", "8.0.0rc1", "9.0.0-pre.20250714.1"])
+    requests = self.mock_remote({})
+
+    for spec, expected in [("7.x", "7.4.1"), ("latest", "7.4.1"),
+                           ("8.*", "8.0.0rc1"), ("6.5.0", "6.5.0"),
+                           ("rolling", "9.0.0-pre.20250714.1")]:
+      self.assertEqual(
+          bazel_version.resolve_version(
+              spec, bazelisk_directory, local_first=True), expected)
+    self.assertEqual(requests, [])
+
+  def test_resolve_version_local_first_ignores_commits(self):
+    """Test that Bazel downloaded at a commit is not taken for a version"""
+    bazelisk_directory = self.make_bazelisk_directory()
+    self.make_downloads(
+        bazelisk_directory,
+        ["7.6.1", "8.4.0", "9a8b7c6d5e4f30211a2b3c4d5e6f708192a3b4c5"])
+    requests = self.mock_remote({})
+
+    for spec, expected in [("latest", "8.4.0"), ("8.x", "8.4.0"),
+                           ("last_rc", "8.4.0")]:
+      self.assertEqual(
+          bazel_version.resolve_version(
+              spec, bazelisk_directory, local_first=True), expected)
+    self.assertEqual(
+        bazel_version.resolve_installed_version("9.x", bazelisk_directory),
+        None)
+    self.assertEqual(requests, [])
+
+  def test_resolve_version_local_first_falls_back(self):
+    """Test that unsatisfiable requests still consult the network"""
+    bazelisk_directory = self.make_bazelisk_directory()
+    self.make_downloads(bazelisk_directory, ["7.4.1"])
+    self.mock_remote(
+        {bazel_version.RELEASES_URL: json.dumps(self.mock_releases)})
+
+    self.assertEqual(
+        bazel_version.resolve_version(
+            "6.x", bazelisk_directory, local_first=True), "6.2.0")
+
+  def test_get_installed_versions_manifest(self):
+    """Test that the downloads are only scanned again after changes"""
+    bazelisk_directory = self.make_bazelisk_directory()
+    self.make_downloads(bazelisk_directory, ["7.4.1"])
+
+    with mock.patch.object(
+        bazel_version,
+        "get_downloaded_versions",
+        wraps=bazel_version.get_downloaded_versions) as scan:
+      self.assertEqual(
+          bazel_version.get_installed_versions(bazelisk_directory), ["7.4.1"])
+      self.assertEqual(
+          bazel_version.get_installed_versions(bazelisk_directory), ["7.4.1"])
+      self.assertEqual(scan.call_count, 1)
+
+      self.make_downloads(bazelisk_directory, ["8.0.0"])
+      metadata = os.path.join(bazelisk_directory, "downloads", "metadata",
+                              "bazelbuild")
+      # Make sure the directory looks modified even on coarse clocks.
+      os.utime(metadata, ns=(0, 0))
+      self.assertEqual(
+          bazel_version.get_installed_versions(bazelisk_directory),
+          ["7.4.1", "8.0.0"])
+      self.assertEqual(scan.call_count, 2)
+
+  def start_server(self, body, delay=0.0):
+    """Starts a local server answering every request with `body`."""
+
+    class Handler(BaseHTTPRequestHandler):
+
+      def do_GET(self):
+        time.sleep(delay)
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+      def log_message(self, format, *args):
+        pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    self.addCleanup(server.server_close)
+    self.addCleanup(server.shutdown)
+    return f"http://127.0.0.1:{server.server_port}/releases"
+
+  @mock.patch.object(bazel_version, "DEFAULT_HEDGE_DELAY", 0.1)
+  def test_fetch_first_hedges_slow_source(self):
+    """Test that a stalled source is hedged by the next one"""
+    bazelisk_directory = self.make_bazelisk_directory()
+    slow = self.start_server('[{"tag_name": "1.0.0"}]', delay=3)
+    fast = self.start_server('[{"tag_name": "2.0.0"}]')
+
+    start = time.monotonic()
+    text, _ = bazel_version.fetch_first(
+        bazelisk_directory, [slow, fast],
+        validate=bazel_version.validate_releases)
+    self.assertLess(time.monotonic() - start, 2)
+    self.assertEqual(json.loads(text), [{"tag_name": "2.0.0"}])
+    # The winner's latency is remembered for later hedging decisions.
+    self.assertIn(fast, bazel_version.load_latencies(bazelisk_directory))
+
+  def test_fetch_first_skips_invalid_answer(self):
+    """Test that an invalid answer moves on to the next source"""
+    bazelisk_directory = self.make_bazelisk_directory()
+    rate_limited = self.start_server('{"message": "API rate limit exceeded"}')
+    snapshot = os.path.join(bazelisk_directory, "snapshot.json")
+    with open(snapshot, "w") as f:
+      f.write('[{"tag_name": "3.0.0"}]')
+
+    text, _ = bazel_version.fetch_first(
+        bazelisk_directory, [rate_limited, "file://" + snapshot],
+        validate=bazel_version.validate_releases)
+    self.assertEqual(json.loads(text), [{"tag_name": "3.0.0"}])
+
+  @mock.patch.object(bazel_version, "DEFAULT_HEDGE_DELAY", 0.1)
+  def test_fetch_first_deadline(self):
+    """Test that stalled sources give up after the deadline"""
+    bazelisk_directory = self.make_bazelisk_directory()
+    urls = [self.start_server("[]", delay=3), self.start_server("[]", delay=3)]
+
+    start = time.monotonic()
+    with self.assertRaises(RuntimeError):
+      bazel_version.fetch_first(
+          bazelisk_directory, urls, deadline=bazel_version.make_deadline(0.3))
+    self.assertLess(time.monotonic() - start, 1)
+
+  def test_resolve_version_total_deadline(self):
+    """Test that one deadline bounds all the fetches of a resolution"""
+    bazelisk_directory = self.make_bazelisk_directory()
+    base = bazel_version.GCS_LIST_URL
+    responses = {
+        base: json.dumps({"prefixes": ["9.0.0/"]}),
+        base + "&prefix=9.0.0%2Frolling%2F": json.dumps({"prefixes": []}),
+    }
+    requests = []
+
+    def read(url, etag=None, timeout=None):
+      # Each listing alone is well within the budget.
+      requests.append(url)
+      time.sleep(0.2)
+      return responses[url], None
+
+    start = time.monotonic()
+    with mock.patch.object(
+        bazel_version, "read_remote_text_file_if_modified", side_effect=read):
+      with self.assertRaisesRegex(RuntimeError, "deadline exceeded"):
+        bazel_version.resolve_version(
+            "rolling",
+            bazelisk_directory,
+            deadline=bazel_version.make_deadline(0.3))
+    self.assertLess(time.monotonic() - start, 0.6)
+    self.assertEqual(len(requests), 2)
+
+  def run_main(self, argv, env=None):
+    with mock.patch.object(sys, "argv", ["bazel_version.py"] + argv), \
+        mock.patch.dict(os.environ, env or {}), \
+        mock.patch.object(bazel_version, "get_bazelisk_directory",
+                          return_value=self.make_bazelisk_directory()), \
+        mock.patch.object(bazel_version, "resolve_version",
+                          return_value="8.4.0") as resolve, \
+        mock.patch("sys.stdout", new_callable=StringIO), \
+        mock.patch("sys.stderr", new_callable=StringIO) as stderr:
+      try:
+        exit_code = bazel_version.main()
+      except SystemExit as e:
+        exit_code = e.code
+    return exit_code, resolve, stderr.getvalue()
+
+  def test_main_passes_sources_and_deadline(self):
+    """Test that main hands its settings to resolve_version"""
+    start = time.monotonic()
+    exit_code, resolve, _ = self.run_main([
+        "--releases-source", "file:///a", "--releases-source", "file:///b",
+        "latest"
+    ],
+                                          env={bazel_version.DEADLINE_ENV: "5"})
+    self.assertEqual(exit_code, 0)
+    kwargs = resolve.call_args.kwargs
+    self.assertEqual(kwargs["sources"], ["file:///a", "file:///b"])
+    self.assertAlmostEqual(kwargs["deadline"] - start, 5, delta=1)
+    self.assertNotIn(bazel_version.RELEASES_SOURCES_ENV, os.environ)
+
+  def test_main_invalid_deadline(self):
+    """Test that a bad $BAZEL_VERSION_DEADLINE is a usage error"""
+    exit_code, resolve, stderr = self.run_main(
+        ["latest"], env={bazel_version.DEADLINE_ENV: "soon"})
+    self.assertEqual(exit_code, 2)
+    self.assertIn(bazel_version.DEADLINE_ENV, stderr)
+    resolve.assert_not_called()
+
+  def test_get_hedge_delay(self):
+    """Test the hedge delay derived from the latency history"""
+    self.assertEqual(
+        bazel_version.get_hedge_delay({}, "a"),
+        bazel_version.DEFAULT_HEDGE_DELAY)
+    latencies = {"a": [0.1 * i for i in range(1, 11)]}
+    self.assertAlmostEqual(bazel_version.get_hedge_delay(latencies, "a"), 1.0)
+    self.assertEqual(
+        bazel_version.get_hedge_delay({"a": [0.0]}, "a"),
+        bazel_version.MIN_HEDGE_DELAY)
+
+  def test_watch_reports_changes(self):
+    """Test that watch only reports changed resolutions and backs off"""
+    bazelisk_directory = self.make_bazelisk_directory()
+    releases = [{"tag_name": "8.4.0", "prerelease": False}]
+    requests = []
+
+    def read(url, etag=None, timeout=None):
+      text = json.dumps(releases)
+      new_etag = f"etag-{len(releases)}"
+      requests.append(etag)
+      return (None, etag) if etag == new_etag else (text, new_etag)
+
+    patcher = mock.patch.object(
+        bazel_version, "read_remote_text_file_if_modified", side_effect=read)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+    delays = []
+
+    def sleep(delay):
+      delays.append(delay)
+      if len(delays) == 3:
+        releases.append({"tag_name": "9.0.0rc1", "prerelease": True})
+
+    events = []
+    bazel_version.watch(["latest", "last_rc", "9.x"],
+                        bazelisk_directory,
+                        events.append,
+                        interval=10,
+                        max_interval=20,
+                        sleep=sleep,
+                        max_polls=6)
+
+    self.assertEqual(len(events), 1)
+    self.assertEqual(events[0]["changed"],
+                     {"last_rc": {
+                         "from": "8.4.0",
+                         "to": "9.0.0rc1"
+                     }})
+    self.assertEqual(events[0]["versions"], {
+        "latest": "8.4.0",
+        "last_rc": "9.0.0rc1",
+        "9.x": None
+    })
+    # Quiet polls slow down, a change resets the interval.
+    self.assertEqual(delays, [10, 15, 20, 10, 15, 20])
+    # Every poll after the first one is conditional.
+    self.assertEqual(requests, [None] + ["etag-1"] * 3 + ["etag-2"] * 2)
+    # The cache on disk is kept up to date for other invocations.
+    with open(os.path.join(bazelisk_directory, "releases.json")) as f:
+      self.assertEqual(json.load(f), releases)
+
+  def test_watch_starts_from_cache(self):
+    """Test that watch revalidates the cached release list"""
+    bazelisk_directory = self.make_bazelisk_directory()
+    url = bazel_version.RELEASES_URL
+    requests = self.mock_remote({url: json.dumps(self.mock_releases)})
+    bazel_version.get_releases_json(bazelisk_directory)
+
+    bazel_version.watch(["latest"],
+                        bazelisk_directory,
+                        self.fail,
+                        sleep=lambda _: None,
+                        max_polls=2)
+    self.assertEqual(requests[1:], [(url, f"etag-{url}")] * 2)
+
   @mock.patch('sys.stdout', new_callable=StringIO)
   @mock.patch('sys.argv')
   def test_main_no_args(self, mock_argv, mock_stdout):
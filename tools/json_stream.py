@@ -0,0 +1,143 @@
+__doc__ = """
+Reads large JSON documents incrementally from a file.
+
+Only the value being decoded is held in memory, so lock files and trace
+profiles of any size are processed with a small, bounded buffer. Used by
+maven_prefetch.py and bazel_profile.py.
+"""
+
+import json
+import json.scanner
+import re
+
+CHUNK_SIZE = 64 * 1024
+# A single array element larger than this means the input is corrupt.
+MAX_VALUE_SIZE = 64 * 1024 * 1024
+SEPARATOR = re.compile(r"[ \t\r\n]*(,[ \t\r\n]*)?")
+
+
+class JsonReader:
+  """Reads the values of a JSON document from a file one at a time.
+
+  The document is consumed from the front: value() decodes the next value
+  whole, while members() and array() step into an object or array and
+  leave the reader positioned after it once exhausted.
+  """
+
+  def __init__(self, f, chunk_size=CHUNK_SIZE):
+    self.f = f
+    self.buffer = ""
+    self.position = 0
+    self.decoder = json.JSONDecoder()
+    self.scan = json.scanner.make_scanner(self.decoder)
+    self.chunk_size = chunk_size
+    self.read_size = chunk_size
+
+  def fill(self):
+    """Reads more input, returns False at the end of the file."""
+    data = self.f.read(self.read_size)
+    if not data:
+      return False
+    self.buffer = self.buffer[self.position:] + data
+    self.position = 0
+    return True
+
+  def next_char(self):
+    """Skips whitespace, returns the next character or "" at the end."""
+    while True:
+      while (self.position < len(self.buffer) and
+             self.buffer[self.position] in " \t\r\n"):
+        self.position += 1
+      if self.position < len(self.buffer):
+        return self.buffer[self.position]
+      if not self.fill():
+        return ""
+
+  def expect(self, chars):
+    char = self.next_char()
+    if not char or char not in chars:
+      raise ValueError(f"Expected one of {chars!r}, found {char!r}")
+    self.position += 1
+    return char
+
+  def value(self):
+    """Decodes the next complete value."""
+    self.next_char()
+    try:
+      while True:
+        try:
+          value, end = self.decoder.raw_decode(self.buffer, self.position)
+          # A number may continue in the next chunk.
+          if end < len(self.buffer) or not isinstance(value, (int, float)):
+            self.position = end
+            return value
+        except json.JSONDecodeError:
+          pass
+        if not self.fill():
+          value, self.position = self.decoder.raw_decode(
+              self.buffer, self.position)
+          return value
+        # Grow the reads so that long values are decoded in linear time.
+        self.read_size *= 2
+    finally:
+      self.read_size = self.chunk_size
+
+  def members(self):
+    """Yields the (key, reader) pairs of the object that starts next.
+
+    The consumer either calls value() or steps into the member's value with
+    members() or array(); it must do so before advancing.
+    """
+    self.expect("{")
+    if self.next_char() == "}":
+      self.position += 1
+      return
+    while True:
+      key = self.value()
+      self.expect(":")
+      yield key, self
+      if self.expect(",}") == "}":
+        return
+
+  def array(self, max_size=MAX_VALUE_SIZE):
+    """Yields the elements of the array that starts next.
+
+    Raises ValueError for an element that does not fit in `max_size`
+    characters.
+    """
+    self.expect("[")
+    expect_value = True
+    while True:
+      char = self.next_char()
+      if not char:
+        raise ValueError("Unexpected end of JSON input")
+      if char == "]":
+        self.position += 1
+        return
+      if not expect_value:
+        self.expect(",")
+        expect_value = True
+        continue
+
+      # The hot loop: scan elements and separators straight off the buffer.
+      buffer = self.buffer
+      start = position = self.position
+      try:
+        while expect_value and position < len(buffer):
+          value, position = self.scan(buffer, position)
+          if position == len(buffer) and isinstance(value, (int, float)):
+            # A number may continue in the next chunk.
+            raise StopIteration(position)
+          separator = SEPARATOR.match(buffer, position)
+          self.position = position = separator.end()
+          expect_value = separator.group(1) is not None
+          yield value
+      except (StopIteration, json.JSONDecodeError):
+        # The element continues in the next chunk. Grow the reads while a
+        # single element spans several of them.
+        if self.position == start:
+          self.read_size *= 2
+        else:
+          self.read_size = self.chunk_size
+        if len(buffer) - self.position > max_size or not self.fill():
+          raise ValueError(f"Invalid JSON value at offset {self.position}")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Unit tests for json_stream.py
+"""
+
+import io
+import json
+import os
+import sys
+import unittest
+
+# Add the parent directory to the path so we can import json_stream
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import json_stream
+
+DOCUMENT = {
+    "version": 2,
+    "empty": {},
+    "objects": {
+        "a": {
+            "list": [1, 2.5, "three", None]
+        },
+        "b": "x" * 300,
+    },
+    "numbers": [12345, -6.75e3, 0, 987654321],
+    "events": [{
+        "name": "n" * 200,
+        "ts": 100
+    }, {
+        "name": "second",
+        "args": {}
+    }, [], "text", True],
+    "last": 1234567,
+}
+
+
+class TestJsonStream(unittest.TestCase):
+  """Test cases for json_stream.py"""
+
+  def read(self, reader):
+    """Reads a member with each of the reader's entry points."""
+    result = {}
+    for key, member in reader.members():
+      if key == "objects":
+        result[key] = {k: v.value() for k, v in member.members()}
+      elif key in ("numbers", "events"):
+        result[key] = list(member.array())
+      elif key == "empty":
+        result[key] = dict(member.members())
+      else:
+        result[key] = member.value()
+    return result
+
+  def test_chunk_boundaries(self):
+    """Test that values split across chunks decode like json.loads does"""
+    for indent in (None, 1):
+      text = json.dumps(DOCUMENT, indent=indent)
+      for chunk_size in (1, 2, 7, 4096):
+        with self.subTest(indent=indent, chunk_size=chunk_size):
+          reader = json_stream.JsonReader(io.StringIO(text), chunk_size)
+          self.assertEqual(self.read(reader), DOCUMENT)
+          self.assertEqual(reader.next_char(), "")
+          self.assertEqual(reader.read_size, chunk_size)
+
+  def test_top_level_array(self):
+    text = json.dumps(DOCUMENT["numbers"] + DOCUMENT["events"])
+    for chunk_size in (1, 3, 4096):
+      with self.subTest(chunk_size=chunk_size):
+        reader = json_stream.JsonReader(io.StringIO(text), chunk_size)
+        self.assertEqual(
+            list(reader.array()), DOCUMENT["numbers"] + DOCUMENT["events"])
+
+  def test_empty_containers(self):
+    reader = json_stream.JsonReader(io.StringIO(" { } [ ] "), 1)
+    self.assertEqual(list(reader.members()), [])
+    self.assertEqual(list(reader.array()), [])
+    self.assertEqual(reader.next_char(), "")
+
+  def test_invalid_input(self):
+    text = json.dumps(DOCUMENT["events"])
+    reader = json_stream.JsonReader(io.StringIO(text[:-5]), 4)
+    with self.assertRaises(ValueError):
+      list(reader.array())
+
+    reader = json_stream.JsonReader(io.StringIO(text), 4)
+    with self.assertRaises(ValueError):
+      list(reader.array(max_size=50))
+
+    reader = json_stream.JsonReader(io.StringIO("[1] "), 4)
+    with self.assertRaises(ValueError):
+      list(reader.members())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+__doc__ = """
+Fills Bazel's repository cache with the artifacts pinned in maven_install.json.
+
+Every artifact of the lock file is stored under
+<repository_cache>/content_addressable/sha256/<sha256>/file, where Bazel
+finds it without downloading it again. Artifacts already in the cache are
+skipped; the others are downloaded concurrently, hashed while they stream
+to disk and only renamed into place when the hash matches the lock file.
+
+The lock file is read incrementally: with --mirror, downloads start while
+the artifact list is still being read, otherwise as soon as the repository
+list that follows it names where each artifact lives.
+
+Usage:
+  maven_prefetch.py [--lock-file maven_install.json] [--mirror URL]
+                    [--repository-cache DIR] [--jobs 16]
+"""
+
+import argparse
+import concurrent.futures
+import getpass
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from contextlib import closing
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+try:
+  from tools import json_stream
+except ImportError:
+  import json_stream
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHUNK_SIZE = 64 * 1024
+DOWNLOAD_TIMEOUT = 60
+
+
+def default_repository_cache():
+  """Returns the repository cache Bazel uses when none is configured."""
+  user = getpass.getuser()
+  if sys.platform == "darwin":
+    base_dir = f"/private/var/tmp/_bazel_{user}"
+  elif sys.platform.startswith("linux"):
+    base_dir = os.path.join(
+        os.path.expanduser("~"), ".cache", "bazel", f"_bazel_{user}")
+  else:
+    raise Exception("Pass --repository-cache on this platform")
+  return os.path.join(base_dir, "cache", "repos", "v1")
+
+
+def artifact_path(coordinates, version):
+  """Returns the repository path of an artifact.
+
+  `coordinates` are "group:artifact[:packaging[:classifier]]" as used as
+  keys in maven_install.json.
+  """
+  parts = coordinates.split(":")
+  group, artifact = parts[0], parts[1]
+  packaging = parts[2] if len(parts) > 2 else "jar"
+  classifier = f"-{parts[3]}" if len(parts) > 3 else ""
+  return (f"{group.replace('.', '/')}/{artifact}/{version}/"
+          f"{artifact}-{version}{classifier}.{packaging}")
+
+
+def read_lock_file(f, on_artifact, on_repository):
+  """Streams the artifacts and repositories of a maven_install.json.
+
+  Calls on_artifact(coordinates, version, sha256) for every artifact with a
+  hash and on_repository(url, [coordinates]) for every repository.
+  """
+  reader = json_stream.JsonReader(f, CHUNK_SIZE)
+  for key, member in reader.members():
+    if key == "artifacts":
+      for coordinates, value in member.members():
+        artifact = value.value()
+        sha256 = artifact.get("shasums", {}).get("jar")
+        if sha256:
+          on_artifact(coordinates, artifact["version"], sha256)
+    elif key == "repositories":
+      for url, value in member.members():
+        on_repository(url, value.value())
+    else:
+      member.value()
+
+
+def cache_entry(repository_cache, sha256):
+  return os.path.join(repository_cache, "content_addressable", "sha256", sha256,
+                      "file")
+
+
+def download(urls, sha256, path):
+  """Downloads the first of `urls` that has the artifact into `path`.
+
+  Returns the number of bytes downloaded.
+  """
+  directory = os.path.dirname(path)
+  os.makedirs(directory, exist_ok=True)
+  errors = []
+  for url in urls:
+    fd, temp_path = tempfile.mkstemp(
+        dir=directory, prefix="file.", suffix=".tmp")
+    try:
+      hasher = hashlib.sha256()
+      size = 0
+      with os.fdopen(fd, "wb") as out, \
+          closing(urlopen(url, timeout=DOWNLOAD_TIMEOUT)) as res:
+        while True:
+          chunk = res.read(CHUNK_SIZE)
+          if not chunk:
+            break
+          hasher.update(chunk)
+          out.write(chunk)
+          size += len(chunk)
+      digest = hasher.hexdigest()
+      if digest != sha256:
+        raise ValueError(f"sha256 mismatch: {digest} != {sha256}")
+      os.replace(temp_path, path)
+      return size
+    except (OSError, ValueError) as e:
+      if not isinstance(e, HTTPError) or e.code != 404:
+        errors.append(f"{url}: {e}")
+    finally:
+      if os.path.exists(temp_path):
+        os.remove(temp_path)
+  raise RuntimeError("; ".join(errors) or "not found in any repository")
+
+
+def prefetch(lock_file, repository_cache, mirror=None, jobs=16, log=None):
+  """Downloads the artifacts of `lock_file` missing from the cache.
+
+  Returns a dict with the number of "downloaded", "present" and "failed"
+  artifacts and the "bytes" downloaded.
+  """
+  stats = {"downloaded": 0, "present": 0, "failed": 0, "bytes": 0}
+  pending = {}
+  futures = {}
+  seen = set()
+
+  def submit(coordinates, version, sha256, repositories):
+    path = artifact_path(coordinates, version)
+    urls = [repository.rstrip("/") + "/" + path for repository in repositories]
+    future = executor.submit(download, urls, sha256,
+                             cache_entry(repository_cache, sha256))
+    futures[future] = coordinates
+
+  def on_artifact(coordinates, version, sha256):
+    if sha256 in seen:
+      return
+    seen.add(sha256)
+    if os.path.exists(cache_entry(repository_cache, sha256)):
+      stats["present"] += 1
+    elif mirror:
+      submit(coordinates, version, sha256, [mirror])
+    else:
+      pending[coordinates] = (version, sha256, [])
+
+  def on_repository(url, coordinates_list):
+    for coordinates in coordinates_list:
+      if coordinates in pending:
+        pending[coordinates][2].append(url)
+
+  with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+    with open(lock_file, "r", encoding="utf-8") as f:
+      read_lock_file(f, on_artifact, on_repository)
+
+    for coordinates, (version, sha256, repositories) in pending.items():
+      if repositories:
+        submit(coordinates, version, sha256, repositories)
+      else:
+        stats["failed"] += 1
+        if log:
+          log(f"{coordinates}: no repository listed")
+
+    for future in concurrent.futures.as_completed(futures):
+      coordinates = futures[future]
+      try:
+        stats["bytes"] += future.result()
+        stats["downloaded"] += 1
+      except Exception as e:
+        stats["failed"] += 1
+        if log:
+          log(f"{coordinates}: {e}")
+
+  return stats
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(
+      description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument(
+      "--lock-file", default=os.path.join(ROOT_DIR, "maven_install.json"))
+  parser.add_argument(
+      "--mirror",
+      default=os.environ.get("MAVEN_PREFETCH_MIRROR"),
+      help="Maven repository to download everything from, "
+      "instead of the repositories in the lock file.")
+  parser.add_argument(
+      "--repository-cache",
+      help="Bazel's --repository_cache (default: Bazel's "
+      "default location).")
+  parser.add_argument("--jobs", type=int, default=16)
+  args = parser.parse_args(argv)
+  if args.jobs < 1:
+    parser.error("--jobs must be at least 1")
+
+  try:
+    repository_cache = args.repository_cache or default_repository_cache()
+    stats = prefetch(
+        args.lock_file,
+        repository_cache,
+        mirror=args.mirror,
+        jobs=args.jobs,
+        log=lambda m: print(f"WARN: {m}", file=sys.stderr))
+  except Exception as e:
+    print(f"Error: {e}", file=sys.stderr)
+    return 1
+
+  print(f"{stats['downloaded']} downloaded ({stats['bytes']} bytes), "
+        f"{stats['present']} already present, {stats['failed']} failed")
+  return 1 if stats["failed"] else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Unit tests for maven_prefetch.py
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+# Add the parent directory to the path so we can import maven_prefetch
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools import maven_prefetch
+
+
+class TestMavenPrefetch(unittest.TestCase):
+  """Test cases for maven_prefetch.py"""
+
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.tmp)
+    self.cache = os.path.join(self.tmp, "cache")
+    self.files = {
+        "/com/example/lib/1.0/lib-1.0.jar": b"lib jar",
+        "/com/example/ui/2.0/ui-2.0.aar": b"ui aar",
+    }
+    self.requests = []
+    self.url = self.start_server()
+
+  def start_server(self):
+    files = self.files
+    requests = self.requests
+
+    class Handler(BaseHTTPRequestHandler):
+
+      def do_GET(self):
+        requests.append(self.path)
+        path = self.path.removeprefix("/maven2")
+        if path not in files:
+          self.send_error(404)
+          return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(files[path])))
+        self.end_headers()
+        self.wfile.write(files[path])
+
+      def log_message(self, format, *args):
+        pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    self.addCleanup(server.server_close)
+    self.addCleanup(server.shutdown)
+    return f"http://127.0.0.1:{server.server_port}"
+
+  def write_lock_file(self, sha256s=None):
+    sha256s = sha256s or {}
+    lock = {
+        "artifacts": {
+            "com.example:lib": {
+                "shasums": {
+                    "jar":
+                        sha256s.get("lib")
+                        or hashlib.sha256(b"lib jar").hexdigest()
+                },
+                "version": "1.0"
+            },
+            "com.example:ui:aar": {
+                "shasums": {
+                    "jar": hashlib.sha256(b"ui aar").hexdigest()
+                },
+                "version": "2.0"
+            },
+        },
+        "dependencies": {
+            "com.example:ui:aar": ["com.example:lib"]
+        },
+        "repositories": {
+            "https://missing.invalid/": [],
+            self.url + "/maven2/": ["com.example:lib", "com.example:ui:aar"],
+        },
+        "version": "2"
+    }
+    path = os.path.join(self.tmp, "maven_install.json")
+    with open(path, "w") as f:
+      json.dump(lock, f, indent=2)
+    return path
+
+  def read_entry(self, content):
+    path = maven_prefetch.cache_entry(self.cache,
+                                      hashlib.sha256(content).hexdigest())
+    with open(path, "rb") as f:
+      return f.read()
+
+  def test_reader_matches_json(self):
+    """Test that the streaming reader sees what json.load sees"""
+    lock_file = os.path.join(maven_prefetch.ROOT_DIR, "maven_install.json")
+    with open(lock_file) as f:
+      expected = json.load(f)
+
+    artifacts = {}
+    repositories = {}
+    # Tiny reads exercise values split across chunk boundaries.
+    with mock.patch.object(maven_prefetch, "CHUNK_SIZE", 7), \
+        open(lock_file) as f:
+      maven_prefetch.read_lock_file(
+          f, lambda c, v, s: artifacts.update(
+              {c: {
+                  "shasums": {
+                      "jar": s
+                  },
+                  "version": v
+              }}), repositories.__setitem__)
+    self.assertEqual(artifacts, expected["artifacts"])
+    self.assertEqual(repositories, expected["repositories"])
+
+  def test_artifact_path(self):
+    self.assertEqual(
+        maven_prefetch.artifact_path("androidx.activity:activity:aar", "1.8.0"),
+        "androidx/activity/activity/1.8.0/activity-1.8.0.aar")
+    self.assertEqual(
+        maven_prefetch.artifact_path("com.example:lib:jar:sources", "1.0"),
+        "com/example/lib/1.0/lib-1.0-sources.jar")
+
+  def test_prefetch_from_repositories(self):
+    """Test that missing artifacts are downloaded into the cache layout"""
+    stats = maven_prefetch.prefetch(self.write_lock_file(), self.cache, jobs=2)
+    self.assertEqual(stats, {
+        "downloaded": 2,
+        "present": 0,
+        "failed": 0,
+        "bytes": 13
+    })
+    self.assertEqual(self.read_entry(b"lib jar"), b"lib jar")
+    self.assertEqual(self.read_entry(b"ui aar"), b"ui aar")
+
+    # Everything is present now.
+    self.requests.clear()
+    stats = maven_prefetch.prefetch(self.write_lock_file(), self.cache)
+    self.assertEqual(stats["present"], 2)
+    self.assertEqual(self.requests, [])
+
+  def test_prefetch_from_mirror(self):
+    """Test that a mirror replaces the repositories of the lock file"""
+    stats = maven_prefetch.prefetch(
+        self.write_lock_file(), self.cache, mirror=self.url)
+    self.assertEqual(stats["downloaded"], 2)
+    self.assertTrue(all(not r.startswith("/maven2") for r in self.requests))
+
+  def test_prefetch_rejects_hash_mismatch(self):
+    """Test that an artifact not matching its hash is not cached"""
+    wrong = hashlib.sha256(b"other").hexdigest()
+    messages = []
+    stats = maven_prefetch.prefetch(
+        self.write_lock_file({"lib": wrong}), self.cache, log=messages.append)
+    self.assertEqual(stats["failed"], 1)
+    self.assertIn("sha256 mismatch", messages[0])
+    directory = os.path.dirname(maven_prefetch.cache_entry(self.cache, wrong))
+    self.assertEqual(os.listdir(directory), [])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+
+__doc__ = """Benchmark the pre-commit hook wrappers.
+
+Every hook is timed, including interpreter startup, in three phases:
+  cold    the tool is downloaded (or built) into an empty tool store
+  warm    the tool is installed and one formatted file is given, so this is
+          mostly startup and tool verification
+  steady  --files freshly generated, unformatted files are formatted
+
+Tool downloads are served by a local HTTP server from --artifacts (by
+default the wrappers' own bin directory, so run the hooks once first), so
+no network access is needed. The wrappers are copied into a scratch
+directory with a private tool store; the real bin directory is not touched.
+
+On platforms without a pinned prebuilt buildifier, a cold install fetches
+and builds buildifier from GitHub. Its cold phase is skipped there and the
+buildifier from --artifacts is put into the private store the way a build
+would, so the other phases stay offline.
+
+Results are written as JSON. With --baseline, they are compared with an
+earlier result and the exit code is 1 if any phase regressed.
+"""
+
+import argparse
+import functools
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import hook_util
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+ROOT_DIR = SCRIPT_DIR.parent.parent
+
+# Configuration files the formatters look up from the formatted files.
+CONFIG_FILES = ['.clang-format', '.swift-format']
+
+PHASES = ['cold', 'warm', 'steady']
+
+
+def clang_format_artifacts(module):
+  return {
+      data["object_name"]: 'clang-format' for data in module.CLANG_FORMAT_DATA
+  }
+
+
+def google_java_format_artifacts(module):
+  return {
+      os.path.basename(module.GOOGLE_JAVA_FORMAT_URL): 'google-java-format.jar'
+  }
+
+
+def ktfmt_artifacts(module):
+  return {os.path.basename(module.KTFMT_URL): 'ktfmt.jar'}
+
+
+def buildifier_artifacts(module):
+  return {
+      os.path.basename(data["url"]): 'buildifier'
+      for data in module.BUILDIFIER_DATA
+  }
+
+
+def buildifier_cold_skipped(module):
+  if module.prebuilt_data() is None:
+    return 'no prebuilt buildifier for this platform, it would be built'
+  return None
+
+
+def seed_buildifier(module, artifacts):
+  """Stores the buildifier from `artifacts` as if it had been built."""
+  binary = artifacts / 'buildifier'
+  if not binary.is_file():
+    raise RuntimeError(f'{binary} not found, run the hook once first')
+  sha256 = hook_util.sha256_file(binary)
+  entry = hook_util.store_path(sha256)
+  with hook_util.file_lock(hook_util.lock_path_for(entry)):
+    hook_util.add_to_store(None, sha256, mode=0o755, seed=binary)
+  module.write_built_ref(sha256)
+
+
+def generate_java(index, lines, rng):
+  body = []
+  for j in range(lines // 3):
+    body.append(f'  public int method{j}(int a,int b){{ if(a>b){{return a-b;}}'
+                f' else {{return   b-a+{rng.randint(0, 99)};}} }}\n')
+  return f'package bench;\n\npublic class Gen{index}{{\n{"".join(body)}}}\n'
+
+
+def generate_kotlin(index, lines, rng):
+  body = []
+  for j in range(lines // 3):
+    body.append(f'  fun method{j}(a:Int,b:Int):Int{{ return if(a>b) a-b'
+                f' else   b-a+{rng.randint(0, 99)} }}\n')
+  return f'package bench\n\nclass Gen{index}{{\n{"".join(body)}}}\n'
+
+
+def generate_cpp(index, lines, rng):
+  body = []
+  for j in range(lines // 3):
+    body.append(f'int method{j}(int a,int b){{if(a>b){{return a-b;}}'
+                f'return   b-a+{rng.randint(0, 99)};}}\n')
+  return f'namespace gen{index} {{\n{"".join(body)}}}\n'
+
+
+def generate_build(index, lines, rng):
+  body = []
+  for j in range(lines // 3):
+    srcs = ', '.join(f'"f{rng.randint(0, 99)}.txt"' for _ in range(3))
+    body.append(f'filegroup( name="group{j}",srcs=[{srcs}], )\n')
+  return ''.join(body)
+
+
+def generate_swift(index, lines, rng):
+  body = []
+  for j in range(lines // 3):
+    body.append(f'  func method{j}(a:Int,b:Int)->Int{{ if a>b {{return a-b}};'
+                f' return   b-a+{rng.randint(0, 99)} }}\n')
+  return f'struct Gen{index}{{\n{"".join(body)}}}\n'
+
+
+HOOKS = {
+    'clang-format': {
+        'script': 'run-clang-format.py',
+        'path': 'src/gen{index}.cc',
+        'generate': generate_cpp,
+        'requires': [],
+        'artifacts': clang_format_artifacts,
+    },
+    'google-java-format': {
+        'script': 'run-google-java-format.py',
+        'path': 'src/Gen{index}.java',
+        'generate': generate_java,
+        'requires': ['java'],
+        'artifacts': google_java_format_artifacts,
+    },
+    'ktfmt': {
+        'script': 'run-ktfmt.py',
+        'path': 'src/Gen{index}.kt',
+        'generate': generate_kotlin,
+        'requires': ['java'],
+        'artifacts': ktfmt_artifacts,
+    },
+    'buildifier': {
+        'script': 'run-buildifier.py',
+        'path': 'src/pkg{index}/BUILD',
+        'generate': generate_build,
+        'requires': [],
+        'artifacts': buildifier_artifacts,
+        # Returns why the cold phase cannot run offline, if it cannot.
+        'cold_skipped': buildifier_cold_skipped,
+        'seed': seed_buildifier,
+    },
+    'swift-format': {
+        'script': 'run-swift-format.py',
+        'path': 'src/Gen{index}.swift',
+        'generate': generate_swift,
+        'requires': ['swift'],
+        'artifacts': lambda module: {},
+    },
+}
+
+
+class ArtifactHandler(SimpleHTTPRequestHandler):
+  """Serves tool artifacts by the last component of the request path.
+
+  Artifacts may also be stored under the name the wrappers install them as,
+  so a wrapper's bin directory can be served directly.
+  """
+
+  def __init__(self, *args, artifacts, routes, stats, **kwargs):
+    self.artifacts = artifacts
+    self.routes = routes
+    self.stats = stats
+    super().__init__(*args, **kwargs)
+
+  def do_GET(self):
+    name = self.path.split('?', 1)[0].rsplit('/', 1)[-1]
+    path = self.artifacts / name
+    if not path.is_file() and name in self.routes:
+      path = self.artifacts / self.routes[name]
+    if not path.is_file():
+      self.send_error(404)
+      return
+
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/octet-stream')
+    self.send_header('Content-Length', str(path.stat().st_size))
+    self.end_headers()
+    with open(path, 'rb') as f:
+      shutil.copyfileobj(f, self.wfile)
+    self.stats['bytes_served'] += path.stat().st_size
+
+  def log_message(self, format, *args):
+    pass
+
+
+def time_command(cmd, cwd, env):
+  start = time.perf_counter()
+  r = subprocess.run(
+      cmd, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+  elapsed = time.perf_counter() - start
+  if r.returncode != 0:
+    stderr = r.stderr.decode('utf-8', 'replace').strip().splitlines()
+    raise RuntimeError(f"{' '.join(cmd)} failed: "
+                       f"{stderr[-1] if stderr else r.returncode}")
+  return elapsed
+
+
+def summarize(runs):
+  return {
+      'median': statistics.median(runs),
+      'min': min(runs),
+      'runs': runs,
+  }
+
+
+def write_files(workspace, hook, count, lines, seed):
+  rng = random.Random(seed)
+  files = []
+  for index in range(count):
+    path = workspace / hook['path'].format(index=index)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(hook['generate'](index, lines, rng))
+    files.append(str(path.relative_to(workspace)))
+  return files
+
+
+def benchmark_hook(name, module, args, workspace, env):
+  hook = HOOKS[name]
+  for tool in hook['requires']:
+    if not shutil.which(tool):
+      return {'skipped': f'{tool} not found'}
+
+  hooks_dir = workspace / 'hooks'
+  cmd = [sys.executable, str(hooks_dir / hook['script'])]
+  result = {}
+
+  def reset_tools():
+    shutil.rmtree(hooks_dir / 'bin', ignore_errors=True)
+    (hooks_dir / 'bin').mkdir()
+    shutil.rmtree(env['PRE_COMMIT_TOOL_STORE'], ignore_errors=True)
+
+  try:
+    cold_skipped = hook.get('cold_skipped', lambda module: None)(module)
+    if cold_skipped:
+      reset_tools()
+      hook['seed'](module, args.artifacts.resolve())
+      files = write_files(workspace, hook, 1, args.lines, seed=0)
+      time_command(cmd + files, workspace, env)
+      result['cold'] = {'skipped': cold_skipped}
+    else:
+      runs = []
+      for i in range(args.repeat):
+        reset_tools()
+        files = write_files(workspace, hook, 1, args.lines, seed=i)
+        runs.append(time_command(cmd + files, workspace, env))
+      result['cold'] = summarize(runs)
+
+    # The last cold run left a formatted file behind.
+    result['warm'] = summarize(
+        [time_command(cmd + files, workspace, env) for _ in range(args.repeat)])
+
+    runs = []
+    for i in range(args.repeat):
+      files = write_files(workspace, hook, args.files, args.lines, seed=i)
+      runs.append(time_command(cmd + files, workspace, env))
+    result['steady'] = summarize(runs)
+  except RuntimeError as e:
+    result['error'] = str(e)
+  finally:
+    shutil.rmtree(workspace / 'src', ignore_errors=True)
+
+  return result
+
+
+def compare(baseline, current, threshold, min_delta):
+  """Prints a comparison table and returns the list of regressions."""
+  regressions = []
+  print(f"{'hook':<20} {'phase':<7} {'baseline':>10} {'current':>10} "
+        f"{'change':>8}")
+  for name, phases in current['hooks'].items():
+    base_phases = baseline.get('hooks', {}).get(name, {})
+    for phase in PHASES:
+      if ('median' not in phases.get(phase, {}) or
+          'median' not in base_phases.get(phase, {})):
+        continue
+      base = base_phases[phase]['median']
+      cur = phases[phase]['median']
+      change = (cur - base) / base if base else 0.0
+      regressed = change > threshold and cur - base > min_delta
+      marker = '  REGRESSION' if regressed else ''
+      print(f'{name:<20} {phase:<7} {base:>9.3f}s {cur:>9.3f}s '
+            f'{change:>+7.1%}{marker}')
+      if regressed:
+        regressions.append((name, phase))
+  return regressions
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(
+      description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument(
+      '--hooks',
+      default=','.join(HOOKS),
+      help='Comma separated hooks to benchmark.')
+  parser.add_argument(
+      '--files',
+      type=int,
+      default=50,
+      help='Number of files in the steady phase.')
+  parser.add_argument(
+      '--lines',
+      type=int,
+      default=300,
+      help='Approximate number of lines per file.')
+  parser.add_argument('--repeat', type=int, default=3)
+  parser.add_argument(
+      '--artifacts',
+      type=Path,
+      default=SCRIPT_DIR / 'bin',
+      help='Directory with the tool artifacts to serve.')
+  parser.add_argument('--output', type=Path, help='Write JSON results here.')
+  parser.add_argument(
+      '--baseline', type=Path, help='Earlier JSON results to compare against.')
+  parser.add_argument(
+      '--threshold',
+      type=float,
+      default=0.1,
+      help='Relative slowdown reported as a regression.')
+  parser.add_argument(
+      '--min-delta',
+      type=float,
+      default=0.05,
+      help='Ignore slowdowns below this many seconds.')
+  args = parser.parse_args(argv)
+
+  names = [name for name in args.hooks.split(',') if name]
+  for name in names:
+    if name not in HOOKS:
+      parser.error(f'unknown hook {name}')
+
+  modules = {
+      name: hook_util.load_wrapper(HOOKS[name]['script']) for name in names
+  }
+  routes = {}
+  for name in names:
+    routes.update(HOOKS[name]['artifacts'](modules[name]))
+
+  stats = {'bytes_served': 0}
+  handler = functools.partial(
+      ArtifactHandler,
+      artifacts=args.artifacts.resolve(),
+      routes=routes,
+      stats=stats)
+  server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+
+  results = {
+      'config': {
+          'files': args.files,
+          'lines': args.lines,
+          'repeat': args.repeat,
+      },
+      'hooks': {},
+  }
+  try:
+    with tempfile.TemporaryDirectory() as tempdir:
+      workspace = Path(tempdir)
+      hooks_dir = workspace / 'hooks'
+      hooks_dir.mkdir()
+      for path in SCRIPT_DIR.glob('*.py'):
+        shutil.copy2(path, hooks_dir)
+      for config in CONFIG_FILES:
+        if (ROOT_DIR / config).exists():
+          shutil.copy2(ROOT_DIR / config, workspace)
+
+      # Set for this process too, so that tools can be seeded into the store.
+      os.environ['PRE_COMMIT_TOOL_MIRROR'] = (
+          f'http://127.0.0.1:{server.server_port}')
+      os.environ['PRE_COMMIT_TOOL_STORE'] = str(workspace / 'store')
+      env = dict(os.environ)
+
+      results['python_startup'] = summarize([
+          time_command([sys.executable, '-c', 'pass'], workspace, env)
+          for _ in range(args.repeat)
+      ])
+
+      for name in names:
+        print(f'Benchmarking {name}...', file=sys.stderr)
+        stats['bytes_served'] = 0
+        result = benchmark_hook(name, modules[name], args, workspace, env)
+        result['bytes_served'] = stats['bytes_served']
+        results['hooks'][name] = result
+        if 'skipped' in result:
+          print(f"  skipped: {result['skipped']}", file=sys.stderr)
+        elif 'error' in result:
+          print(f"  error: {result['error']}", file=sys.stderr)
+  finally:
+    server.shutdown()
+    server.server_close()
+
+  text = json.dumps(results, indent=2)
+  if args.output:
+    args.output.write_text(text + '\n')
+  else:
+    print(text)
+
+  if args.baseline:
+    baseline = json.loads(args.baseline.read_text())
+    if compare(baseline, results, args.threshold, args.min_delta):
+      return 1
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
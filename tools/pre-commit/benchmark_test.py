@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Unit tests for benchmark.py
+"""
+
+import functools
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import types
+import unittest
+from http.server import ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchmark
+import hook_util
+
+
+def phase(median):
+  return {'median': median, 'min': median, 'runs': [median]}
+
+
+class TestBenchmark(unittest.TestCase):
+  """Test cases for benchmark.py"""
+
+  def setUp(self):
+    """Set up a scratch directory"""
+    self.tempdir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tempdir.cleanup)
+    self.root = Path(self.tempdir.name)
+    patcher = mock.patch.dict(os.environ)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  @mock.patch('sys.stdout', new_callable=StringIO)
+  def test_compare(self, mock_stdout):
+    """Test that only slowdowns above both thresholds are regressions"""
+    baseline = {
+        'hooks': {
+            'ktfmt': {
+                'cold': phase(2.0),
+                'warm': phase(0.5),
+                'steady': phase(1.0),
+            },
+            'buildifier': {
+                'cold': {
+                    'skipped': 'no prebuilt'
+                },
+                'warm': phase(0.1),
+            },
+        }
+    }
+    current = {
+        'hooks': {
+            'ktfmt': {
+                # Slower by 50%, but only by 0.01s.
+                'cold': phase(2.0),
+                'warm': phase(0.51),
+                'steady': phase(1.5),
+            },
+            'buildifier': {
+                'cold': phase(5.0),
+                'warm': phase(0.1),
+            },
+            'swift-format': {
+                'skipped': 'swift not found'
+            },
+        }
+    }
+
+    self.assertEqual(
+        benchmark.compare(baseline, current, 0.1, 0.05), [('ktfmt', 'steady')])
+    self.assertIn('REGRESSION', mock_stdout.getvalue())
+
+  def test_artifact_routes(self):
+    """Test that artifacts are served by name or by their install name"""
+    artifacts = self.root / 'bin'
+    artifacts.mkdir()
+    (artifacts / 'ktfmt.jar').write_bytes(b'jar')
+    (artifacts / 'other').write_bytes(b'other')
+    stats = {'bytes_served': 0}
+    routes = benchmark.ktfmt_artifacts(
+        types.SimpleNamespace(KTFMT_URL='https://host/v1/ktfmt-1-deps.jar'))
+    handler = functools.partial(
+        benchmark.ArtifactHandler,
+        artifacts=artifacts,
+        routes=routes,
+        stats=stats)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    self.addCleanup(server.server_close)
+    self.addCleanup(server.shutdown)
+    url = f'http://127.0.0.1:{server.server_port}'
+
+    with urlopen(f'{url}/v1/ktfmt-1-deps.jar') as r:
+      self.assertEqual(r.read(), b'jar')
+    with urlopen(f'{url}/any/path/other') as r:
+      self.assertEqual(r.read(), b'other')
+    with self.assertRaises(HTTPError) as e:
+      urlopen(f'{url}/missing.jar')
+    self.assertEqual(e.exception.code, 404)
+    self.assertEqual(stats['bytes_served'], 8)
+
+  def test_seed_buildifier(self):
+    """Test that a seeded buildifier is found like a built one"""
+    os.environ['PRE_COMMIT_TOOL_STORE'] = str(self.root / 'store')
+    artifacts = self.root / 'bin'
+    artifacts.mkdir()
+    (artifacts / 'buildifier').write_bytes(b'buildifier')
+    sha256 = hashlib.sha256(b'buildifier').hexdigest()
+    module = hook_util.load_wrapper('run-buildifier.py')
+
+    with mock.patch.object(module, 'BUILDIFIER_DATA', []):
+      self.assertIsNotNone(benchmark.buildifier_cold_skipped(module))
+      benchmark.seed_buildifier(module, artifacts)
+      with mock.patch.object(module, 'build_buildifier') as build:
+        self.assertEqual(module.ensure_built_buildifier(), sha256)
+      build.assert_not_called()
+    self.assertTrue(
+        hook_util.is_installed(hook_util.store_path(sha256), sha256))
+
+  def test_main_writes_results(self):
+    """Test the JSON results and the comparison with a baseline"""
+    scripts = self.root / 'scripts'
+    scripts.mkdir()
+    (scripts / 'run-fake.py').write_text('import sys\n')
+    hooks = {
+        'fake': {
+            'script': 'run-fake.py',
+            'path': 'src/file{index}.txt',
+            'generate': lambda index, lines, rng: 'x\n' * lines,
+            'requires': [],
+            'artifacts': lambda module: {},
+        },
+    }
+    baseline = self.root / 'baseline.json'
+    baseline.write_text(
+        json.dumps({'hooks': {
+            'fake': {
+                'steady': phase(0.001)
+            }
+        }}))
+    output = self.root / 'results.json'
+
+    with mock.patch.object(benchmark, 'HOOKS', hooks), \
+        mock.patch.object(benchmark, 'SCRIPT_DIR', scripts), \
+        mock.patch.object(hook_util, 'load_wrapper', lambda _: None), \
+        mock.patch('sys.stdout', new_callable=StringIO), \
+        mock.patch('sys.stderr', new_callable=StringIO):
+      returncode = benchmark.main([
+          '--repeat', '2', '--files', '3', '--lines', '5', '--output',
+          str(output), '--baseline',
+          str(baseline), '--min-delta', '0'
+      ])
+
+    results = json.loads(output.read_text())
+    self.assertEqual(results['config'], {'files': 3, 'lines': 5, 'repeat': 2})
+    self.assertEqual(
+        set(results['hooks']['fake']),
+        {'cold', 'warm', 'steady', 'bytes_served'})
+    self.assertEqual(len(results['hooks']['fake']['steady']['runs']), 2)
+    # Starting Python takes longer than the baseline's millisecond.
+    self.assertEqual(returncode, 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
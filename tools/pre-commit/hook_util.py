@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+"""Helpers shared by the pre-commit tool wrappers."""
+
+import argparse
+import codecs
+import concurrent.futures
+import contextlib
+import difflib
+import hashlib
+import importlib.util
+import os
+import platform
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+
+CHUNK_SIZE = 8192
+ONE_DAY = 24 * 60 * 60
+
+# Usage stamps are refreshed at most this often, to avoid a write per run.
+STAMP_RESOLUTION = ONE_DAY
+MAX_UNUSED_AGE = 30 * ONE_DAY
+
+
+def current_platform():
+  """Returns the (os, arch) pair used to pick prebuilt tool binaries."""
+  operation_system, arch = sys.platform, platform.machine().lower()
+  if operation_system == "darwin":
+    operation_system = "mac"
+  if arch == "aarch64":
+    arch = "arm64"
+  if arch == "amd64":
+    arch = "x86_64"
+  return operation_system, arch
+
+
+def load_wrapper(script):
+  """Imports one of the hyphenated run-*.py wrappers as a module."""
+  spec = importlib.util.spec_from_file_location(
+      script.replace('-', '_').removesuffix('.py'), SCRIPT_DIR / script)
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module
+
+
+def sha256_file(path):
+  hasher = hashlib.sha256()
+  with open(path, 'rb') as f:
+    while True:
+      data = f.read(CHUNK_SIZE)
+      if not data:
+        break
+      hasher.update(data)
+  return hasher.hexdigest()
+
+
+def is_installed(path, sha256, size=None):
+  """Returns True if `path` exists and matches the expected size and hash."""
+  try:
+    stat_info = os.stat(path)
+  except FileNotFoundError:
+    return False
+
+  if size is not None and stat_info.st_size != size:
+    return False
+
+  return sha256_file(path) == sha256
+
+
+@contextlib.contextmanager
+def file_lock(path):
+  """Holds an exclusive inter-process lock on `path` for the duration."""
+  path = Path(path)
+  path.parent.mkdir(parents=True, exist_ok=True)
+  with open(path, 'a+b') as f:
+    if os.name == 'nt':
+      import msvcrt
+      f.seek(0)
+      while True:
+        try:
+          msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+          break
+        except OSError:
+          # LK_LOCK gives up after ~10 seconds, keep waiting.
+          time.sleep(0.1)
+      try:
+        yield
+      finally:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+      import fcntl
+      fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+      try:
+        yield
+      finally:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def lock_path_for(path):
+  path = Path(path)
+  return path.with_name(path.name + '.lock')
+
+
+@contextlib.contextmanager
+def temporary_sibling(path):
+  """Yields a unique temporary path next to `path`, removed on exit.
+
+  The temporary file lives in the same directory so that it can be renamed
+  over `path` atomically.
+  """
+  path = Path(path)
+  path.parent.mkdir(parents=True, exist_ok=True)
+  fd, temp_name = tempfile.mkstemp(
+      dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+  os.close(fd)
+  temp_file = Path(temp_name)
+  try:
+    yield temp_file
+  finally:
+    temp_file.unlink(missing_ok=True)
+
+
+def mirror_url(url):
+  """Rewrites a tool download URL to PRE_COMMIT_TOOL_MIRROR, if set.
+
+  The mirror must serve the same paths as the original host.
+  """
+  mirror = os.environ.get('PRE_COMMIT_TOOL_MIRROR')
+  if not mirror:
+    return url
+  return mirror.rstrip('/') + urllib.parse.urlsplit(url).path
+
+
+def store_directory():
+  """Returns the user-level tool store shared by all checkouts."""
+  override = os.environ.get('PRE_COMMIT_TOOL_STORE')
+  if override:
+    return Path(override)
+
+  if sys.platform == 'win32':
+    base_dir = os.environ.get('LocalAppData')
+    if base_dir is None:
+      raise Exception("%LocalAppData% is not defined")
+  elif sys.platform == 'darwin':
+    base_dir = os.path.join(os.path.expanduser('~'), 'Library', 'Caches')
+  else:
+    base_dir = os.environ.get('XDG_CACHE_HOME')
+    if base_dir is None:
+      base_dir = os.path.join(os.path.expanduser('~'), '.cache')
+
+  return Path(base_dir) / 'bazel-mobile-journey' / 'tools'
+
+
+def store_path(sha256):
+  return store_directory() / 'sha256' / sha256
+
+
+def mark_used(entry):
+  """Records that `entry` was used, for garbage collection."""
+  stamp = entry.with_name(entry.name + '.used')
+  try:
+    if time.time() - stamp.stat().st_mtime < STAMP_RESOLUTION:
+      return
+  except FileNotFoundError:
+    pass
+  stamp.touch()
+
+
+def is_linked(path, entry):
+  try:
+    return os.path.samefile(path, entry)
+  except OSError:
+    return False
+
+
+def link_into_place(entry, path):
+  """Atomically points `path` at the store `entry`.
+
+  A hardlink is preferred; a symlink is used when the store is on another
+  file system and a copy when neither is possible.
+  """
+  with temporary_sibling(path) as temp_file:
+    temp_file.unlink()
+    try:
+      os.link(entry, temp_file)
+    except OSError:
+      try:
+        os.symlink(entry, temp_file)
+      except OSError:
+        shutil.copy2(entry, temp_file)
+    os.replace(temp_file, path)
+
+
+def add_to_store(fetch, sha256, size=None, mode=None, seed=None):
+  """Makes sure the store holds the file with the given sha256.
+
+  The file is copied from `seed` if that already has the right contents,
+  otherwise `fetch` is called with a binary file object and must write the
+  file contents to it. Must be called with the entry lock held.
+  """
+  entry = store_path(sha256)
+  if is_installed(entry, sha256, size):
+    return entry
+
+  with temporary_sibling(entry) as temp_file:
+    if seed is not None and is_installed(seed, sha256, size):
+      shutil.copyfile(seed, temp_file)
+    else:
+      with open(temp_file, 'wb') as f:
+        fetch(f)
+
+    download_size = temp_file.stat().st_size
+    if size is not None and download_size != size:
+      raise Exception(f"Downloaded size mismatch: {download_size} != {size}")
+
+    digest = sha256_file(temp_file)
+    if digest != sha256:
+      raise Exception(f"Downloaded sha256 mismatch: {digest} != {sha256}")
+
+    if mode is not None:
+      os.chmod(temp_file, mode)
+    os.replace(temp_file, entry)
+
+  return entry
+
+
+def install_file(path, sha256, fetch, size=None, mode=None):
+  """Makes sure `path` holds the file with the given sha256.
+
+  Files are kept in a content-addressed store shared by every checkout and
+  `path` is linked to the store entry, so a new checkout or worktree needs
+  no download once any other one has fetched the tool.
+
+  `fetch` is called with a binary file object and must write the file
+  contents to it. The download goes to a unique temporary file, is verified
+  and then renamed into place, so concurrent processes never observe (or
+  execute) a partially written file. The existing file is never unlinked;
+  processes still running the old file keep their inode.
+  """
+  path = Path(path)
+  entry = store_path(sha256)
+
+  # Store entries are verified when they are added and never modified.
+  if is_linked(path, entry):
+    mark_used(entry)
+    return
+
+  with file_lock(lock_path_for(entry)):
+    add_to_store(fetch, sha256, size=size, mode=mode, seed=path)
+    link_into_place(entry, path)
+    mark_used(entry)
+
+  collect_garbage()
+
+
+def collect_garbage(max_age=MAX_UNUSED_AGE):
+  """Removes store entries that have not been used for `max_age` seconds.
+
+  Checkouts that hardlinked an entry keep their copy; symlinked or missing
+  entries are fetched again the next time they are needed.
+  """
+  removed = []
+  sha256_dir = store_directory() / 'sha256'
+  if not sha256_dir.is_dir():
+    return removed
+
+  now = time.time()
+  for entry in sha256_dir.iterdir():
+    if entry.suffix or entry.name.startswith('.'):
+      continue
+    stamp = entry.with_name(entry.name + '.used')
+    try:
+      last_used = stamp.stat().st_mtime
+    except FileNotFoundError:
+      last_used = entry.stat().st_mtime
+    if now - last_used < max_age:
+      continue
+
+    with file_lock(lock_path_for(entry)):
+      # Re-check, it may have been used while we were waiting.
+      try:
+        if now - stamp.stat().st_mtime < max_age:
+          continue
+      except FileNotFoundError:
+        pass
+      entry.unlink(missing_ok=True)
+      stamp.unlink(missing_ok=True)
+      removed.append(entry.name)
+
+  return removed
+
+
+def write_text_atomic(path, text):
+  with temporary_sibling(path) as temp_file:
+    temp_file.write_text(text)
+    os.replace(temp_file, path)
+
+
+def write_bytes_atomic(path, data):
+  """Replaces the contents of `path`, keeping its permission bits."""
+  path = Path(os.path.realpath(path))
+  with temporary_sibling(path) as temp_file:
+    temp_file.write_bytes(data)
+    shutil.copymode(path, temp_file)
+    os.replace(temp_file, path)
+
+
+def run_formatter(cmd, source):
+  """Runs a formatter that reads `source` on stdin and writes to stdout."""
+  r = subprocess.run(
+      cmd, input=source, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+  if r.returncode != 0:
+    raise RuntimeError(
+        f"{shlex.join(cmd)} failed: {r.stderr.decode('utf-8', 'replace')}")
+  return r.stdout
+
+
+def unified_diff(path, before, after):
+  return ''.join(
+      difflib.unified_diff(
+          before.decode('utf-8', 'replace').splitlines(True),
+          after.decode('utf-8', 'replace').splitlines(True),
+          fromfile=f'a/{path}',
+          tofile=f'b/{path}'))
+
+
+def max_workers():
+  """Returns how many formatter processes one hook run may start at once.
+
+  pre-commit already runs up to one hook process per CPU, each with a share
+  of the files, so a hook started by it formats its files one at a time.
+  """
+  if os.environ.get('PRE_COMMIT'):
+    return 1
+  return os.cpu_count() or 1
+
+
+def format_files(files, format_source, check=False):
+  """Formats `files` in memory and writes back only what actually changed.
+
+  `format_source` is called with a path and the file contents and returns
+  the formatted contents. Untouched files keep their mtime, so Bazel and
+  file watchers do not see them as modified. In check mode nothing is
+  written and a unified diff is printed for every file that would change.
+
+  Returns the list of files that were (or would be) changed.
+  """
+
+  def format_one(path):
+    with open(path, 'rb') as f:
+      source = f.read()
+    return path, source, format_source(path, source)
+
+  changed = []
+  with concurrent.futures.ThreadPoolExecutor(max_workers()) as executor:
+    for path, source, formatted in executor.map(format_one, files):
+      if formatted == source:
+        continue
+      changed.append(path)
+      if check:
+        sys.stdout.write(unified_diff(os.path.relpath(path), source, formatted))
+      else:
+        write_bytes_atomic(path, formatted)
+  return changed
+
+
+def format_copies(cmd, files):
+  """Runs an in-place formatter once over copies of `files`.
+
+  Returns {path: formatted contents}. The files themselves are not touched,
+  so that format_files can write back only what changed, atomically, while
+  a formatter that is slow to start still runs only once.
+  """
+  formatted = {}
+  with tempfile.TemporaryDirectory() as temp_dir:
+    copies = []
+    for index, path in enumerate(files):
+      # One directory per file keeps the names, and with them the
+      # extensions formatters look at, without clashes.
+      copy = os.path.join(temp_dir, str(index), os.path.basename(path))
+      os.mkdir(os.path.dirname(copy))
+      shutil.copyfile(path, copy)
+      copies.append(copy)
+    subprocess.run(cmd + copies, check=True)
+    for path, copy in zip(files, copies):
+      with open(copy, 'rb') as f:
+        formatted[path] = f.read()
+  return formatted
+
+
+# git appends a tab to names with spaces and C-quotes names with special
+# characters such as quotes, backslashes or tabs.
+RE_DIFF_FILE = re.compile(r'^\+\+\+ (?:b/(.*?)|("b/.*")|/dev/null)\t?$')
+RE_DIFF_HUNK = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
+
+
+def unquote_diff_path(quoted):
+  """Undoes git's C-style quoting of a path, octal escaped bytes included."""
+  data = codecs.escape_decode(quoted[1:-1].encode('utf-8'))[0]
+  return data.decode('utf-8', 'replace')
+
+
+def parse_diff_line_ranges(diff):
+  """Returns {path: [(first, last), ...]} of lines added by a -U0 diff.
+
+  Line numbers are 1-based and inclusive, on the new side of the diff.
+  Hunks that only delete lines are dropped.
+  """
+  ranges = {}
+  current = None
+  for line in diff.splitlines():
+    match = RE_DIFF_FILE.match(line)
+    if match:
+      current = match.group(1)
+      if match.group(2) is not None:
+        current = unquote_diff_path(match.group(2))[len('b/'):]
+      continue
+    match = RE_DIFF_HUNK.match(line)
+    if match and current is not None:
+      first = int(match.group(1))
+      count = int(match.group(2)) if match.group(2) is not None else 1
+      if count > 0:
+        ranges.setdefault(current, []).append((first, first + count - 1))
+  return ranges
+
+
+# Diffed against in a repository without commits.
+EMPTY_TREE = '4b825dc642cb6eb9a060e54bf8d69288fbee4904'
+
+
+def changed_line_ranges(files):
+  """Returns {real path: line ranges} of the lines changed in `files`.
+
+  The files in the working tree are diffed against HEAD, so the line
+  numbers match the contents that get formatted, whether the changes are
+  staged or not. Under pre-commit, which stashes unstaged changes, these
+  are exactly the staged changes. Files without added lines are left out.
+  """
+  toplevel = subprocess.run(['git', 'rev-parse', '--show-toplevel'],
+                            stdout=subprocess.PIPE,
+                            check=True).stdout.decode('utf-8').strip()
+  r = subprocess.run(['git', 'rev-parse', '--verify', '-q', 'HEAD'],
+                     stdout=subprocess.PIPE)
+  base = r.stdout.decode('utf-8').strip() if r.returncode == 0 else EMPTY_TREE
+  cmd = [
+      'git', '-c', 'core.quotePath=false', 'diff', '-U0', '--no-color',
+      '--no-ext-diff', '--src-prefix=a/', '--dst-prefix=b/', base, '--'
+  ] + list(files)
+  diff = subprocess.run(
+      cmd, stdout=subprocess.PIPE,
+      check=True).stdout.decode('utf-8', 'replace')
+  return {
+      os.path.realpath(os.path.join(toplevel, path)): line_ranges
+      for path, line_ranges in parse_diff_line_ranges(diff).items()
+  }
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(
+      description='Manage the shared pre-commit tool store.')
+  subparsers = parser.add_subparsers(dest='command', required=True)
+  gc_parser = subparsers.add_parser(
+      'gc', help='Remove tools that have not been used recently.')
+  gc_parser.add_argument(
+      '--max-age-days', type=float, default=MAX_UNUSED_AGE / ONE_DAY)
+  args = parser.parse_args(argv)
+
+  if args.command == 'gc':
+    for name in collect_garbage(args.max_age_days * ONE_DAY):
+      print(f'Removed {name}')
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Unit tests for hook_util.py
+"""
+
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import unittest
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import hook_util
+
+
+class TestHookUtil(unittest.TestCase):
+  """Test cases for hook_util.py"""
+
+  def setUp(self):
+    """Set up a scratch directory and a private tool store"""
+    self.tempdir = tempfile.TemporaryDirectory()
+    self.root = Path(self.tempdir.name)
+    patcher = mock.patch.dict(
+        os.environ, {'PRE_COMMIT_TOOL_STORE': str(self.root / 'store')})
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.addCleanup(self.tempdir.cleanup)
+
+  def test_install_file_shares_store(self):
+    """Test that a second checkout links the stored file without fetching"""
+    content = b'tool contents'
+    sha256 = hashlib.sha256(content).hexdigest()
+    fetches = []
+
+    def fetch(f):
+      fetches.append(1)
+      f.write(content)
+
+    first = self.root / 'first' / 'bin' / 'tool'
+    second = self.root / 'second' / 'bin' / 'tool'
+    hook_util.install_file(first, sha256, fetch, size=len(content))
+    hook_util.install_file(second, sha256, fetch, size=len(content))
+
+    self.assertEqual(len(fetches), 1)
+    self.assertEqual(second.read_bytes(), content)
+    self.assertTrue(os.path.samefile(first, hook_util.store_path(sha256)))
+
+  def test_install_file_concurrent_processes(self):
+    """Test that processes racing to install one tool fetch it only once"""
+    content = b'tool contents\n' * 1024
+    sha256 = hashlib.sha256(content).hexdigest()
+    path = self.root / 'bin' / 'tool'
+    start = self.root / 'start'
+    fetches = self.root / 'fetches'
+    script = textwrap.dedent(f'''
+        import os, sys, time
+        sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r})
+        import hook_util
+
+        def fetch(f):
+          with open({str(fetches)!r}, 'a') as log:
+            log.write('fetch\\n')
+          # Write slowly, so that the other processes arrive meanwhile.
+          for i in range(4):
+            f.write({content!r}[i * 3584:(i + 1) * 3584])
+            f.flush()
+            time.sleep(0.05)
+
+        while not os.path.exists({str(start)!r}):
+          time.sleep(0.01)
+        hook_util.install_file({str(path)!r}, {sha256!r}, fetch,
+                               size={len(content)})
+        with open({str(path)!r}, 'rb') as f:
+          sys.exit(0 if f.read() == {content!r} else 1)
+        ''')
+    processes = [
+        subprocess.Popen([sys.executable, '-c', script]) for _ in range(4)
+    ]
+    start.touch()
+    for process in processes:
+      self.assertEqual(process.wait(timeout=60), 0)
+
+    self.assertEqual(fetches.read_text(), 'fetch\n')
+    self.assertTrue(hook_util.is_linked(path, hook_util.store_path(sha256)))
+    self.assertEqual(
+        [p.name for p in path.parent.iterdir() if p.name.endswith('.tmp')], [])
+
+  def test_install_file_checksum_mismatch(self):
+    """Test that a download with the wrong hash is not installed"""
+    path = self.root / 'bin' / 'tool'
+    with self.assertRaises(Exception):
+      hook_util.install_file(path, '0' * 64, lambda f: f.write(b'bad'))
+    self.assertFalse(path.exists())
+    self.assertFalse(hook_util.store_path('0' * 64).exists())
+
+  def test_collect_garbage(self):
+    """Test that unused store entries are removed"""
+    content = b'old tool'
+    sha256 = hashlib.sha256(content).hexdigest()
+    path = self.root / 'bin' / 'tool'
+    hook_util.install_file(path, sha256, lambda f: f.write(content))
+
+    entry = hook_util.store_path(sha256)
+    os.utime(entry.with_name(entry.name + '.used'), (0, 0))
+    self.assertEqual(hook_util.collect_garbage(), [sha256])
+    self.assertFalse(entry.exists())
+    # The checkout keeps its hardlinked copy.
+    self.assertEqual(path.read_bytes(), content)
+
+  def test_link_into_place_falls_back_to_symlink(self):
+    """Test that a store on another file system is symlinked"""
+    content = b'tool'
+    sha256 = hashlib.sha256(content).hexdigest()
+    path = self.root / 'bin' / 'tool'
+    with mock.patch('os.link', side_effect=OSError('cross-device link')):
+      hook_util.install_file(path, sha256, lambda f: f.write(content))
+
+    self.assertTrue(path.is_symlink())
+    self.assertTrue(hook_util.is_linked(path, hook_util.store_path(sha256)))
+
+  @mock.patch('sys.stdout', new_callable=StringIO)
+  def test_gc_command(self, mock_stdout):
+    """Test that the gc command removes entries older than --max-age-days"""
+    content = b'tool'
+    sha256 = hashlib.sha256(content).hexdigest()
+    hook_util.install_file(self.root / 'bin' / 'tool', sha256,
+                           lambda f: f.write(content))
+    entry = hook_util.store_path(sha256)
+    os.utime(
+        entry.with_name(entry.name + '.used'),
+        (time.time() - 2 * hook_util.ONE_DAY,) * 2)
+
+    self.assertEqual(hook_util.main(['gc', '--max-age-days', '3']), 0)
+    self.assertTrue(entry.exists())
+    self.assertEqual(hook_util.main(['gc', '--max-age-days', '1']), 0)
+    self.assertFalse(entry.exists())
+    self.assertEqual(mock_stdout.getvalue(), f'Removed {sha256}\n')
+
+  def test_format_files_writes_only_changes(self):
+    """Test that unchanged files are left untouched"""
+    clean = self.root / 'clean.txt'
+    dirty = self.root / 'dirty.txt'
+    clean.write_bytes(b'CLEAN\n')
+    dirty.write_bytes(b'dirty\n')
+    os.utime(clean, (0, 0))
+
+    changed = hook_util.format_files([str(clean), str(dirty)],
+                                     lambda path, source: source.upper())
+
+    self.assertEqual(changed, [str(dirty)])
+    self.assertEqual(dirty.read_bytes(), b'DIRTY\n')
+    self.assertEqual(clean.stat().st_mtime, 0)
+
+  def test_format_files_serial_under_pre_commit(self):
+    """Test that hooks run by pre-commit start one formatter at a time"""
+    files = []
+    for i in range(4):
+      files.append(str(self.root / f'file{i}.txt'))
+      Path(files[-1]).write_bytes(b'text\n')
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def format_source(path, source):
+      with lock:
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+      time.sleep(0.05)
+      with lock:
+        running[0] -= 1
+      return source
+
+    with mock.patch.dict(os.environ, {'PRE_COMMIT': '1'}):
+      self.assertEqual(hook_util.max_workers(), 1)
+      hook_util.format_files(files, format_source)
+    self.assertEqual(peak[0], 1)
+
+  @mock.patch('sys.stdout', new_callable=StringIO)
+  def test_format_files_check(self, mock_stdout):
+    """Test that check mode prints a diff and writes nothing"""
+    dirty = self.root / 'dirty.txt'
+    dirty.write_bytes(b'dirty\n')
+
+    changed = hook_util.format_files([str(dirty)],
+                                     lambda path, source: source.upper(),
+                                     check=True)
+
+    self.assertEqual(changed, [str(dirty)])
+    self.assertEqual(dirty.read_bytes(), b'dirty\n')
+    self.assertIn('-dirty\n+DIRTY\n', mock_stdout.getvalue())
+
+  def test_parse_diff_line_ranges(self):
+    """Test extracting added line ranges from a -U0 diff"""
+    diff = '\n'.join([
+        'diff --git a/Foo.java b/Foo.java',
+        '--- a/Foo.java',
+        '+++ b/Foo.java',
+        '@@ -3 +3 @@ class Foo {',
+        '-  int a;',
+        '+  int  a;',
+        '@@ -10,2 +10,0 @@',
+        '-  x();',
+        '-  y();',
+        '@@ -20,0 +19,3 @@',
+        '+  a();',
+        '+  b();',
+        '+  c();',
+        'diff --git a/gone.cc b/gone.cc',
+        '--- a/gone.cc',
+        '+++ /dev/null',
+        '@@ -1,2 +0,0 @@',
+        '-int x;',
+        '-int y;',
+        'diff --git a/dir/new.cc b/dir/new.cc',
+        '--- /dev/null',
+        '+++ b/dir/new.cc',
+        '@@ -0,0 +1,2 @@',
+        '+int x;',
+        '+int y;',
+        'diff --git a/x y.cc b/x y.cc',
+        '--- a/x y.cc\t',
+        '+++ b/x y.cc\t',
+        '@@ -4 +4 @@',
+        '+int z;',
+        'diff --git "a/q\\"\\303\\274\\t.cc" "b/q\\"\\303\\274\\t.cc"',
+        '--- "a/q\\"\\303\\274\\t.cc"',
+        '+++ "b/q\\"\\303\\274\\t.cc"',
+        '@@ -0,0 +1 @@',
+        '+int w;',
+    ])
+
+    self.assertEqual(
+        hook_util.parse_diff_line_ranges(diff), {
+            'Foo.java': [(3, 3), (19, 21)],
+            'dir/new.cc': [(1, 2)],
+            'x y.cc': [(4, 4)],
+            'q"\u00fc\t.cc': [(1, 1)],
+        })
+
+
+if __name__ == '__main__':
+  unittest.main()
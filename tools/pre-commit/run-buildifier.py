@@ -1,46 +1,157 @@
 #!/usr/bin/env python3
 
-import contextlib
-import hashlib
+import argparse
 import os
 import shutil
 import subprocess
 import sys
-import tempfile
+from contextlib import closing
 from pathlib import Path
+from urllib.request import urlopen
+
+import hook_util
+from hook_util import CHUNK_SIZE
 
 SCRIPT_DIR = Path(__file__).resolve().parent
 BUILDIFIER = SCRIPT_DIR / 'bin' / 'buildifier'
 BUILDIFIER_VERSION_FILE = SCRIPT_DIR / 'bin' / 'buildifier.version'
 
+# The buildtools commit every machine formats with.
 BUILDIFIER_VERSION = 'ff5a15a14fa3939a985e61cc1afdb734216225e9'
 BUILDIFIER_REPO = 'https://github.com/bazelbuild/buildtools.git'
 
+# Release binaries of BUILDIFIER_VERSION, verified by sha256, one per
+# platform:
+#   {"os": "linux", "arch": "x86_64",
+#    "url": "https://github.com/bazelbuild/buildtools/releases/download/"
+#           "<tag>/buildifier-linux-amd64",
+#    "sha256": "<published sha256 of that asset>"}
+# Release binaries only exist for tags, so the list stays empty while a
+# commit is pinned. Moving the pin to a tag changes the formatter, so it
+# goes together with formatting the BUILD files again. Platforms without an
+# entry fall back to building from source, which needs git and go.
+BUILDIFIER_DATA = []
+
+
+def prebuilt_data():
+  operation_system, arch = hook_util.current_platform()
+  for data in BUILDIFIER_DATA:
+    if data["os"] == operation_system and data["arch"] == arch:
+      return data
+  return None
+
+
+def read_version_file():
+  """Returns (version, sha256) recorded for the installed buildifier."""
+  try:
+    with open(BUILDIFIER_VERSION_FILE, 'r') as f:
+      lines = f.read().split()
+  except FileNotFoundError:
+    return None, None
+  if len(lines) != 2:
+    return None, None
+  return lines[0], lines[1]
+
 
-@contextlib.contextmanager
-def temporaryWorkingDirectory(path):
-  _old_cwd = os.getcwd()
-  os.chdir(os.path.abspath(path))
+def is_buildifier_installed():
+  version, sha256 = read_version_file()
+  if version != BUILDIFIER_VERSION:
+    return False
 
-  try:
-    yield
-  finally:
-    os.chdir(_old_cwd)
+  data = prebuilt_data()
+  if data is not None and data["sha256"] != sha256:
+    return False
+
+  entry = hook_util.store_path(sha256)
+  if not hook_util.is_linked(BUILDIFIER, entry):
+    return False
+
+  hook_util.mark_used(entry)
+  return True
 
 
 def ensure_buildifier():
-  if BUILDIFIER.exists():
+  if is_buildifier_installed():
+    return
+
+  data = prebuilt_data()
+  if data is not None:
+    sha256 = data["sha256"]
+    hook_util.install_file(
+        BUILDIFIER,
+        sha256,
+        lambda f: download_buildifier(data["url"], f),
+        mode=0o755)
+  else:
+    sha256 = ensure_built_buildifier()
+    hook_util.install_file(BUILDIFIER, sha256, missing_build, mode=0o755)
+
+  write_version_file(sha256)
+
+
+def write_version_file(sha256):
+  hook_util.write_text_atomic(BUILDIFIER_VERSION_FILE,
+                              f'{BUILDIFIER_VERSION}\n{sha256}\n')
+
+
+def download_buildifier(url, f):
+  with closing(urlopen(hook_util.mirror_url(url))) as r:
+    while True:
+      chunk = r.read(CHUNK_SIZE)
+      if not chunk:
+        break
+      f.write(chunk)
+
+
+def missing_build(f):
+  raise RuntimeError("buildifier disappeared from the tool store after build")
+
+
+def run_checked(args, what, **kwargs):
+  r = subprocess.run(
+      args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs)
+  if r.returncode != 0:
+    raise RuntimeError(f"Failed to {what}: {r.stderr.decode('utf-8')}")
+  return r
+
+
+def ensure_built_buildifier():
+  """Builds buildifier into the tool store unless already there.
+
+  Returns the sha256 of the binary. The result is recorded under a ref
+  named after the pinned commit and platform, so that other checkouts can
+  reuse the binary without building it again.
+  """
+  ref = built_ref()
+  src = hook_util.store_directory() / 'buildtools-src'
+
+  with hook_util.file_lock(hook_util.lock_path_for(src)):
     try:
-      with open(BUILDIFIER_VERSION_FILE, 'r') as f:
-        if f.read().strip() == BUILDIFIER_VERSION:
-          return
+      sha256 = ref.read_text().strip()
+      if hook_util.is_installed(hook_util.store_path(sha256), sha256):
+        return sha256
     except FileNotFoundError:
       pass
 
-    BUILDIFIER.unlink()
-    BUILDIFIER_VERSION_FILE.unlink(missing_ok=True)
+    sha256 = build_buildifier(src)
+    write_built_ref(sha256)
+    return sha256
+
 
-  # Download buildifier
+def built_ref():
+  """Returns the store file naming the binary built from the pinned commit."""
+  operation_system, arch = hook_util.current_platform()
+  ref_name = f'buildifier-{BUILDIFIER_VERSION}-{operation_system}-{arch}'
+  return hook_util.store_directory() / 'refs' / ref_name
+
+
+def write_built_ref(sha256):
+  ref = built_ref()
+  ref.parent.mkdir(parents=True, exist_ok=True)
+  hook_util.write_text_atomic(ref, sha256 + '\n')
+
+
+def build_buildifier(src):
   git = shutil.which('git')
   if not git:
     raise RuntimeError("git not found")
@@ -49,45 +160,57 @@ def ensure_buildifier():
   if not go:
     raise RuntimeError("go not found")
 
-  tempdir = Path(tempfile.mkdtemp())
-  try:
-    with temporaryWorkingDirectory(tempdir):
-      r = subprocess.run([git, 'clone', BUILDIFIER_REPO, '.'],
-                         stdout=subprocess.PIPE,
-                         stderr=subprocess.PIPE)
-      if r.returncode != 0:
-        raise RuntimeError(
-            f"Failed to clone buildifier: {r.stderr.decode('utf-8')}")
-      r = subprocess.run([git, 'checkout', BUILDIFIER_VERSION],
-                         stdout=subprocess.PIPE,
-                         stderr=subprocess.PIPE)
-      if r.returncode != 0:
-        raise RuntimeError(f"Failed to checkout buildifier: {r.stderr.decode}")
-      r = subprocess.run([go, 'build', '-o', BUILDIFIER, './buildifier'],
-                         stdout=subprocess.PIPE,
-                         stderr=subprocess.PIPE,
-                         check=True)
-      if r.returncode != 0:
-        raise RuntimeError(
-            f"Failed to build buildifier: {r.stderr.decode('utf-8')}")
-    with open(BUILDIFIER_VERSION_FILE, 'w') as f:
-      f.write(BUILDIFIER_VERSION + '\n')
-
-  finally:
-    shutil.rmtree(tempdir, ignore_errors=True)
+  # The checkout is kept between runs. Go keys its build cache on the source
+  # directory too, so building from a fresh temporary directory every time
+  # would miss the cache.
+  if not (src / '.git').is_dir():
+    shutil.rmtree(src, ignore_errors=True)
+    src.mkdir(parents=True)
+    run_checked([git, 'init', '-q'], "initialize buildtools checkout", cwd=src)
+
+  # Fetch just the pinned commit instead of cloning the whole history.
+  run_checked(
+      [git, 'fetch', '-q', '--depth', '1', BUILDIFIER_REPO, BUILDIFIER_VERSION],
+      "fetch buildifier",
+      cwd=src)
+  run_checked([git, 'checkout', '-q', '--force', '--detach', 'FETCH_HEAD'],
+              "checkout buildifier",
+              cwd=src)
+
+  # Build next to the store entries so the result can be renamed into place.
+  placeholder = hook_util.store_path('buildifier')
+  with hook_util.temporary_sibling(placeholder) as temp_binary:
+    run_checked([go, 'build', '-trimpath', '-o', temp_binary, './buildifier'],
+                "build buildifier",
+                cwd=src)
+    os.chmod(temp_binary, 0o755)
+    sha256 = hook_util.sha256_file(temp_binary)
+    os.replace(temp_binary, hook_util.store_path(sha256))
+  return sha256
 
 
 def main(argv):
-  files = argv
-  if not files:
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+      '--check',
+      action='store_true',
+      help='Print a diff instead of rewriting files.')
+  parser.add_argument('files', nargs='*')
+  args = parser.parse_args(argv)
+  if not args.files:
     return 0
 
-  files = [os.path.abspath(f) for f in files]
+  files = [os.path.abspath(f) for f in args.files]
   ensure_buildifier()
 
-  args = [str(BUILDIFIER)] + files
-  subprocess.run(args, check=True)
-  return 0
+  def format_source(path, source):
+    # --path lets buildifier pick the file type and apply path based rules
+    # while reading from stdin.
+    return hook_util.run_formatter(
+        [str(BUILDIFIER), f'--path={os.path.relpath(path)}'], source)
+
+  changed = hook_util.format_files(files, format_source, check=args.check)
+  return 1 if args.check and changed else 0
 
 
 if __name__ == '__main__':
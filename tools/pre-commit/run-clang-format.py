@@ -1,8 +1,7 @@
 #!/usr/bin/env python3
 
-import hashlib
+import argparse
 import os
-import platform
 import subprocess
 import sys
 from pathlib import Path
@@ -10,7 +9,9 @@ from pathlib import Path
 # third_party
 import requests
 
-CHUNK_SIZE = 8192
+import hook_util
+from hook_util import CHUNK_SIZE
+
 SCRIPT_DIR = Path(__file__).resolve().parent
 CLANG_FORMAT = SCRIPT_DIR / 'bin' / 'clang-format'
 
@@ -44,97 +45,77 @@ CLANG_FORMAT_DATA = [
 # fmt: on
 
 
-def ensure_clang_format():
-  operation_system, arch = sys.platform, platform.machine()
-  if operation_system == "darwin":
-    operation_system = "mac"
-  matched_data = None
+def clang_format_data():
+  operation_system, arch = hook_util.current_platform()
   for data in CLANG_FORMAT_DATA:
     if data["os"] == operation_system and data["arch"] == arch:
-      matched_data = data
-      break
-  if matched_data is None:
-    raise Exception(f"Unsupported platform: {operation_system} {arch}")
+      return data
+  raise Exception(f"Unsupported platform: {operation_system} {arch}")
+
 
+def ensure_clang_format():
+  matched_data = clang_format_data()
   bucket = matched_data["bucket"]
   object_name = matched_data["object_name"]
-  sha256 = matched_data["sha256"]
-  size = matched_data["size"]
-
-  if CLANG_FORMAT.exists():
-    maybe_right = True
-    stat_info = CLANG_FORMAT.stat()
-
-    if stat_info.st_size != size:
-      maybe_right = False
-
-    if maybe_right:
-      with open(CLANG_FORMAT, "rb") as f:
-        hasher = hashlib.sha256()
-        while True:
-          data = f.read(CHUNK_SIZE)
-          if not data:
-            break
-          hasher.update(data)
-        if hasher.hexdigest() != sha256:
-          maybe_right = False
-
-    if not maybe_right:
-      CLANG_FORMAT.unlink()
-
-    if maybe_right and not (stat_info.st_mode & 0o100):
-      os.chmod(CLANG_FORMAT, 0o755)
-
-    if maybe_right:
-      return
-
-  # Download clang-format
-  r = requests.get(
-      f'https://storage.googleapis.com/{bucket}/{object_name}', stream=True)
-  temp_file = None
-  try:
-    r.raise_for_status()
-    temp_file = CLANG_FORMAT.with_suffix('.tmp')
-
-    download_size = 0
-    hasher = hashlib.sha256()
-    with temp_file.open('wb') as f:
+
+  def fetch(f):
+    url = f'https://storage.googleapis.com/{bucket}/{object_name}'
+    r = requests.get(hook_util.mirror_url(url), stream=True)
+    try:
+      r.raise_for_status()
       while True:
         data = r.raw.read(CHUNK_SIZE)
         if not data:
           break
-
         f.write(data)
-        download_size += len(data)
-        hasher.update(data)
-
-    if download_size != size:
-      raise Exception(f"Downloaded size mismatch: {download_size} != {size}")
-
-    if hasher.hexdigest() != sha256:
-      raise Exception(
-          f"Downloaded sha256 mismatch: {hasher.hexdigest()} != {sha256}")
+    finally:
+      r.close()
 
-    temp_file.rename(CLANG_FORMAT)
-    os.chmod(CLANG_FORMAT, 0o755)
-
-  finally:
-    if temp_file is not None:
-      temp_file.unlink(missing_ok=True)
-    r.close()
+  hook_util.install_file(
+      CLANG_FORMAT,
+      matched_data["sha256"],
+      fetch,
+      size=matched_data["size"],
+      mode=0o755)
 
 
 def main(argv):
-  files = argv
-  if not files:
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+      '--check',
+      action='store_true',
+      help='Print a diff instead of rewriting files.')
+  parser.add_argument(
+      '--changed-lines',
+      action='store_true',
+      help='Only format the lines added or changed since HEAD.')
+  parser.add_argument('files', nargs='*')
+  args = parser.parse_args(argv)
+  if not args.files:
     return 0
 
-  files = [os.path.abspath(f) for f in files]
+  files = [os.path.abspath(f) for f in args.files]
+  line_ranges = None
+  if args.changed_lines:
+    # Files without changes are skipped without running the tool.
+    line_ranges = hook_util.changed_line_ranges(files)
+    files = [f for f in files if os.path.realpath(f) in line_ranges]
+    if not files:
+      return 0
+
   ensure_clang_format()
 
-  cmd = [str(CLANG_FORMAT), '-i'] + files
-  subprocess.run(cmd, check=True)
-  return 0
+  def format_source(path, source):
+    cmd = [str(CLANG_FORMAT), f'--assume-filename={path}']
+    if line_ranges is not None:
+      cmd += [
+          f'--lines={first}:{last}'
+          for first, last in line_ranges[os.path.realpath(path)]
+      ]
+    return hook_util.run_formatter(cmd, source)
+
+  changed = hook_util.format_files(files, format_source, check=args.check)
+  return 1 if args.check and changed else 0
 
 
 if __name__ == '__main__':
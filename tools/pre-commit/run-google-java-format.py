@@ -1,16 +1,17 @@
 #!/usr/bin/env python3
 
-import hashlib
+import argparse
 import os
 import shutil
-import subprocess
 import sys
 from pathlib import Path
 
 # third_party
 import requests
 
-CHUNK_SIZE = 8192
+import hook_util
+from hook_util import CHUNK_SIZE
+
 SCRIPT_DIR = Path(__file__).resolve().parent
 GOOGLE_JAVA_FORMAT = SCRIPT_DIR / 'bin' / 'google-java-format.jar'
 
@@ -30,66 +31,69 @@ def java_path():
 
 
 def ensure_google_java_format():
-  if GOOGLE_JAVA_FORMAT.exists():
-    maybe_right = True
-    with open(GOOGLE_JAVA_FORMAT, "rb") as f:
-      hasher = hashlib.sha256()
-      while True:
-        data = f.read(CHUNK_SIZE)
-        if not data:
-          break
-        hasher.update(data)
-      if hasher.hexdigest() != GOOGLE_JAVA_FORMAT_SHA256:
-        maybe_right = False
-
-    if not maybe_right:
-      GOOGLE_JAVA_FORMAT.unlink()
-
-    if maybe_right:
-      return
 
-  # Download google-java-format
-  r = requests.get(GOOGLE_JAVA_FORMAT_URL, stream=True)
-  temp_file = None
-  try:
-    r.raise_for_status()
-    temp_file = GOOGLE_JAVA_FORMAT.with_suffix('.tmp')
-
-    hasher = hashlib.sha256()
-    with open(temp_file, 'wb') as f:
+  def fetch(f):
+    r = requests.get(hook_util.mirror_url(GOOGLE_JAVA_FORMAT_URL), stream=True)
+    try:
+      r.raise_for_status()
       while True:
         data = r.raw.read(CHUNK_SIZE)
         if not data:
           break
-
         f.write(data)
-        hasher.update(data)
-
-    if hasher.hexdigest() != GOOGLE_JAVA_FORMAT_SHA256:
-      raise Exception(
-          f"Downloaded sha256 mismatch: {hasher.hexdigest()} != {GOOGLE_JAVA_FORMAT_SHA256}"
-      )
+    finally:
+      r.close()
 
-    shutil.move(temp_file, GOOGLE_JAVA_FORMAT)
-
-  finally:
-    if temp_file is not None:
-      temp_file.unlink(missing_ok=True)
-    r.close()
+  hook_util.install_file(
+      GOOGLE_JAVA_FORMAT, GOOGLE_JAVA_FORMAT_SHA256, fetch, mode=0o644)
 
 
 def main(argv):
-  files = argv
-  if not files:
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+      '--check',
+      action='store_true',
+      help='Print a diff instead of rewriting files.')
+  parser.add_argument(
+      '--changed-lines',
+      action='store_true',
+      help='Only format the lines added or changed since HEAD.')
+  parser.add_argument('files', nargs='*')
+  args = parser.parse_args(argv)
+  if not args.files:
     return 0
 
-  files = [os.path.abspath(f) for f in files]
+  files = [os.path.abspath(f) for f in args.files]
+  line_ranges = None
+  if args.changed_lines:
+    # Files without changes are skipped without running the tool.
+    line_ranges = hook_util.changed_line_ranges(files)
+    files = [f for f in files if os.path.realpath(f) in line_ranges]
+    if not files:
+      return 0
+
   ensure_google_java_format()
 
   java = java_path()
-  args = [str(java), '-jar', str(GOOGLE_JAVA_FORMAT), '-i'] + files
-  subprocess.run(args, check=True)
-  return 0
+  tool = [str(java), '-jar', str(GOOGLE_JAVA_FORMAT)]
+
+  formatted = None
+  if line_ranges is None:
+    # Starting a JVM per file is expensive, so google-java-format formats
+    # copies of all the files in a single run and only the files it changed
+    # are written.
+    formatted = hook_util.format_copies(tool + ['--replace'], files)
+
+  def format_source(path, source):
+    if formatted is not None:
+      return formatted[path]
+    cmd = list(tool)
+    for first, last in line_ranges[os.path.realpath(path)]:
+      cmd += ['--lines', f'{first}:{last}']
+    return hook_util.run_formatter(cmd + ['-'], source)
+
+  changed = hook_util.format_files(files, format_source, check=args.check)
+  return 1 if args.check and changed else 0
 
 
 if __name__ == '__main__':
@@ -1,16 +1,17 @@
 #!/usr/bin/env python3
 
-import hashlib
+import argparse
 import os
 import shutil
-import subprocess
 import sys
 from pathlib import Path
 
 # third_party
 import requests
 
-CHUNK_SIZE = 8192
+import hook_util
+from hook_util import CHUNK_SIZE
+
 SCRIPT_DIR = Path(__file__).resolve().parent
 KTFMT = SCRIPT_DIR / 'bin' / 'ktfmt.jar'
 
@@ -30,62 +31,48 @@ def java_path():
 
 
 def ensure_ktfmt():
-  if KTFMT.exists():
-    maybe_right = True
-    with open(KTFMT, "rb") as f:
-      hasher = hashlib.sha256()
-      while True:
-        data = f.read(CHUNK_SIZE)
-        if not data:
-          break
-        hasher.update(data)
-      if hasher.hexdigest() != KTFMT_SHA256:
-        maybe_right = False
-
-    if not maybe_right:
-      KTFMT.unlink()
-
-    if maybe_right:
-      return
 
-  # Download ktfmt
-  r = requests.get(KTFMT_URL, stream=True)
-  temp_file = None
-  try:
-    r.raise_for_status()
-    temp_file = KTFMT.with_suffix('.tmp')
-
-    hasher = hashlib.sha256()
-    with open(temp_file, 'wb') as f:
+  def fetch(f):
+    r = requests.get(hook_util.mirror_url(KTFMT_URL), stream=True)
+    try:
+      r.raise_for_status()
       while True:
         data = r.raw.read(CHUNK_SIZE)
         if not data:
           break
-        hasher.update(data)
         f.write(data)
+    finally:
+      r.close()
 
-    if hasher.hexdigest() != KTFMT_SHA256:
-      raise Exception("Checksum mismatch")
-
-    temp_file.rename(KTFMT)
-  finally:
-    if temp_file:
-      temp_file.unlink(missing_ok=True)
-    r.close()
+  hook_util.install_file(KTFMT, KTFMT_SHA256, fetch, mode=0o644)
 
 
 def main(argv):
-  files = argv
-  if not files:
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+      '--check',
+      action='store_true',
+      help='Print a diff instead of rewriting files.')
+  parser.add_argument('files', nargs='*')
+  args = parser.parse_args(argv)
+  if not args.files:
     return 0
 
-  files = [os.path.abspath(f) for f in files]
+  files = [os.path.abspath(f) for f in args.files]
   ensure_ktfmt()
 
   java = java_path()
-  args = [str(java), '-jar', str(KTFMT)] + files
-  subprocess.run(args, check=True)
-  return 0
+  tool = [str(java), '-jar', str(KTFMT)]
+
+  # Starting a JVM per file is expensive, so ktfmt formats copies of all
+  # the files in a single run and only the files it changed are written.
+  formatted = hook_util.format_copies(tool, files)
+
+  def format_source(path, source):
+    return formatted[path]
+
+  changed = hook_util.format_files(files, format_source, check=args.check)
+  return 1 if args.check and changed else 0
 
 
 if __name__ == '__main__':
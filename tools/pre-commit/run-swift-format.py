@@ -3,14 +3,153 @@
 __doc__ = """Check if files are formatted using swift format."""
 
 import argparse
-import shlex
+import hashlib
+import json
+import os
 import shutil
 import subprocess
 import sys
+from pathlib import Path
+
+import hook_util
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+# Where the swift-format executable was found, so that it is not searched
+# for (and the swift driver is not involved) on every run.
+SWIFT_FORMAT_PATH_FILE = SCRIPT_DIR / 'bin' / 'swift-format.path.json'
+# Content hashes of the files swift-format left unchanged in earlier runs.
+CLEAN_FILES_CACHE = SCRIPT_DIR / 'bin' / 'swift-format.clean.json'
+
+# From this many files on, swift-format rewrites them in a single run.
+PARALLEL_THRESHOLD = 16
+
+
+def tool_key(path):
+  stat_info = os.stat(path)
+  return ':'.join([
+      os.path.realpath(path),
+      str(stat_info.st_size),
+      str(stat_info.st_mtime_ns)
+  ])
+
+
+def find_swift_format():
+  """Returns the path of the swift-format executable, or None."""
+  swift_format = shutil.which('swift-format')
+  if swift_format:
+    return os.path.realpath(swift_format)
+
+  if sys.platform == 'darwin' and shutil.which('xcrun'):
+    r = subprocess.run(['xcrun', '--find', 'swift-format'],
+                       stdout=subprocess.PIPE,
+                       stderr=subprocess.DEVNULL)
+    if r.returncode == 0 and r.stdout.strip():
+      return os.path.realpath(r.stdout.decode('utf-8').strip())
+
+  # Open source toolchains ship it next to the swift driver.
+  swift = shutil.which('swift')
+  if swift:
+    candidate = Path(os.path.realpath(swift)).parent / 'swift-format'
+    if os.access(candidate, os.X_OK):
+      return str(candidate)
+
+  return None
+
+
+def swift_format_command():
+  """Returns the command prefix used to run swift-format."""
+  # The cache is keyed on the swift driver found on PATH, which changes when
+  # a different toolchain is selected.
+  swift = shutil.which('swift')
+  swift_key = tool_key(swift) if swift else None
+
+  try:
+    cached = json.loads(SWIFT_FORMAT_PATH_FILE.read_text())
+    if cached['swift'] == swift_key and os.access(cached['path'], os.X_OK):
+      return [cached['path']]
+  except (OSError, ValueError, KeyError, TypeError):
+    pass
+
+  swift_format = find_swift_format()
+  if swift_format:
+    hook_util.write_text_atomic(
+        SWIFT_FORMAT_PATH_FILE,
+        json.dumps({
+            'swift': swift_key,
+            'path': swift_format
+        }))
+    return [swift_format]
+
+  if not swift:
+    raise RuntimeError('swift-format or swift not found in PATH.')
+  return [swift, 'format']
+
+
+class CleanFiles:
+  """Remembers the contents of files that are known to be formatted.
+
+  Entries cover the file contents and its .swift-format configuration and
+  are only valid for the swift-format executable they were produced with.
+  """
+
+  def __init__(self, tool):
+    self.tool = tool_key(tool[0])
+    self.configs = {}
+    self.files = {}
+    try:
+      data = json.loads(CLEAN_FILES_CACHE.read_text())
+      if data['tool'] == self.tool:
+        self.files = data['files']
+    except (OSError, ValueError, KeyError, TypeError):
+      pass
+
+  def config(self, directory):
+    """Returns the .swift-format in effect for `directory`, as bytes."""
+    if directory not in self.configs:
+      path = directory / '.swift-format'
+      if path.is_file():
+        self.configs[directory] = path.read_bytes()
+      elif directory.parent == directory:
+        self.configs[directory] = b''
+      else:
+        self.configs[directory] = self.config(directory.parent)
+    return self.configs[directory]
+
+  def digest(self, path):
+    path = Path(path)
+    hasher = hashlib.sha256(self.config(path.parent))
+    hasher.update(b'\0')
+    hasher.update(path.read_bytes())
+    return hasher.hexdigest()
+
+  def is_clean(self, path):
+    return self.files.get(path) == self.digest(path)
+
+  def save(self, paths):
+    """Records `paths` as formatted, merging with concurrent runs."""
+    digests = {path: self.digest(path) for path in paths}
+    with hook_util.file_lock(hook_util.lock_path_for(CLEAN_FILES_CACHE)):
+      files = {}
+      try:
+        data = json.loads(CLEAN_FILES_CACHE.read_text())
+        if data['tool'] == self.tool:
+          files = data['files']
+      except (OSError, ValueError, KeyError, TypeError):
+        pass
+      files.update(digests)
+      hook_util.write_text_atomic(
+          CLEAN_FILES_CACHE, json.dumps({
+              'tool': self.tool,
+              'files': files
+          }))
 
 
 def main(argv=None):
   parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument(
+      '--check',
+      action='store_true',
+      help='Print a diff instead of rewriting files.')
   parser.add_argument('filenames', nargs='*', help='Filenames to check.')
   args = parser.parse_args(argv)
   files = args.filenames
@@ -18,14 +157,36 @@ def main(argv=None):
     print('No files to check.')
     return 0
 
-  swift_path = shutil.which('swift')
-  if not swift_path:
-    raise RuntimeError('swift not found in PATH.')
+  tool = swift_format_command()
+  clean_files = CleanFiles(tool)
+
+  # Skip files whose contents have not changed since they were last clean.
+  files = [os.path.abspath(f) for f in files]
+  files = [f for f in files if not clean_files.is_clean(f)]
+  if not files:
+    return 0
+
+  if not args.check and len(files) >= PARALLEL_THRESHOLD:
+    # swift-format only rewrites files whose formatting changes, so this
+    # keeps the mtimes of untouched files just like format_files does.
+    cmd = tool + ['--in-place']
+    if hook_util.max_workers() > 1:
+      cmd.append('--parallel')
+    subprocess.run(cmd + files, check=True)
+    changed = []
+  else:
+
+    def format_source(path, source):
+      # Without --in-place, swift-format prints the formatted file to
+      # stdout. The file is passed by path so that it picks up the right
+      # .swift-format configuration.
+      return hook_util.run_formatter(tool + [path], b'')
+
+    changed = hook_util.format_files(files, format_source, check=args.check)
 
-  cmd = [swift_path, 'format', '--in-place'] + files
-  print(f'Running: {shlex.join(cmd)}')
-  subprocess.run(cmd, check=True)
-  return 0
+  # Rewritten files are formatted now; in check mode they are not.
+  clean_files.save([f for f in files if f not in changed or not args.check])
+  return 1 if args.check and changed else 0
 
 
 if __name__ == '__main__':
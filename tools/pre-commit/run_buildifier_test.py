@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Unit tests for run-buildifier.py
+"""
+
+import functools
+import hashlib
+import os
+import stat
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import hook_util
+
+run_buildifier = hook_util.load_wrapper('run-buildifier.py')
+# The tests replace the table, so keep the one that ships.
+PINNED_DATA = run_buildifier.BUILDIFIER_DATA
+
+
+class ReleaseHandler(SimpleHTTPRequestHandler):
+  """Serves files by path and records the requested paths."""
+
+  def __init__(self, *args, requests, **kwargs):
+    self.requests = requests
+    super().__init__(*args, **kwargs)
+
+  def do_GET(self):
+    self.requests.append(self.path)
+    super().do_GET()
+
+  def log_message(self, format, *args):
+    pass
+
+
+class TestRunBuildifier(unittest.TestCase):
+  """Test cases for run-buildifier.py"""
+
+  def setUp(self):
+    """Serve a fake release binary through PRE_COMMIT_TOOL_MIRROR"""
+    self.tempdir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tempdir.cleanup)
+    self.root = Path(self.tempdir.name)
+
+    self.content = b'#!/bin/sh\ncat\n'
+    self.sha256 = hashlib.sha256(self.content).hexdigest()
+    asset_url = ('https://github.com/bazelbuild/buildtools/releases/'
+                 'download/v0.0.0/buildifier-test')
+    asset = self.root / 'www' / asset_url.split('://', 1)[1].split('/', 1)[1]
+    asset.parent.mkdir(parents=True)
+    asset.write_bytes(self.content)
+
+    self.requests = []
+    handler = functools.partial(
+        ReleaseHandler,
+        directory=str(self.root / 'www'),
+        requests=self.requests)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    self.addCleanup(server.server_close)
+    self.addCleanup(server.shutdown)
+
+    operation_system, arch = hook_util.current_platform()
+    self.data = {
+        'os': operation_system,
+        'arch': arch,
+        'url': asset_url,
+        'sha256': self.sha256,
+    }
+    bin_dir = self.root / 'bin'
+    bin_dir.mkdir()
+    for patcher in [
+        mock.patch.dict(
+            os.environ, {
+                'PRE_COMMIT_TOOL_MIRROR':
+                    f'http://127.0.0.1:{server.server_port}',
+                'PRE_COMMIT_TOOL_STORE':
+                    str(self.root / 'store'),
+            }),
+        mock.patch.object(run_buildifier, 'BUILDIFIER_DATA', [self.data]),
+        mock.patch.object(run_buildifier, 'BUILDIFIER', bin_dir / 'buildifier'),
+        mock.patch.object(run_buildifier, 'BUILDIFIER_VERSION_FILE',
+                          bin_dir / 'buildifier.version'),
+        mock.patch.object(run_buildifier, 'build_buildifier',
+                          mock.Mock(side_effect=AssertionError('built'))),
+    ]:
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def test_ensure_buildifier_prebuilt(self):
+    """Test that the pinned release binary is downloaded, not built"""
+    run_buildifier.ensure_buildifier()
+
+    self.assertEqual(len(self.requests), 1)
+    self.assertTrue(self.requests[0].endswith('/buildifier-test'))
+    self.assertEqual(run_buildifier.BUILDIFIER.read_bytes(), self.content)
+    self.assertTrue(run_buildifier.BUILDIFIER.stat().st_mode & stat.S_IXUSR)
+    self.assertEqual(run_buildifier.read_version_file(),
+                     (run_buildifier.BUILDIFIER_VERSION, self.sha256))
+
+    # Once installed, nothing is downloaded again.
+    run_buildifier.ensure_buildifier()
+    self.assertEqual(len(self.requests), 1)
+
+  def test_ensure_buildifier_checksum_mismatch(self):
+    """Test that a binary not matching the pin is not installed"""
+    self.data['sha256'] = '0' * 64
+    with self.assertRaisesRegex(Exception, 'sha256 mismatch'):
+      run_buildifier.ensure_buildifier()
+    self.assertFalse(run_buildifier.BUILDIFIER.exists())
+    self.assertEqual(run_buildifier.read_version_file(), (None, None))
+
+  def test_prebuilt_data(self):
+    """Test that each platform picks its own release binary"""
+    assets = {
+        ('linux', 'x86_64'): 'buildifier-linux-amd64',
+        ('linux', 'arm64'): 'buildifier-linux-arm64',
+        ('mac', 'x86_64'): 'buildifier-darwin-amd64',
+        ('mac', 'arm64'): 'buildifier-darwin-arm64',
+    }
+    table = [{
+        'os': operation_system,
+        'arch': arch,
+        'url': f'https://example.com/{asset}',
+        'sha256': hashlib.sha256(asset.encode()).hexdigest(),
+    } for (operation_system, arch), asset in assets.items()]
+
+    with mock.patch.object(run_buildifier, 'BUILDIFIER_DATA', table):
+      for platform, asset in assets.items():
+        with self.subTest(platform=platform), \
+            mock.patch.object(hook_util, 'current_platform',
+                              lambda: platform):
+          self.assertTrue(
+              run_buildifier.prebuilt_data()['url'].endswith(f'/{asset}'))
+      with mock.patch.object(hook_util, 'current_platform', lambda:
+                             ('win32', 'x86_64')):
+        self.assertIsNone(run_buildifier.prebuilt_data())
+
+  def test_pinned_release_binaries(self):
+    """Test that the pinned entries belong to BUILDIFIER_VERSION"""
+    platforms = set()
+    for data in PINNED_DATA:
+      self.assertRegex(data['sha256'], r'^[0-9a-f]{64}$')
+      self.assertIn(f'/download/{run_buildifier.BUILDIFIER_VERSION}/',
+                    data['url'])
+      platforms.add((data['os'], data['arch']))
+    self.assertEqual(len(platforms), len(PINNED_DATA))
+
+
+if __name__ == '__main__':
+  unittest.main()
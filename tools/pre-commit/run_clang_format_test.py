@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Unit tests for run-clang-format.py
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import hook_util
+
+run_clang_format = hook_util.load_wrapper('run-clang-format.py')
+
+# Stands in for clang-format: uppercases the lines selected with --lines.
+FAKE_CLANG_FORMAT = '''\
+#!{python}
+import sys
+ranges = [
+    tuple(map(int, arg.split('=', 1)[1].split(':')))
+    for arg in sys.argv[1:] if arg.startswith('--lines=')
+]
+for number, line in enumerate(sys.stdin.read().splitlines(True), 1):
+  if not ranges or any(first <= number <= last for first, last in ranges):
+    line = line.upper()
+  sys.stdout.write(line)
+'''
+
+
+class TestRunClangFormat(unittest.TestCase):
+  """Test cases for run-clang-format.py"""
+
+  def setUp(self):
+    """Set up a git repository with a committed file and a fake tool"""
+    self.tempdir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tempdir.cleanup)
+    self.root = Path(self.tempdir.name)
+    self.repo = self.root / 'repo'
+    self.repo.mkdir()
+
+    tool = self.root / 'clang-format'
+    tool.write_text(FAKE_CLANG_FORMAT.format(python=sys.executable))
+    tool.chmod(0o755)
+    for patcher in [
+        mock.patch.object(run_clang_format, 'ensure_clang_format',
+                          lambda: None),
+        mock.patch.object(run_clang_format, 'CLANG_FORMAT', tool),
+    ]:
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+    cwd = os.getcwd()
+    os.chdir(self.repo)
+    self.addCleanup(os.chdir, cwd)
+    self.git('init', '-q')
+    self.source = self.repo / 'a.cc'
+
+  def git(self, *args):
+    subprocess.run(
+        ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com'] +
+        list(args),
+        check=True)
+
+  def test_changed_lines_with_unstaged_changes(self):
+    """Test that ranges match the working tree, not the index"""
+    self.source.write_text('a\nb\nc\nd\n')
+    self.git('add', 'a.cc')
+    self.git('commit', '-q', '-m', 'initial')
+    self.source.write_text('a\nb\nc\nd2\n')
+    self.git('add', 'a.cc')
+    # Unstaged lines above the staged change shift its line number.
+    self.source.write_text('X1\nX2\nX3\na\nb\nc\nd2\n')
+
+    self.assertEqual(run_clang_format.main(['--changed-lines', 'a.cc']), 0)
+    self.assertEqual(self.source.read_text(), 'X1\nX2\nX3\na\nb\nc\nD2\n')
+
+  def test_changed_lines_unusual_file_names(self):
+    """Test names that git diff marks with a tab or quotes"""
+    names = ['x y.cc', 'q"t.cc', 'tab\tü.cc']
+    for name in names:
+      (self.repo / name).write_text('a\nb\n')
+    self.git('add', '--', *names)
+    self.git('commit', '-q', '-m', 'initial')
+    for name in names:
+      (self.repo / name).write_text('a\nb2\n')
+
+    self.assertEqual(run_clang_format.main(['--changed-lines'] + names), 0)
+    for name in names:
+      self.assertEqual((self.repo / name).read_text(), 'a\nB2\n', name)
+
+  def test_changed_lines_skips_unchanged_files(self):
+    """Test that unmodified files, and a repo without commits, work"""
+    self.source.write_text('a\nb\n')
+    other = self.repo / 'b.cc'
+    other.write_text('c\n')
+    self.git('add', 'a.cc', 'b.cc')
+
+    self.assertEqual(run_clang_format.main(['--changed-lines', 'a.cc']), 0)
+    self.assertEqual(self.source.read_text(), 'A\nB\n')
+
+    self.git('commit', '-q', '-a', '-m', 'initial')
+    with mock.patch.object(hook_util, 'format_files') as format_files:
+      self.assertEqual(
+          run_clang_format.main(['--changed-lines', 'a.cc', 'b.cc']), 0)
+    format_files.assert_not_called()
+
+
+if __name__ == '__main__':
+  unittest.main()
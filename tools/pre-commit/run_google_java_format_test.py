@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Unit tests for run-google-java-format.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import hook_util
+
+run_google_java_format = hook_util.load_wrapper('run-google-java-format.py')
+
+# Stands in for `java -jar google-java-format.jar`: lowercase files are
+# unformatted, and every invocation is logged.
+FAKE_JAVA = '''\
+#!{python}
+import json, sys
+args = sys.argv[3:]
+with open({log!r}, 'a') as log:
+  log.write(json.dumps(args) + '\\n')
+if args[-1] == '-':
+  sys.stdout.write(sys.stdin.read().upper())
+else:
+  assert args[0] == '--replace'
+  for path in args[1:]:
+    with open(path) as f:
+      text = f.read()
+    with open(path, 'w') as f:
+      f.write(text.upper())
+'''
+
+
+class TestRunGoogleJavaFormat(unittest.TestCase):
+  """Test cases for run-google-java-format.py"""
+
+  def setUp(self):
+    """Set up a fake java and files to format"""
+    self.tempdir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tempdir.cleanup)
+    self.root = Path(self.tempdir.name)
+
+    self.log = self.root / 'java.log'
+    java = self.root / 'java'
+    java.write_text(FAKE_JAVA.format(python=sys.executable, log=str(self.log)))
+    java.chmod(0o755)
+    for patcher in [
+        mock.patch.object(run_google_java_format, 'ensure_google_java_format',
+                          lambda: None),
+        mock.patch.object(run_google_java_format, 'java_path', lambda: java),
+    ]:
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+    self.clean = self.root / 'Clean.java'
+    self.dirty = self.root / 'Dirty.java'
+    self.clean.write_text('CLEAN\n')
+    self.dirty.write_text('dirty\n')
+    os.utime(self.clean, (0, 0))
+
+  def invocations(self):
+    return [json.loads(line) for line in self.log.read_text().splitlines()]
+
+  def test_formats_in_one_jvm(self):
+    """Test that one run formats copies and only changes are written"""
+    dirty_inode = self.dirty.stat().st_ino
+    self.assertEqual(
+        run_google_java_format.main([str(self.clean),
+                                     str(self.dirty)]), 0)
+
+    invocations = self.invocations()
+    self.assertEqual(len(invocations), 1)
+    self.assertEqual(invocations[0][0], '--replace')
+    self.assertEqual([os.path.basename(f) for f in invocations[0][1:]],
+                     ['Clean.java', 'Dirty.java'])
+    self.assertNotIn(str(self.dirty), invocations[0])
+    self.assertEqual(self.dirty.read_text(), 'DIRTY\n')
+    self.assertNotEqual(self.dirty.stat().st_ino, dirty_inode)
+    self.assertEqual(self.clean.stat().st_mtime, 0)
+
+  @mock.patch('sys.stdout', new_callable=StringIO)
+  def test_check(self, mock_stdout):
+    """Test that check mode prints a diff and writes nothing"""
+    self.assertEqual(
+        run_google_java_format.main(
+            ['--check', str(self.clean),
+             str(self.dirty)]), 1)
+
+    self.assertEqual(self.dirty.read_text(), 'dirty\n')
+    self.assertIn('-dirty\n+DIRTY\n', mock_stdout.getvalue())
+    self.assertEqual(len(self.invocations()), 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Unit tests for run-swift-format.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import hook_util
+
+run_swift_format = hook_util.load_wrapper('run-swift-format.py')
+
+
+class TestRunSwiftFormat(unittest.TestCase):
+  """Test cases for run-swift-format.py"""
+
+  def setUp(self):
+    """Point the caches at a scratch directory"""
+    self.tempdir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tempdir.cleanup)
+    self.root = Path(self.tempdir.name)
+    self.path_file = self.root / 'swift-format.path.json'
+    self.clean_cache = self.root / 'swift-format.clean.json'
+    for patcher in [
+        mock.patch.object(run_swift_format, 'SWIFT_FORMAT_PATH_FILE',
+                          self.path_file),
+        mock.patch.object(run_swift_format, 'CLEAN_FILES_CACHE',
+                          self.clean_cache),
+    ]:
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def make_executable(self, name):
+    path = self.root / name
+    path.write_text('#!/bin/sh\n')
+    path.chmod(0o755)
+    return str(path)
+
+  def test_clean_files(self):
+    """Test that entries follow file contents, config and tool"""
+    tool = [self.make_executable('swift-format')]
+    project = self.root / 'project'
+    project.mkdir()
+    source = project / 'a.swift'
+    source.write_text('let a = 1\n')
+    path = str(source)
+
+    clean_files = run_swift_format.CleanFiles(tool)
+    self.assertFalse(clean_files.is_clean(path))
+    clean_files.save([path])
+    self.assertTrue(run_swift_format.CleanFiles(tool).is_clean(path))
+
+    # A different swift-format starts from an empty cache.
+    other_tool = [self.make_executable('other-swift-format')]
+    self.assertFalse(run_swift_format.CleanFiles(other_tool).is_clean(path))
+
+    # So do changed contents, or a new configuration further up the tree.
+    source.write_text('let a  = 1\n')
+    self.assertFalse(run_swift_format.CleanFiles(tool).is_clean(path))
+    source.write_text('let a = 1\n')
+    self.assertTrue(run_swift_format.CleanFiles(tool).is_clean(path))
+    (self.root / '.swift-format').write_text('{}')
+    self.assertFalse(run_swift_format.CleanFiles(tool).is_clean(path))
+
+  def test_clean_files_save_merges(self):
+    """Test that saves from separate runs are merged"""
+    tool = [self.make_executable('swift-format')]
+    first = self.root / 'a.swift'
+    second = self.root / 'b.swift'
+    first.write_text('a\n')
+    second.write_text('b\n')
+
+    first_run = run_swift_format.CleanFiles(tool)
+    second_run = run_swift_format.CleanFiles(tool)
+    first_run.save([str(first)])
+    second_run.save([str(second)])
+
+    files = json.loads(self.clean_cache.read_text())['files']
+    self.assertEqual(set(files), {str(first), str(second)})
+
+  def test_swift_format_command_cache(self):
+    """Test that the executable is looked up once per swift driver"""
+    swift = self.make_executable('swift')
+    swift_format = self.make_executable('swift-format')
+
+    with mock.patch.object(run_swift_format.shutil, 'which',
+                           lambda _: swift), \
+        mock.patch.object(run_swift_format, 'find_swift_format',
+                          return_value=swift_format) as find:
+      self.assertEqual(run_swift_format.swift_format_command(), [swift_format])
+      self.assertEqual(run_swift_format.swift_format_command(), [swift_format])
+      self.assertEqual(find.call_count, 1)
+
+      # Selecting another toolchain changes the swift driver.
+      os.utime(swift, ns=(0, 0))
+      self.assertEqual(run_swift_format.swift_format_command(), [swift_format])
+      self.assertEqual(find.call_count, 2)
+
+  def test_swift_format_command_fallback(self):
+    """Test the fallback to `swift format` and the missing tool error"""
+    swift = self.make_executable('swift')
+    with mock.patch.object(
+        run_swift_format, 'find_swift_format', return_value=None):
+      with mock.patch.object(run_swift_format.shutil, 'which', lambda _: swift):
+        self.assertEqual(run_swift_format.swift_format_command(),
+                         [swift, 'format'])
+      self.assertFalse(self.path_file.exists())
+
+      with mock.patch.object(run_swift_format.shutil, 'which', lambda _: None):
+        with self.assertRaises(RuntimeError):
+          run_swift_format.swift_format_command()
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+
+__doc__ = """Export or import the pinned pre-commit tools as one archive.
+
+  export  makes sure every tool is installed and verified against the hash
+          pinned in its wrapper, then packs them into
+          pre-commit-tools-<os>-<arch>-<hash>.tar, where <hash> is taken from
+          the bundle manifest. The same tools always give the same name, so
+          it can be used as a cache key.
+  import  unpacks such an archive into the tool store in a single streaming
+          pass (the archive may be read from stdin), verifying every tool
+          and linking it into bin/, so that no hook needs network access,
+          git or go afterwards. A tool without a pinned hash, such as a
+          locally built buildifier, can only be checked against the
+          bundle's manifest, so it is not shared with other checkouts.
+
+Bundles hold binaries for the platform they were exported on. The wrappers
+are imported to read their pins, so `requests` must be installed.
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import shutil
+import sys
+import tarfile
+from pathlib import Path
+
+import hook_util
+from hook_util import CHUNK_SIZE
+
+BUNDLE_FORMAT = 1
+MANIFEST_NAME = 'manifest.json'
+
+
+def record_buildifier(module, sha256):
+  # Only this checkout uses the binary. Without a pinned hash it is not
+  # verified, so it is not offered to other checkouts through the shared
+  # refs/ entry that a local build writes.
+  module.write_version_file(sha256)
+
+
+# `version` identifies the pinned release; `sha256` is the pinned hash, or
+# None where the binary is built locally. Such a tool is then only checked
+# against the bundle's own manifest.
+TOOLS = {
+    'clang-format': {
+        'script': 'run-clang-format.py',
+        'ensure': lambda m: m.ensure_clang_format(),
+        'path': lambda m: m.CLANG_FORMAT,
+        'version': lambda m: m.clang_format_data()["object_name"],
+        'sha256': lambda m: m.clang_format_data()["sha256"],
+    },
+    'google-java-format': {
+        'script': 'run-google-java-format.py',
+        'ensure': lambda m: m.ensure_google_java_format(),
+        'path': lambda m: m.GOOGLE_JAVA_FORMAT,
+        'version': lambda m: m.GOOGLE_JAVA_FORMAT_VERSION,
+        'sha256': lambda m: m.GOOGLE_JAVA_FORMAT_SHA256,
+    },
+    'ktfmt': {
+        'script': 'run-ktfmt.py',
+        'ensure': lambda m: m.ensure_ktfmt(),
+        'path': lambda m: m.KTFMT,
+        'version': lambda m: m.KTFMT_VERSION,
+        'sha256': lambda m: m.KTFMT_SHA256,
+    },
+    'buildifier': {
+        'script': 'run-buildifier.py',
+        'ensure': lambda m: m.ensure_buildifier(),
+        'path': lambda m: m.BUILDIFIER,
+        'version': lambda m: m.BUILDIFIER_VERSION,
+        'sha256': lambda m: (m.prebuilt_data() or {}).get("sha256"),
+        'installed': record_buildifier,
+    },
+}
+
+
+def bundle_name(manifest_data):
+  operation_system, arch = hook_util.current_platform()
+  digest = hashlib.sha256(manifest_data).hexdigest()[:16]
+  return f'pre-commit-tools-{operation_system}-{arch}-{digest}.tar'
+
+
+def add_member(tar, name, size, mode, fileobj):
+  # Fixed metadata keeps the archive byte-for-byte reproducible.
+  info = tarfile.TarInfo(name)
+  info.size = size
+  info.mode = mode
+  tar.addfile(info, fileobj)
+
+
+def export_bundle(output_dir, names):
+  """Writes the bundle for the tools in `names` and returns its path."""
+  tools = []
+  for name in names:
+    tool = TOOLS[name]
+    module = hook_util.load_wrapper(tool['script'])
+    print(f'Installing {name}...', file=sys.stderr)
+    tool['ensure'](module)
+
+    path = tool['path'](module)
+    sha256 = tool['sha256'](module) or hook_util.sha256_file(path)
+    entry = hook_util.store_path(sha256)
+    if not hook_util.is_installed(entry, sha256):
+      raise RuntimeError(f'{name} in the tool store does not match {sha256}')
+    stat_info = entry.stat()
+    tools.append({
+        'name': name,
+        'version': tool['version'](module),
+        'sha256': sha256,
+        'size': stat_info.st_size,
+        'mode': stat_info.st_mode & 0o777,
+    })
+
+  operation_system, arch = hook_util.current_platform()
+  manifest = {
+      'format': BUNDLE_FORMAT,
+      'os': operation_system,
+      'arch': arch,
+      'tools': tools,
+  }
+  manifest_data = json.dumps(manifest, indent=2, sort_keys=True).encode()
+  bundle = Path(output_dir) / bundle_name(manifest_data)
+  if bundle.exists():
+    return bundle
+
+  with hook_util.temporary_sibling(bundle) as temp_file:
+    with tarfile.open(temp_file, 'w', format=tarfile.PAX_FORMAT) as tar:
+      # The manifest goes first so that import can check it before any tool.
+      add_member(tar, MANIFEST_NAME, len(manifest_data), 0o644,
+                 io.BytesIO(manifest_data))
+      for tool in tools:
+        with open(hook_util.store_path(tool['sha256']), 'rb') as f:
+          add_member(tar, f"sha256/{tool['sha256']}", tool['size'],
+                     tool['mode'], f)
+    temp_file.chmod(0o644)
+    temp_file.replace(bundle)
+  return bundle
+
+
+def check_manifest(manifest):
+  """Returns {sha256: (tool, module, entry)} for the tools in `manifest`."""
+  if manifest.get('format') != BUNDLE_FORMAT:
+    raise RuntimeError(f"Unsupported bundle format {manifest.get('format')}")
+
+  operation_system, arch = hook_util.current_platform()
+  if (manifest['os'], manifest['arch']) != (operation_system, arch):
+    raise RuntimeError(f"Bundle is for {manifest['os']} {manifest['arch']}, "
+                       f"not {operation_system} {arch}")
+
+  expected = {}
+  for entry in manifest['tools']:
+    name = entry['name']
+    if name not in TOOLS:
+      raise RuntimeError(f'Unknown tool {name} in bundle')
+    tool = TOOLS[name]
+    module = hook_util.load_wrapper(tool['script'])
+    version = tool['version'](module)
+    sha256 = tool['sha256'](module)
+    if entry['version'] != version or sha256 not in (None, entry['sha256']):
+      raise RuntimeError(f"Bundle has {name} {entry['version']}, "
+                         f"but {version} is pinned")
+    expected[entry['sha256']] = (tool, module, entry)
+  return expected
+
+
+def import_bundle(fileobj):
+  """Installs the tools from a bundle read from `fileobj`.
+
+  The archive is read strictly sequentially. Returns the installed names.
+  """
+  installed = []
+  with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+    manifest = None
+    expected = None
+    for member in tar:
+      if manifest is None:
+        if member.name != MANIFEST_NAME:
+          raise RuntimeError('Bundle does not start with a manifest')
+        manifest = json.load(tar.extractfile(member))
+        expected = check_manifest(manifest)
+        continue
+
+      sha256 = member.name.removeprefix('sha256/')
+      if sha256 not in expected:
+        raise RuntimeError(f'Unexpected bundle member {member.name}')
+      tool, module, entry = expected.pop(sha256)
+      data = tar.extractfile(member)
+
+      def fetch(f):
+        shutil.copyfileobj(data, f, CHUNK_SIZE)
+
+      # add_to_store verifies the size and hash before anything is renamed
+      # into place.
+      store_entry = hook_util.store_path(sha256)
+      with hook_util.file_lock(hook_util.lock_path_for(store_entry)):
+        hook_util.add_to_store(
+            fetch, sha256, size=entry['size'], mode=entry['mode'])
+        hook_util.link_into_place(store_entry, tool['path'](module))
+        hook_util.mark_used(store_entry)
+      if 'installed' in tool:
+        tool['installed'](module, sha256)
+      installed.append(entry['name'])
+
+  if manifest is None:
+    raise RuntimeError('Bundle is empty')
+  if expected:
+    missing = ', '.join(entry['name'] for _, _, entry in expected.values())
+    raise RuntimeError(f'Bundle is truncated, missing {missing}')
+  return installed
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(
+      description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  subparsers = parser.add_subparsers(dest='command', required=True)
+  export_parser = subparsers.add_parser(
+      'export', help='Write a bundle of the tools.')
+  export_parser.add_argument('--output-dir', type=Path, default=Path('.'))
+  export_parser.add_argument(
+      '--tools',
+      default=','.join(TOOLS),
+      help='Comma separated tools to include.')
+  import_parser = subparsers.add_parser(
+      'import', help='Install the tools of a bundle.')
+  import_parser.add_argument('bundle', help='Bundle path, or - for stdin.')
+  args = parser.parse_args(argv)
+
+  if args.command == 'export':
+    names = [name for name in args.tools.split(',') if name]
+    for name in names:
+      if name not in TOOLS:
+        parser.error(f'unknown tool {name}')
+    print(export_bundle(args.output_dir, names))
+  elif args.bundle == '-':
+    for name in import_bundle(sys.stdin.buffer):
+      print(f'Installed {name}')
+  else:
+    with open(args.bundle, 'rb') as f:
+      for name in import_bundle(f):
+        print(f'Installed {name}')
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Unit tests for tool_bundle.py
+"""
+
+import hashlib
+import io
+import os
+import sys
+import tarfile
+import tempfile
+import types
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import hook_util
+import tool_bundle
+
+run_buildifier = hook_util.load_wrapper('run-buildifier.py')
+
+
+class TestToolBundle(unittest.TestCase):
+  """Test cases for tool_bundle.py"""
+
+  def setUp(self):
+    """Set up a fake wrapper installing one pinned and one built tool"""
+    self.tempdir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tempdir.cleanup)
+    self.root = Path(self.tempdir.name)
+    self.use_store('store-a')
+
+    self.contents = {'pinned': b'pinned tool', 'built': b'built tool'}
+    self.sha256 = {
+        name: hashlib.sha256(content).hexdigest()
+        for name, content in self.contents.items()
+    }
+    self.recorded = []
+    self.module = types.SimpleNamespace(bin=self.root / 'bin')
+
+    def ensure(name):
+      hook_util.install_file(self.module.bin / name, self.sha256[name],
+                             lambda f: f.write(self.contents[name]))
+
+    tools = {
+        name: {
+            'script':
+                f'run-{name}.py',
+            'ensure':
+                lambda m, name=name: ensure(name),
+            'path':
+                lambda m, name=name: m.bin / name,
+            'version':
+                lambda m: '1.0',
+            'sha256':
+                lambda m, name=name: self.sha256[name]
+                if name == 'pinned' else None,
+        } for name in self.contents
+    }
+    tools['built']['installed'] = lambda m, sha256: self.recorded.append(sha256)
+    for patcher in [
+        mock.patch.object(tool_bundle, 'TOOLS', tools),
+        mock.patch.object(hook_util, 'load_wrapper', lambda _: self.module),
+    ]:
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def use_store(self, name):
+    patcher = mock.patch.dict(os.environ,
+                              {'PRE_COMMIT_TOOL_STORE': str(self.root / name)})
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def test_export_import_round_trip(self):
+    """Test that a bundle installs every tool into a fresh store and bin"""
+    bundle = tool_bundle.export_bundle(self.root, ['pinned', 'built'])
+    self.assertRegex(bundle.name, r'^pre-commit-tools-.*-[0-9a-f]{16}\.tar$')
+    with tarfile.open(bundle) as tar:
+      self.assertEqual(tar.getnames()[0], tool_bundle.MANIFEST_NAME)
+    # The name only depends on the manifest.
+    bundle.unlink()
+    self.assertEqual(
+        tool_bundle.export_bundle(self.root, ['pinned', 'built']), bundle)
+
+    self.use_store('store-b')
+    self.module.bin = self.root / 'other-checkout'
+    self.module.bin.mkdir()
+    with open(bundle, 'rb') as f:
+      installed = tool_bundle.import_bundle(f)
+
+    self.assertEqual(installed, ['pinned', 'built'])
+    for name, sha256 in self.sha256.items():
+      self.assertEqual((self.module.bin / name).read_bytes(),
+                       self.contents[name])
+      self.assertTrue(
+          hook_util.is_linked(self.module.bin / name,
+                              hook_util.store_path(sha256)))
+    self.assertEqual(self.recorded, [self.sha256['built']])
+
+  def test_import_rejects_tampered_tool(self):
+    """Test that a tool not matching the manifest is not installed"""
+    bundle = tool_bundle.export_bundle(self.root, ['pinned'])
+    data = bundle.read_bytes().replace(b'pinned tool', b'pwned! tool')
+
+    self.use_store('store-b')
+    with self.assertRaisesRegex(Exception, 'sha256 mismatch'):
+      tool_bundle.import_bundle(io.BytesIO(data))
+    self.assertFalse(hook_util.store_path(self.sha256['pinned']).exists())
+
+  def test_import_rejects_other_pin(self):
+    """Test that a bundle of a different pinned version is refused"""
+    bundle = tool_bundle.export_bundle(self.root, ['pinned'])
+    tool_bundle.TOOLS['pinned']['version'] = lambda m: '2.0'
+    with open(bundle, 'rb') as f:
+      with self.assertRaisesRegex(RuntimeError, '2.0 is pinned'):
+        tool_bundle.import_bundle(f)
+
+  def test_record_unpinned_buildifier(self):
+    """Test that an unverified buildifier stays private to the checkout"""
+    version_file = self.root / 'buildifier.version'
+    sha256 = self.sha256['built']
+    with mock.patch.object(run_buildifier, 'BUILDIFIER_DATA', []), \
+        mock.patch.object(run_buildifier, 'BUILDIFIER_VERSION_FILE',
+                          version_file):
+      tool_bundle.record_buildifier(run_buildifier, sha256)
+      self.assertEqual(run_buildifier.read_version_file(),
+                       (run_buildifier.BUILDIFIER_VERSION, sha256))
+      self.assertFalse(run_buildifier.built_ref().exists())
+
+
+if __name__ == '__main__':
+  unittest.main()